@@ -0,0 +1,5 @@
+"""
+Бенчмарки — замеры производительности сервисов.
+
+Запуск из корня проекта: python -m benchmarks.<имя_модуля>
+"""
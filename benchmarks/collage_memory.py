@@ -0,0 +1,95 @@
+"""
+Бенчмарк памяти: классическая и потоковая сборка коллажа.
+
+Каждый режим запускается в отдельном процессе, чтобы пиковый RSS
+(ru_maxrss) не смешивался между замерами.
+
+Запуск:
+    python -m benchmarks.collage_memory --count 6 --width 2560 --height 1440
+"""
+
+import argparse
+import io
+import multiprocessing
+import time
+
+from PIL import Image, ImageDraw
+
+from benchmarks.common import peak_rss_mb
+from services.image_processor import TradeHeader, render_collage
+from services.output_policy import OutputPolicy
+
+
+def _make_screenshot(width: int, height: int, seed: int) -> bytes:
+    """Синтетический «скриншот графика» в JPEG."""
+    img = Image.new("RGB", (width, height), (20, 22, 30))
+    draw = ImageDraw.Draw(img)
+
+    # Свечи — чтобы JPEG был похож на реальный график по размеру
+    step = max(4, width // 200)
+    price = height // 2
+    for x in range(0, width, step):
+        delta = ((x * 7919 + seed * 104729) % 41) - 20
+        top, bottom = sorted((price, price + delta * 3))
+        color = (38, 166, 154) if delta >= 0 else (239, 83, 80)
+        draw.rectangle([x, top, x + step - 2, bottom + 1], fill=color)
+        price = min(max(price + delta, 50), height - 50)
+
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def _run_mode(images: list[bytes], streaming: bool, target_width: int, results) -> None:
+    """Рендерит коллаж в текущем процессе и сообщает пиковую память."""
+    header = TradeHeader(asset="BTC/USDT", scenario="ЛП", date="03.10.2025")
+    policy = OutputPolicy(target_width=target_width)
+
+    # Прогрев: шрифты, кодеки, импорт модулей
+    render_collage(images[:1], header, policy, streaming=streaming)
+    baseline = peak_rss_mb()
+
+    started = time.perf_counter()
+    encoded = render_collage(images, header, policy, streaming=streaming)
+    elapsed = time.perf_counter() - started
+
+    results.put({
+        "mode": "streaming" if streaming else "classic",
+        "baseline_mb": baseline,
+        "peak_mb": peak_rss_mb(),
+        "seconds": elapsed,
+        "size": f"{encoded.width}x{encoded.height}",
+        "kb": len(encoded.data) / 1024,
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=6, help="Количество скриншотов")
+    parser.add_argument("--width", type=int, default=2560, help="Ширина скриншота")
+    parser.add_argument("--height", type=int, default=1440, help="Высота скриншота")
+    parser.add_argument("--target-width", type=int, default=1280, help="Ширина коллажа (0 — без уменьшения)")
+    args = parser.parse_args()
+
+    images = [_make_screenshot(args.width, args.height, i) for i in range(args.count)]
+    total_kb = sum(len(b) for b in images) / 1024
+    print(f"Вход: {args.count} x {args.width}x{args.height} JPEG, {total_kb:.0f} KB")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+
+    for streaming in (False, True):
+        process = ctx.Process(target=_run_mode, args=(images, streaming, args.target_width, results))
+        process.start()
+        result = results.get()
+        process.join()
+
+        print(
+            f"{result['mode']:>10}: пик RSS {result['peak_mb']:.1f} MB "
+            f"(+{result['peak_mb'] - result['baseline_mb']:.1f} MB на рендер), "
+            f"{result['seconds'] * 1000:.0f} мс, {result['size']}, {result['kb']:.0f} KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
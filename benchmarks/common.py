@@ -0,0 +1,13 @@
+"""
+Общие помощники бенчмарков.
+"""
+
+import resource
+import sys
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса, MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — килобайты, macOS — байты
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,114 @@
+"""
+Генератор аудио для корпуса benchmarks/corpus.
+
+Озвучивает эталонный текст каждой записи manifest.json офлайн-синтезатором
+речи (по умолчанию espeak-ng с русским голосом) и сохраняет результат в
+ogg/opus 16 кГц моно — как голосовые Telegram. Уже существующие файлы не
+перезаписываются (--force — перезаписать), поэтому записанные вручную
+заметки можно смешивать с синтетическими.
+
+Синтетическая речь чище живой: абсолютный WER на ней занижен, но
+сравнение настроек Whisper между собой остаётся осмысленным. Для замеров,
+близких к реальности, запишите заметки голосом по reference из манифеста
+(имена файлов — поле file) и положите их рядом с manifest.json.
+
+Запуск:
+    python -m benchmarks.make_corpus
+    python -m benchmarks.make_corpus --tts "RHVoice-test -p anna -o {output}" --stdin
+"""
+
+import argparse
+import json
+import shlex
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import av
+
+from benchmarks.stt_sweep import CORPUS_DIR
+from services.speech_to_text import SAMPLE_RATE
+
+DEFAULT_TTS = "espeak-ng -v ru -s 150 -w {output} {text}"
+
+
+def synthesize(command: str, text: str, output: Path, stdin: bool = False) -> None:
+    """
+    Озвучивает текст командой синтезатора.
+
+    Args:
+        command: Шаблон команды с {output} (WAV-файл) и {text} (если не stdin)
+        text: Текст для озвучки
+        output: Куда синтезатор должен записать WAV
+        stdin: Передать текст на стандартный вход вместо {text}
+
+    Raises:
+        RuntimeError: Синтезатор не найден или завершился с ошибкой
+    """
+    args = [part.format(output=output, text=text) for part in shlex.split(command)]
+    try:
+        subprocess.run(args, input=text if stdin else None, text=True, check=True, capture_output=True)
+    except FileNotFoundError as e:
+        raise RuntimeError(f"Синтезатор {args[0]} не найден (установите его или укажите --tts)") from e
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Синтезатор завершился с кодом {e.returncode}: {e.stderr.strip()[:500]}") from e
+
+
+def encode_voice(source: Path, target: Path) -> float:
+    """
+    Перекодирует аудио в ogg/opus 16 кГц моно.
+
+    Returns:
+        Длительность записи, секунды
+    """
+    samples = 0
+    with av.open(str(source)) as src, av.open(str(target), "w", format="ogg") as dst:
+        stream = dst.add_stream("libopus", rate=SAMPLE_RATE, layout="mono")
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+
+        for frame in src.decode(audio=0):
+            for chunk in resampler.resample(frame):
+                samples += chunk.samples
+                dst.mux(stream.encode(chunk))
+        for chunk in resampler.resample(None):
+            samples += chunk.samples
+            dst.mux(stream.encode(chunk))
+        dst.mux(stream.encode(None))
+
+    return samples / SAMPLE_RATE
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="Каталог с manifest.json")
+    parser.add_argument("--tts", default=DEFAULT_TTS, help="Команда синтезатора: {output} — WAV, {text} — текст")
+    parser.add_argument("--stdin", action="store_true", help="Передавать текст на стандартный вход")
+    parser.add_argument("--force", action="store_true", help="Перезаписать существующие файлы")
+    args = parser.parse_args(argv)
+
+    manifest = json.loads((args.corpus / "manifest.json").read_text(encoding="utf-8"))
+
+    created = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for clip in manifest["clips"]:
+            target = args.corpus / clip["file"]
+            if target.exists() and not args.force:
+                print(f"Пропуск: {target.name} уже есть")
+                continue
+
+            wav = Path(tmp) / "speech.wav"
+            try:
+                synthesize(args.tts, clip["reference"], wav, args.stdin)
+            except RuntimeError as e:
+                parser.exit(1, f"Ошибка: {e}\n")
+
+            seconds = encode_voice(wav, target)
+            created += 1
+            print(f"{target.name}: {seconds:.1f}с")
+
+    print(f"Готово: создано файлов {created} из {len(manifest['clips'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Бенчмарк распознавания: последовательный и батчевый режимы.
+
+Имитирует пиковую нагрузку — несколько голосовых приходят одновременно —
+и сравнивает пропускную способность в транскриптах на CPU-секунду.
+
+Запуск:
+    python -m benchmarks.stt_batching voice1.ogg voice2.ogg --copies 4
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from services.speech_to_text import (
+    SAMPLE_RATE,
+    WhisperConfig,
+    decode_audio,
+    preload_model,
+    transcribe_audio,
+    transcribe_batch,
+)
+
+
+def _measure(name: str, func) -> dict:
+    """Замеряет стену и процессорное время (всех потоков процесса)."""
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    texts = func()
+    return {
+        "name": name,
+        "texts": texts,
+        "wall": time.perf_counter() - wall_started,
+        "cpu": time.process_time() - cpu_started,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", nargs="+", type=Path, help="Аудиофайлы (ogg, mp3, wav...)")
+    parser.add_argument("--copies", type=int, default=2, help="Сколько раз повторить набор файлов")
+    parser.add_argument("--model", default=None, help="Размер модели (по умолчанию — из .env)")
+    parser.add_argument("--beam-size", type=int, default=None, help="Beam size (по умолчанию — из .env)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Окон Whisper в одном проходе")
+    args = parser.parse_args()
+
+    cfg = WhisperConfig.from_config()
+    if args.model or args.beam_size:
+        cfg = WhisperConfig(
+            model_size=args.model or cfg.model_size,
+            beam_size=args.beam_size or cfg.beam_size,
+            use_gpu=cfg.use_gpu,
+            compute_type=cfg.compute_type,
+            cpu_threads=cfg.cpu_threads,
+            num_workers=cfg.num_workers,
+        )
+
+    # Декодируем заранее — сравниваем только инференс
+    clips = [decode_audio(path) for path in args.audio] * args.copies
+    audio_seconds = sum(len(clip) for clip in clips) / SAMPLE_RATE
+    print(f"Корпус: {len(clips)} записей, {audio_seconds:.1f}с аудио, модель {cfg.model_size}, beam={cfg.beam_size}")
+
+    preload_model(cfg)
+
+    results = [
+        _measure("sequential", lambda: [transcribe_audio(clip, cfg) for clip in clips]),
+        _measure("batched", lambda: transcribe_batch(clips, cfg, args.batch_size)),
+    ]
+
+    for result in results:
+        print(
+            f"{result['name']:>10}: стена {result['wall']:.1f}с, CPU {result['cpu']:.1f}с, "
+            f"{len(clips) / result['cpu']:.2f} транскриптов/CPU-с, "
+            f"RTF {result['wall'] / audio_seconds:.3f}"
+        )
+
+    sequential, batched = results
+    mismatched = sum(a != b for a, b in zip(sequential["texts"], batched["texts"]))
+    print(f"Ускорение по CPU: x{sequential['cpu'] / batched['cpu']:.2f}, расхождений в тексте: {mismatched}/{len(clips)}")
+
+
+if __name__ == "__main__":
+    main()
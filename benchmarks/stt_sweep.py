@@ -0,0 +1,285 @@
+"""
+Бенчмарк настроек Whisper: скорость, память и точность.
+
+Перебирает сетку параметров WhisperConfig (модель, beam_size, compute_type,
+cpu_threads, VAD) на корпусе голосовых заметок трейдера и пишет JSON-отчёт:
+RTF, пиковый RSS, время холодной загрузки, WER и долю потерянных
+ключевых терминов (тикеры, ЛП/ЛПП/Пробой/Ретест, даты).
+
+Корпус — benchmarks/corpus/manifest.json: эталонный текст и ключевые
+термины (с допустимыми вариантами написания) для каждой записи. Аудио
+в репозитории нет: его синтезирует benchmarks.make_corpus (офлайн TTS)
+или записывают голосом по эталонному тексту и кладут рядом с манифестом;
+отсутствующие файлы пропускаются.
+
+Каждая конфигурация запускается в отдельном процессе, чтобы холодная
+загрузка и пиковый RSS не зависели от предыдущих замеров.
+
+Запуск:
+    python -m benchmarks.make_corpus
+    python -m benchmarks.stt_sweep --models small,medium --beams 1,5 \\
+        --compute-types int8,float32 --threads 0,4 --vad on,off --output stt_report.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import re
+import time
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from benchmarks.common import peak_rss_mb
+from services.speech_to_text import SAMPLE_RATE, WhisperConfig
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+
+def normalize_words(text: str) -> list[str]:
+    """Слова в нижнем регистре, без пунктуации, ё → е."""
+    text = text.lower().replace("ё", "е")
+    return re.sub(r"[^\w]+", " ", text).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """WER: расстояние Левенштейна по словам, делённое на длину эталона."""
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return float(bool(hyp))
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(
+                previous[j] + 1,                            # Удаление
+                current[j - 1] + 1,                         # Вставка
+                previous[j - 1] + (ref_word != hyp_word),   # Замена
+            )
+        previous = current
+
+    return previous[-1] / len(ref)
+
+
+def missed_keywords(keywords: list[list[str]], hypothesis: str) -> list[str]:
+    """
+    Ключевые термины, которых нет в распознанном тексте.
+
+    Термин засчитывается, если в тексте есть любой из его вариантов
+    (последовательность слов целиком).
+    """
+    hyp = normalize_words(hypothesis)
+    missed = []
+
+    for variants in keywords:
+        found = False
+        for variant in variants:
+            words = normalize_words(variant)
+            if any(hyp[i:i + len(words)] == words for i in range(len(hyp) - len(words) + 1)):
+                found = True
+                break
+        if not found:
+            missed.append(variants[0])
+
+    return missed
+
+
+def load_corpus(corpus_dir: Path) -> list[dict]:
+    """Записи манифеста, для которых есть аудиофайл."""
+    manifest = json.loads((corpus_dir / "manifest.json").read_text(encoding="utf-8"))
+
+    clips = []
+    for clip in manifest["clips"]:
+        path = corpus_dir / clip["file"]
+        if not path.exists():
+            print(f"Пропуск: нет файла {path}")
+            continue
+        clips.append({**clip, "path": str(path)})
+
+    return clips
+
+
+def _run_config(cfg: WhisperConfig, clips: list[dict], results) -> None:
+    """Замеряет одну конфигурацию в текущем (свежем) процессе."""
+    try:
+        results.put(measure_config(cfg, clips))
+    except Exception as e:
+        results.put({"config": asdict(cfg), "error": f"{type(e).__name__}: {e}"})
+
+
+def measure_config(cfg: WhisperConfig, clips: list[dict]) -> dict[str, Any]:
+    """Прогоняет корпус на конфигурации и считает метрики."""
+    # Импорт здесь — модель и её зависимости загружаются уже в дочернем процессе
+    from services.speech_to_text import decode_audio, preload_model, transcribe_audio
+
+    baseline = peak_rss_mb()
+
+    # Холодный старт: загрузка весов и прогрев — то, что ждёт первый запрос
+    started = time.perf_counter()
+    preload_model(cfg)
+    cold_load = time.perf_counter() - started
+
+    # Декодируем заранее — в RTF входит только распознавание
+    decoded = [decode_audio(clip["path"]) for clip in clips]
+
+    per_clip = []
+    total_keywords = total_missed = 0
+
+    for clip, samples in zip(clips, decoded):
+        started = time.perf_counter()
+        text = transcribe_audio(samples, cfg)
+        elapsed = time.perf_counter() - started
+
+        missed = missed_keywords(clip["keywords"], text)
+        total_keywords += len(clip["keywords"])
+        total_missed += len(missed)
+
+        per_clip.append({
+            "file": clip["file"],
+            "seconds": round(len(samples) / SAMPLE_RATE, 2),
+            "elapsed": round(elapsed, 3),
+            "wer": round(word_error_rate(clip["reference"], text), 4),
+            "missed_keywords": missed,
+            "text": text,
+        })
+
+    audio_seconds = sum(item["seconds"] for item in per_clip)
+    wall = sum(item["elapsed"] for item in per_clip)
+
+    return {
+        "config": asdict(cfg),
+        "cold_load_s": round(cold_load, 2),
+        "wall_s": round(wall, 2),
+        "rtf": round(wall / audio_seconds, 4) if audio_seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(baseline, 1),
+        "wer": round(sum(item["wer"] for item in per_clip) / len(per_clip), 4) if per_clip else None,
+        "keyword_error_rate": round(total_missed / total_keywords, 4) if total_keywords else None,
+        "clips": per_clip,
+    }
+
+
+def _run_isolated(ctx, cfg: WhisperConfig, clips: list[dict]) -> dict[str, Any]:
+    """Запускает замер в отдельном процессе и ждёт результат."""
+    results = ctx.Queue()
+    process = ctx.Process(target=_run_config, args=(cfg, clips, results))
+    process.start()
+
+    # Процесс может упасть (например, нехватка памяти) — не ждём вечно
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                result = {"config": asdict(cfg), "error": f"процесс завершился с кодом {process.exitcode}"}
+                break
+
+    process.join()
+    return result
+
+
+def _parse_grid(value: str, cast=str) -> list:
+    """Список значений сетки из строки через запятую."""
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def _parse_switch(value: str) -> bool:
+    """on/off → bool."""
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def build_grid(args: argparse.Namespace) -> list[WhisperConfig]:
+    """Декартово произведение параметров сетки."""
+    return [
+        WhisperConfig(
+            model_size=model_size,
+            beam_size=beam_size,
+            compute_type=compute_type or None,
+            cpu_threads=cpu_threads,
+            vad_filter=vad_filter,
+        )
+        for model_size, beam_size, compute_type, cpu_threads, vad_filter in itertools.product(
+            _parse_grid(args.models),
+            _parse_grid(args.beams, int),
+            _parse_grid(args.compute_types),
+            _parse_grid(args.threads, int),
+            _parse_grid(args.vad, _parse_switch),
+        )
+    ]
+
+
+def _print_summary(results: list[dict]) -> None:
+    """Таблица результатов, от быстрых к медленным."""
+    print(f"\n{'модель':>10} {'beam':>4} {'тип':>8} {'потоки':>6} {'vad':>3} | "
+          f"{'RTF':>6} {'загрузка':>8} {'RSS MB':>7} {'WER':>6} {'термины':>7}")
+
+    ok = sorted((r for r in results if "error" not in r), key=lambda r: r["rtf"] or 0)
+    for result in ok:
+        cfg = result["config"]
+        print(
+            f"{cfg['model_size']:>10} {cfg['beam_size']:>4} {cfg['compute_type'] or 'auto':>8} "
+            f"{cfg['cpu_threads']:>6} {'on' if cfg['vad_filter'] else 'off':>3} | "
+            f"{result['rtf']:>6.3f} {result['cold_load_s']:>7.1f}с {result['peak_rss_mb']:>7.0f} "
+            f"{result['wer']:>6.1%} {result['keyword_error_rate']:>7.1%}"
+        )
+
+    for result in results:
+        if "error" in result:
+            print(f"Ошибка {result['config']}: {result['error']}")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="Каталог с manifest.json и аудио")
+    parser.add_argument("--models", default="small,medium", help="Размеры моделей через запятую")
+    parser.add_argument("--beams", default="1,5", help="Значения beam_size")
+    parser.add_argument("--compute-types", default="int8", help="Типы вычислений (пусто — авто)")
+    parser.add_argument("--threads", default="0", help="Значения cpu_threads (0 — по умолчанию)")
+    parser.add_argument("--vad", default="on", help="VAD: on, off или on,off")
+    parser.add_argument("--output", type=Path, default=Path("stt_report.json"), help="Файл JSON-отчёта")
+    args = parser.parse_args(argv)
+
+    clips = load_corpus(args.corpus)
+    if not clips:
+        parser.error(
+            f"В {args.corpus} нет ни одного аудиофайла из манифеста: "
+            f"создайте их командой python -m benchmarks.make_corpus или запишите по reference"
+        )
+
+    grid = build_grid(args)
+    print(f"Корпус: {len(clips)} записей, конфигураций: {len(grid)}")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for index, cfg in enumerate(grid, start=1):
+        print(f"[{index}/{len(grid)}] {cfg}")
+        results.append(_run_isolated(ctx, cfg, clips))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "corpus": {
+            "dir": str(args.corpus),
+            "clips": len(clips),
+        },
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    _print_summary(results)
+    print(f"\nОтчёт: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
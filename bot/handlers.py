@@ -2,11 +2,13 @@
 Обработчики команд и сообщений бота.
 """
 
-import os
-import tempfile
-from pathlib import Path
+import asyncio
+import html
+import time
+from typing import Optional
 
 from aiogram import Router, F, Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, BufferedInputFile
 from aiogram.fsm.context import FSMContext
@@ -14,15 +16,30 @@ from aiogram.fsm.context import FSMContext
 from bot.keyboards import get_main_menu, get_done_keyboard, get_cancel_keyboard
 from bot.states import TradeStates
 from bot.texts import WELCOME, MAIN_MENU, HELP
-from services.image_processor import create_collage_with_header, TradeHeader
-from services.llm_processor import extract_trade_info
-from services.speech_to_text import transcribe_audio
+from services.blob_store import get_blob_store, BlobNotFoundError
+from services.google_drive import drive_enabled
+from services.google_sheets import JournalEntry, get_journal, journal_enabled
+from services.image_processor import TradeHeader
+from services.llm_processor import TradeInfo, extract_trade_info, extract_trades_bulk
+from services.prefetch import get_prefetcher
+from services.render_pool import get_renderer
+from services.stt_executor import (
+    stream_transcribe_async,
+    transcribe_long_async,
+    STTQueueFullError,
+    STTTimeoutError,
+)
+from services.trade_store import TradeRecord, TradeStats, get_trade_store
+from utils.config import config
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 router = Router()
 
+# Telegram Bot API отдаёт ботам файлы не больше 20 МБ
+TELEGRAM_DOWNLOAD_MAX_BYTES = 20 * 1024 * 1024
+
 
 async def show_main_menu(message: Message) -> None:
     """Показать главное меню."""
@@ -33,12 +50,59 @@ async def show_main_menu(message: Message) -> None:
     )
 
 
+async def _safe_edit(message: Message, text: str) -> None:
+    """Редактирует сообщение, игнорируя «не изменено» и ограничение частоты."""
+    try:
+        await message.edit_text(text)
+    except (TelegramBadRequest, TelegramRetryAfter) as e:
+        logger.debug(f"Промежуточная правка пропущена: {e}")
+
+
+async def save_trade(trade_id: str, trade_info: TradeInfo, collage: Optional[bytes] = None) -> None:
+    """
+    Сохраняет сделку: очередь записи в таблицу (Google не ждём) и
+    локальное хранилище (для /stats).
+    
+    Сначала очередь: пока сделки нет в таблице, её ID в очереди
+    защищает локальную запись от удаления при сверке.
+    
+    Коллаж сохраняется в хранилище blob-ов; в Drive его загрузит
+    фоновая отправка журнала.
+    """
+    if journal_enabled():
+        entry = JournalEntry(
+            trade_id=trade_id,
+            date=trade_info.date,
+            asset=trade_info.asset,
+            scenario=trade_info.scenario,
+            note=trade_info.raw_text,
+        )
+        try:
+            if collage is not None and drive_enabled():
+                entry.collage_key = await asyncio.to_thread(get_blob_store().put, collage)
+            await get_journal().enqueue(entry)
+        except Exception as e:
+            logger.error(f"Не удалось поставить сделку {trade_id} в очередь журнала: {e}")
+    
+    record = TradeRecord(trade_id, trade_info.date, trade_info.asset, trade_info.scenario)
+    try:
+        await asyncio.to_thread(get_trade_store().record, record)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить сделку {trade_id} в локальное хранилище: {e}")
+
+
+async def reset_state(message: Message, state: FSMContext) -> None:
+    """Сбрасывает состояние и отменяет фоновые загрузки пользователя."""
+    get_prefetcher().cancel(message.from_user.id)
+    await state.clear()
+
+
 # ==================== КОМАНДЫ ====================
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext) -> None:
     """Обработчик команды /start — приветствие и главное меню."""
-    await state.clear()
+    await reset_state(message, state)
     
     user = message.from_user
     logger.info(f"Пользователь {user.id} (@{user.username}) запустил бота")
@@ -65,6 +129,9 @@ async def cmd_new_trade(message: Message, state: FSMContext) -> None:
     """Начало записи новой сделки."""
     logger.info(f"Пользователь {message.from_user.id} начал новую сделку")
     
+    # Незавершённая предыдущая сделка больше не нужна
+    get_prefetcher().cancel(message.from_user.id)
+    
     await state.set_state(TradeStates.waiting_for_screenshots)
     await state.update_data(screenshots=[])
     
@@ -80,16 +147,45 @@ async def cmd_new_trade(message: Message, state: FSMContext) -> None:
 @router.message(Command("stats"))
 @router.message(F.text == "📊 Статистика")
 async def cmd_stats(message: Message) -> None:
-    """Показать статистику сделок."""
+    """Показать статистику сделок (из локальных агрегатов, без запросов к таблице)."""
     logger.info(f"Пользователь {message.from_user.id} запросил статистику")
     
-    # TODO: Реализовать получение статистики из Google Sheets
-    await message.answer(
-        "📊 <b>Статистика</b>\n\n"
-        "🚧 Функция в разработке...\n"
-        "Скоро здесь появится аналитика твоих сделок!",
-        parse_mode="HTML",
-    )
+    try:
+        stats = await asyncio.to_thread(get_trade_store().stats, config.STATS_TOP)
+    except Exception as e:
+        logger.error(f"Ошибка чтения статистики: {e}")
+        await message.answer("❌ Не удалось получить статистику. Попробуй позже.")
+        return
+    
+    await message.answer(_format_stats(stats), parse_mode="HTML")
+
+
+def _format_stats(stats: TradeStats) -> str:
+    """Текст статистики для /stats."""
+    if not stats.total:
+        return (
+            "📊 <b>Статистика</b>\n\n"
+            "Пока нет ни одной сделки.\n"
+            "Нажми «➕ Новая сделка», чтобы записать первую!"
+        )
+    
+    def section(title: str, items: list[tuple[str, int]]) -> str:
+        lines = "\n".join(f"· {html.escape(value)} — {count}" for value, count in items)
+        return f"\n\n<b>{title}</b>\n{lines}"
+    
+    # 2025-10 → 10.2025
+    months = [(f"{value[5:]}.{value[:4]}", count) for value, count in stats.by_month]
+    
+    text = f"📊 <b>Статистика</b>\n\nВсего сделок: <b>{stats.total}</b>"
+    for title, items in (
+        ("📈 Активы", stats.by_asset),
+        ("📋 Сценарии", stats.by_scenario),
+        ("📅 По месяцам", months),
+        ("🎯 Результаты", stats.by_result),
+    ):
+        if items:
+            text += section(title, items)
+    return text
 
 
 @router.message(Command("cancel"))
@@ -105,7 +201,7 @@ async def cmd_cancel(message: Message, state: FSMContext) -> None:
     
     logger.info(f"Пользователь {message.from_user.id} отменил действие (состояние: {current_state})")
     
-    await state.clear()
+    await reset_state(message, state)
     await message.answer("❌ Действие отменено.")
     await show_main_menu(message)
 
@@ -113,8 +209,8 @@ async def cmd_cancel(message: Message, state: FSMContext) -> None:
 # ==================== ШАГ 1: СКРИНШОТЫ ====================
 
 @router.message(TradeStates.waiting_for_screenshots, F.photo)
-async def handle_screenshot(message: Message, state: FSMContext) -> None:
-    """Обработка скриншотов — сохраняем file_id."""
+async def handle_screenshot(message: Message, state: FSMContext, bot: Bot) -> None:
+    """Обработка скриншотов — сохраняем file_id и сразу начинаем загрузку."""
     data = await state.get_data()
     screenshots = data.get("screenshots", [])
     
@@ -122,6 +218,7 @@ async def handle_screenshot(message: Message, state: FSMContext) -> None:
     screenshots.append(photo.file_id)
     
     await state.update_data(screenshots=screenshots)
+    get_prefetcher().start(bot, message.from_user.id, photo.file_id)
     
     logger.info(f"Пользователь {message.from_user.id} загрузил скриншот #{len(screenshots)}")
     
@@ -150,15 +247,11 @@ async def finish_screenshots(message: Message, state: FSMContext, bot: Bot) -> N
     processing_msg = await message.answer("⏳ Обрабатываю скриншоты...")
     
     try:
-        images_bytes: list[bytes] = []
-        for i, file_id in enumerate(screenshots):
-            file = await bot.get_file(file_id)
-            file_data = await bot.download_file(file.file_path)
-            images_bytes.append(file_data.read())
-            logger.info(f"Скачано изображение #{i+1}/{len(screenshots)}")
+        result = await get_prefetcher().collect(bot, message.from_user.id, screenshots)
         
-        # Сохраняем байты изображений в state
-        await state.update_data(images_bytes=images_bytes)
+        # Сохраняем изображения в хранилище, в state — только ключи
+        image_keys = await asyncio.to_thread(get_blob_store().put_many, result.data)
+        await state.update_data(image_keys=image_keys)
         
         await processing_msg.delete()
         
@@ -170,7 +263,7 @@ async def finish_screenshots(message: Message, state: FSMContext, bot: Bot) -> N
             "• <b>Актив</b> (например: BTC, ETH)\n"
             "• <b>Сценарий</b> (ЛП, Пробой, Ретест...)\n"
             "• <b>Дата</b> сделки\n\n"
-            "🎤 Отправь голосовое или напиши текстом.",
+            "🎤 Отправь голосовое, аудиофайл или кружок — или напиши текстом.",
             reply_markup=get_cancel_keyboard(),
             parse_mode="HTML",
         )
@@ -178,64 +271,118 @@ async def finish_screenshots(message: Message, state: FSMContext, bot: Bot) -> N
     except Exception as e:
         logger.error(f"Ошибка обработки скриншотов: {e}")
         await processing_msg.edit_text("❌ Ошибка обработки. Попробуй ещё раз.")
-        await state.clear()
+        await reset_state(message, state)
         await show_main_menu(message)
 
 
 # ==================== ШАГ 2: ИНФОРМАЦИЯ О СДЕЛКЕ ====================
 
 @router.message(TradeStates.waiting_for_trade_info, F.voice)
+@router.message(TradeStates.waiting_for_trade_info, F.audio)
+@router.message(TradeStates.waiting_for_trade_info, F.video_note)
+@router.message(TradeStates.waiting_for_trade_info, F.document.mime_type.startswith("audio/"))
 async def handle_voice_info(message: Message, state: FSMContext, bot: Bot) -> None:
-    """Обработка голосового сообщения с информацией о сделке."""
-    logger.info(f"Пользователь {message.from_user.id} отправил голосовое сообщение")
+    """Обработка голосового, аудиофайла или видеокружка с информацией о сделке."""
+    text = await _transcribe_media(message, bot)
+    
+    if text is not None:
+        # Обрабатываем текст через LLM
+        await _process_trade_info(message, state, text)
+
+
+@router.message(TradeStates.waiting_for_trade_info, F.text)
+async def handle_text_info(message: Message, state: FSMContext) -> None:
+    """Обработка текстового описания сделки."""
+    text = message.text
+    
+    # Игнорируем кнопку отмены (она обрабатывается отдельно)
+    if text == "❌ Отмена":
+        return
+    
+    logger.info(f"Пользователь {message.from_user.id} отправил текст: {text}")
+    
+    await _process_trade_info(message, state, text)
+
+
+async def _transcribe_media(message: Message, bot: Bot) -> Optional[str]:
+    """
+    Распознаёт голосовое, аудиофайл или видеокружок.
+    
+    Прогресс и ошибки показываются пользователю.
+    
+    Returns:
+        Распознанный текст или None, если распознать не удалось
+    """
+    media = message.voice or message.audio or message.video_note or message.document
+    duration = getattr(media, "duration", None)  # У документов длительности нет
+    logger.info(
+        f"Пользователь {message.from_user.id} отправил запись: "
+        f"{message.content_type}, {duration if duration is not None else '?'}с"
+    )
+    
+    if media.file_size and media.file_size > TELEGRAM_DOWNLOAD_MAX_BYTES:
+        await message.answer(
+            "❌ Файл слишком большой (Telegram отдаёт ботам файлы до 20 МБ).\n"
+            "Отправь запись покороче или напиши текстом."
+        )
+        return None
     
     processing_msg = await message.answer("🎤 Распознаю речь...")
     
     try:
-        # Скачиваем голосовое сообщение
-        voice = message.voice
-        file = await bot.get_file(voice.file_id)
+        # Скачиваем запись в память
+        file = await bot.get_file(media.file_id)
         file_data = await bot.download_file(file.file_path)
         
-        # Сохраняем во временный файл
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as tmp_file:
-            tmp_file.write(file_data.read())
-            tmp_path = tmp_file.name
-        
-        try:
-            # Транскрибируем
-            text = transcribe_audio(tmp_path)
-            logger.info(f"Распознанный текст: {text}")
+        if duration is not None and duration <= config.STT_LONG_AUDIO_SECONDS:
+            # Короткая запись: декодирование в памяти, без временных файлов,
+            # текст показывается по мере распознавания
+            parts: list[str] = []
+            last_edit = time.monotonic()
             
-            await processing_msg.edit_text(f"🎤 Распознано:\n<i>{text}</i>")
+            async for segment in stream_transcribe_async(file_data.getvalue()):
+                parts.append(segment)
+                
+                # Правки сообщения ограничены по частоте (лимиты Telegram)
+                if time.monotonic() - last_edit >= config.STT_PARTIAL_EDIT_INTERVAL:
+                    await _safe_edit(processing_msg, f"🎤 Распознаю речь...\n<i>{html.escape(' '.join(parts))}</i>")
+                    last_edit = time.monotonic()
             
-            # Обрабатываем текст через LLM
-            await _process_trade_info(message, state, text)
+            text = " ".join(parts).strip()
+        else:
+            # Длинная запись (или длительность неизвестна): параллельно по фрагментам
+            last_edit = time.monotonic()
             
-        finally:
-            # Удаляем временный файл
-            Path(tmp_path).unlink(missing_ok=True)
+            async def on_progress(done: int, total: int) -> None:
+                nonlocal last_edit
+                if total > 1 and time.monotonic() - last_edit >= config.STT_PARTIAL_EDIT_INTERVAL:
+                    await _safe_edit(processing_msg, f"🎤 Распознаю запись... {done}/{total}")
+                    last_edit = time.monotonic()
+            
+            text = await transcribe_long_async(file_data.getvalue(), on_progress=on_progress)
+        
+        logger.info(f"Распознанный текст: {text}")
+        
+        await processing_msg.edit_text(f"🎤 Распознано:\n<i>{html.escape(text)}</i>")
+        return text
         
+    except STTQueueFullError:
+        await processing_msg.edit_text(
+            "⏳ Сейчас распознаётся слишком много голосовых.\n"
+            "Попробуй через минуту или напиши текстом."
+        )
+    except STTTimeoutError:
+        await processing_msg.edit_text(
+            "❌ Распознавание заняло слишком много времени.\n"
+            "Попробуй записать покороче или напиши текстом."
+        )
     except Exception as e:
         logger.error(f"Ошибка обработки голосового: {e}")
         await processing_msg.edit_text(
             "❌ Не удалось распознать речь.\n"
             "Попробуй ещё раз или напиши текстом."
         )
-
-
-@router.message(TradeStates.waiting_for_trade_info, F.text)
-async def handle_text_info(message: Message, state: FSMContext) -> None:
-    """Обработка текстового описания сделки."""
-    text = message.text
-    
-    # Игнорируем кнопку отмены (она обрабатывается отдельно)
-    if text == "❌ Отмена":
-        return
-    
-    logger.info(f"Пользователь {message.from_user.id} отправил текст: {text}")
-    
-    await _process_trade_info(message, state, text)
+    return None
 
 
 async def _process_trade_info(message: Message, state: FSMContext, text: str) -> None:
@@ -244,7 +391,7 @@ async def _process_trade_info(message: Message, state: FSMContext, text: str) ->
     
     try:
         # Извлекаем информацию через LLM
-        trade_info = extract_trade_info(text)
+        trade_info = await extract_trade_info(text)
         
         if not trade_info:
             await processing_msg.edit_text(
@@ -257,11 +404,17 @@ async def _process_trade_info(message: Message, state: FSMContext, text: str) ->
         
         # Получаем сохранённые изображения
         data = await state.get_data()
-        images_bytes = data.get("images_bytes", [])
+        image_keys = data.get("image_keys", [])
+        
+        try:
+            images_bytes = await asyncio.to_thread(get_blob_store().get_many, image_keys)
+        except BlobNotFoundError:
+            logger.warning(f"Изображения пользователя {message.from_user.id} удалены из хранилища")
+            images_bytes = []
         
         if not images_bytes:
             await processing_msg.edit_text("❌ Изображения не найдены. Начни сначала.")
-            await state.clear()
+            await reset_state(message, state)
             await show_main_menu(message)
             return
         
@@ -274,31 +427,131 @@ async def _process_trade_info(message: Message, state: FSMContext, text: str) ->
             date=trade_info.date
         )
         
-        collage_bytes = create_collage_with_header(images_bytes, header)
+        collage = await get_renderer().render(images_bytes, header)
         
         # Отправляем коллаж
         collage_file = BufferedInputFile(
-            file=collage_bytes,
-            filename="trade_collage.jpg"
+            file=collage.data,
+            filename=collage.filename
         )
-        
-        await message.answer_photo(
-            photo=collage_file,
-            caption=(
-                f"📊 <b>Сделка готова!</b>\n\n"
-                f"📈 Актив: <b>{trade_info.asset}</b>\n"
-                f"📋 Сценарий: <b>{trade_info.scenario}</b>\n"
-                f"📅 Дата: <b>{trade_info.date}</b>"
-            ),
-            parse_mode="HTML"
+        caption = (
+            f"📊 <b>Сделка готова!</b>\n\n"
+            f"📈 Актив: <b>{trade_info.asset}</b>\n"
+            f"📋 Сценарий: <b>{trade_info.scenario}</b>\n"
+            f"📅 Дата: <b>{trade_info.date}</b>"
         )
         
+        if collage.as_document:
+            # Не помещается в ограничения фото (или нужен без потерь)
+            await message.answer_document(
+                document=collage_file,
+                caption=caption,
+                parse_mode="HTML"
+            )
+        else:
+            await message.answer_photo(
+                photo=collage_file,
+                caption=caption,
+                parse_mode="HTML"
+            )
+        
         await processing_msg.delete()
         
+        # ID сделки — по сообщению с описанием: повторная доставка апдейта не задвоит строку
+        await save_trade(f"{message.chat.id}-{message.message_id}", trade_info, collage.data)
+        
         # Завершаем
-        await state.clear()
+        await reset_state(message, state)
         await show_main_menu(message)
         
     except Exception as e:
         logger.error(f"Ошибка обработки информации: {e}")
         await processing_msg.edit_text("❌ Ошибка обработки. Попробуй ещё раз.")
+
+
+# ==================== ПАКЕТНЫЙ ВВОД ====================
+
+@router.message(Command("bulk"))
+async def cmd_bulk(message: Message, state: FSMContext) -> None:
+    """Пакетный ввод: несколько сделок одним сообщением."""
+    logger.info(f"Пользователь {message.from_user.id} начал пакетный ввод")
+    
+    # Незавершённая сделка больше не нужна
+    get_prefetcher().cancel(message.from_user.id)
+    
+    await state.set_state(TradeStates.waiting_for_bulk)
+    
+    await message.answer(
+        "📥 <b>Несколько сделок</b>\n\n"
+        "Опиши сделки одним сообщением — каждую с новой строки или списком:\n"
+        "<i>1. BTC ЛП вчера\n2. ETH пробой 3 октября</i>\n\n"
+        "Можно надиктовать голосом: «первая сделка…, вторая сделка…».\n"
+        f"До {config.BULK_MAX_TRADES} сделок за раз.",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML",
+    )
+
+
+@router.message(TradeStates.waiting_for_bulk, F.voice)
+@router.message(TradeStates.waiting_for_bulk, F.audio)
+@router.message(TradeStates.waiting_for_bulk, F.video_note)
+@router.message(TradeStates.waiting_for_bulk, F.document.mime_type.startswith("audio/"))
+async def handle_bulk_voice(message: Message, state: FSMContext, bot: Bot) -> None:
+    """Пакет сделок голосом."""
+    text = await _transcribe_media(message, bot)
+    
+    if text is not None:
+        await _process_bulk(message, state, text)
+
+
+@router.message(TradeStates.waiting_for_bulk, F.text)
+async def handle_bulk_text(message: Message, state: FSMContext) -> None:
+    """Пакет сделок текстом."""
+    text = message.text
+    
+    # Игнорируем кнопку отмены (она обрабатывается отдельно)
+    if text == "❌ Отмена":
+        return
+    
+    logger.info(f"Пользователь {message.from_user.id} отправил пакет: {text[:200]}")
+    
+    await _process_bulk(message, state, text)
+
+
+async def _process_bulk(message: Message, state: FSMContext, text: str) -> None:
+    """Извлекает сделки из пакета и показывает сводку."""
+    processing_msg = await message.answer("🤖 Разбираю сделки...")
+    
+    try:
+        result = await extract_trades_bulk(text)
+    except Exception as e:
+        logger.error(f"Ошибка пакетной обработки: {e}")
+        await processing_msg.edit_text("❌ Ошибка обработки. Попробуй ещё раз.")
+        return
+    
+    if not result.segments:
+        await processing_msg.edit_text("🤷 Не нашёл описаний сделок. Попробуй ещё раз.")
+        return
+    
+    lines = []
+    for number, (segment, trade) in enumerate(zip(result.segments, result.trades), start=1):
+        if trade is None:
+            lines.append(f"{number}. ❌ <i>{html.escape(segment[:80])}</i>")
+        else:
+            lines.append(
+                f"{number}. <b>{html.escape(trade.asset)}</b> · "
+                f"{html.escape(trade.scenario)} · {html.escape(trade.date)}"
+            )
+    
+    summary = f"📥 <b>Распознано сделок: {result.extracted} из {len(result.segments)}</b>\n\n" + "\n".join(lines)
+    if result.extracted < len(result.segments):
+        summary += "\n\n❌ — не удалось разобрать, отправь эти сделки через «➕ Новая сделка»."
+    
+    await processing_msg.edit_text(summary, parse_mode="HTML")
+    
+    for number, trade in enumerate(result.trades, start=1):
+        if trade is not None:
+            await save_trade(f"{message.chat.id}-{message.message_id}-{number}", trade)
+    
+    await reset_state(message, state)
+    await show_main_menu(message)
@@ -16,3 +16,6 @@ class TradeStates(StatesGroup):
     
     # Шаг 3: Подтверждение данных
     waiting_for_confirmation = State()
+    
+    # Пакетный ввод: описания нескольких сделок одним сообщением
+    waiting_for_bulk = State()
@@ -20,7 +20,7 @@ WELCOME = (
     "Я помогу тебе вести дневник трейдера:\n"
     "\n"
     "📸  Принимаю скриншоты сделок\n"
-    "🎤  Понимаю голосовые сообщения\n"
+    "🎤  Понимаю голосовые, аудиозаписи и кружки\n"
     "📊  Записываю всё в Google-таблицу\n"
     "\n"
     "Выбери действие в меню 👇"
@@ -40,6 +40,7 @@ HELP = (
     "<b>Команды:</b>\n"
     "/start — главное меню\n"
     "/new — новая сделка\n"
+    "/bulk — несколько сделок сразу\n"
     "/stats — статистика\n"
     "/cancel — отмена\n"
     "/help — справка"
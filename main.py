@@ -13,6 +13,22 @@ from aiogram.enums import ParseMode
 from utils.config import config
 from bot.handlers import router
 from bot.middlewares import AccessMiddleware
+from services.blob_store import run_blob_gc
+from services.google_api import close_google_session
+from services.google_drive import close_drive_uploader
+from services.google_sheets import (
+    close_journal,
+    journal_enabled,
+    load_journal_trades,
+    pending_collage_keys,
+    pending_journal_ids,
+    run_journal_flusher,
+)
+from services.llm_cache import close_llm_cache
+from services.llm_client import close_llm_client
+from services.render_pool import shutdown_renderer
+from services.stt_executor import shutdown_stt_executor, warm_up_stt
+from services.trade_store import close_trade_store, run_reconciliation
 from utils.logger import get_logger
 
 # Инициализируем логгер
@@ -42,6 +58,19 @@ async def main() -> None:
     # Подключаем роутеры (обработчики)
     dp.include_router(router)
     
+    # Фоновые задачи: очистка устаревших черновиков, запись журнала,
+    # сверка статистики с таблицей, прогрев Whisper
+    background_tasks = [
+        asyncio.create_task(run_blob_gc(config.BLOB_GC_INTERVAL, pending_collage_keys)),
+        asyncio.create_task(run_journal_flusher()),
+    ]
+    if journal_enabled() and config.TRADE_RECONCILE_HOURS > 0:
+        background_tasks.append(asyncio.create_task(run_reconciliation(
+            config.TRADE_RECONCILE_HOURS * 3600, load_journal_trades, pending_journal_ids
+        )))
+    if config.WHISPER_PRELOAD:
+        background_tasks.append(asyncio.create_task(warm_up_stt()))
+    
     # Запуск
     logger.info("Бот запущен...")
     
@@ -51,6 +80,18 @@ async def main() -> None:
         await dp.start_polling(bot)
     finally:
         logger.info("Бот остановлен...")
+        for task in background_tasks:
+            task.cancel()
+        # Дожидаемся отмены, чтобы задачи не обращались к уже закрытым хранилищам
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        shutdown_stt_executor()
+        shutdown_renderer()
+        await close_llm_client()
+        close_llm_cache()
+        await close_google_session()
+        close_journal()
+        close_drive_uploader()
+        close_trade_store()
         await bot.session.close()
 
 
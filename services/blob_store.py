@@ -0,0 +1,243 @@
+"""
+Контентно-адресуемое хранилище бинарных данных (скриншотов).
+
+Файлы лежат на диске под ключом SHA-256 от содержимого и читаются через mmap.
+Поверх диска — необязательный LRU-кэш в памяти с ограничением по байтам.
+В FSM хранятся только ключи, а устаревшие файлы удаляются по TTL (кроме
+закреплённых — например, коллажей строк журнала, ждущих отправки).
+"""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobNotFoundError(KeyError):
+    """Данные по ключу не найдены (удалены сборщиком или не сохранялись)."""
+
+
+class BlobStore:
+    """
+    Хранилище blob-ов на диске с LRU-кэшем в памяти.
+
+    Потокобезопасно: методы можно вызывать из asyncio.to_thread.
+    """
+
+    def __init__(self, root: Path, cache_bytes: int = 64 * 1024 * 1024, ttl: float = 24 * 3600):
+        self.root = Path(root)
+        self.cache_bytes = max(0, cache_bytes)
+        self.ttl = ttl
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+        # Продление TTL в put и проверка/удаление в gc не должны перемежаться
+        self._disk_lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        """Путь к файлу по ключу (с проверкой формата ключа)."""
+        if not _KEY_RE.match(key):
+            raise BlobNotFoundError(key)
+        return self.root / key[:2] / key
+
+    def put(self, data: bytes) -> str:
+        """
+        Сохраняет данные и возвращает их ключ (SHA-256).
+
+        Повторное сохранение того же содержимого только продлевает его TTL.
+        """
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+
+        with self._disk_lock:
+            try:
+                os.utime(path)
+                exists = True
+            except FileNotFoundError:
+                exists = False
+
+        if not exists:
+            path.parent.mkdir(exist_ok=True)
+            # Пишем во временный файл и атомарно переименовываем
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+
+        self._cache_put(key, data)
+        return key
+
+    def put_many(self, items: list[bytes]) -> list[str]:
+        """Сохраняет несколько blob-ов, возвращает ключи в том же порядке."""
+        return [self.put(data) for data in items]
+
+    def get(self, key: str) -> bytes:
+        """
+        Читает данные по ключу.
+
+        Raises:
+            BlobNotFoundError: Ключ отсутствует в хранилище
+        """
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+
+        path = self._path(key)
+
+        if data is not None:
+            # Продлеваем TTL, даже если данные взяты из кэша
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return data
+
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    data = b""
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        data = mm[:]
+            os.utime(path)
+        except FileNotFoundError:
+            raise BlobNotFoundError(key) from None
+
+        self._cache_put(key, data)
+        return data
+
+    def get_many(self, keys: list[str]) -> list[bytes]:
+        """Читает несколько blob-ов в порядке ключей."""
+        return [self.get(key) for key in keys]
+
+    def delete(self, key: str) -> None:
+        """Удаляет blob с диска и из кэша."""
+        self._cache_drop(key)
+        self._path(key).unlink(missing_ok=True)
+
+    def gc(self, keep: set[str] = frozenset()) -> int:
+        """
+        Удаляет blob-ы, к которым не обращались дольше TTL.
+
+        Args:
+            keep: Ключи, которые нельзя удалять (ещё нужны, например журналу)
+
+        Returns:
+            Количество удалённых файлов
+        """
+        deadline = time.time() - self.ttl
+        removed = 0
+
+        for path in self.root.glob("*/*"):
+            if path.name in keep:
+                continue
+            try:
+                with self._disk_lock:
+                    if path.stat().st_mtime >= deadline:
+                        continue
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+
+            self._cache_drop(path.name)
+            removed += 1
+
+        if removed:
+            logger.info(f"Очистка хранилища: удалено {removed} устаревших файлов")
+
+        return removed
+
+    @property
+    def cache_size(self) -> int:
+        """Объём данных в кэше памяти, байт."""
+        return self._cache_size
+
+    def _cache_put(self, key: str, data: bytes) -> None:
+        """Добавляет данные в LRU-кэш, вытесняя старые записи сверх бюджета."""
+        if len(data) > self.cache_bytes:
+            return
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return
+
+            self._cache[key] = data
+            self._cache_size += len(data)
+
+            while self._cache_size > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+    def _cache_drop(self, key: str) -> None:
+        """Удаляет запись из кэша."""
+        with self._lock:
+            data = self._cache.pop(key, None)
+            if data is not None:
+                self._cache_size -= len(data)
+
+
+# Экземпляр хранилища (создаётся при первом обращении)
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Получает общее хранилище (создаёт по настройкам из config)."""
+    global _store
+
+    if _store is None:
+        _store = BlobStore(
+            root=config.BLOB_STORE_DIR,
+            cache_bytes=config.BLOB_CACHE_MB * 1024 * 1024,
+            ttl=config.BLOB_TTL_HOURS * 3600,
+        )
+        logger.info(
+            f"Хранилище blob-ов: {_store.root}, кэш={config.BLOB_CACHE_MB} MB, "
+            f"TTL={config.BLOB_TTL_HOURS} ч"
+        )
+    return _store
+
+
+async def run_blob_gc(
+    interval: float,
+    pinned: Optional[Callable[[], Awaitable[set[str]]]] = None,
+) -> None:
+    """
+    Фоновая задача: периодически удаляет устаревшие blob-ы.
+
+    Args:
+        interval: Период очистки, секунды
+        pinned: Ключи, которые ещё нужны (коллажи строк журнала в очереди)
+    """
+    store = get_blob_store()
+
+    while True:
+        try:
+            keep = await pinned() if pinned is not None else set()
+            await asyncio.to_thread(store.gc, keep)
+        except Exception as e:
+            logger.error(f"Ошибка очистки хранилища: {e}")
+        await asyncio.sleep(interval)
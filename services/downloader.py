@@ -0,0 +1,105 @@
+"""
+Загрузка файлов из Telegram.
+
+Скачивает файл по file_id и повторяет неудачные загрузки. Параллельность
+и ограничение одновременных загрузок — в services.prefetch.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Ошибки, после которых имеет смысл повторить загрузку
+RETRYABLE_ERRORS = (
+    TelegramNetworkError,
+    TelegramServerError,
+    TelegramRetryAfter,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+
+@dataclass
+class FileDownload:
+    """Результат загрузки одного файла."""
+    data: bytes
+    latency: float      # Время загрузки с учётом повторов, секунды
+    attempts: int       # Количество попыток
+
+
+@dataclass
+class DownloadResult:
+    """Результат загрузки нескольких файлов (в исходном порядке)."""
+    files: list[FileDownload]
+    total_latency: float
+
+    @property
+    def data(self) -> list[bytes]:
+        """Содержимое файлов в исходном порядке."""
+        return [f.data for f in self.files]
+
+    @property
+    def latencies(self) -> list[float]:
+        """Время загрузки каждого файла."""
+        return [f.latency for f in self.files]
+
+
+def _is_client_error(error: Exception) -> bool:
+    """Ошибка 4xx при скачивании — повтор не поможет."""
+    return (
+        isinstance(error, aiohttp.ClientResponseError)
+        and 400 <= error.status < 500
+        and error.status != 429
+    )
+
+
+async def download_file(
+    bot: Bot,
+    file_id: str,
+    retries: int = 2,
+    retry_delay: float = 0.5,
+) -> FileDownload:
+    """
+    Скачивает один файл по file_id с повторами при сетевых ошибках.
+
+    Args:
+        bot: Экземпляр бота
+        file_id: Telegram file_id
+        retries: Количество повторов после первой неудачной попытки
+        retry_delay: Базовая задержка между повторами (удваивается)
+
+    Returns:
+        FileDownload с содержимым файла и временем загрузки
+    """
+    started = time.perf_counter()
+    attempt = 0
+
+    while True:
+        attempt += 1
+        try:
+            file = await bot.get_file(file_id)
+            file_data = await bot.download_file(file.file_path)
+            return FileDownload(
+                data=file_data.read(),
+                latency=time.perf_counter() - started,
+                attempts=attempt,
+            )
+        except RETRYABLE_ERRORS as e:
+            if attempt > retries or _is_client_error(e):
+                raise
+
+            if isinstance(e, TelegramRetryAfter):
+                delay = e.retry_after
+            else:
+                delay = retry_delay * 2 ** (attempt - 1)
+
+            logger.warning(f"Ошибка загрузки {file_id} (попытка {attempt}): {e}. Повтор через {delay:.1f}с")
+            await asyncio.sleep(delay)
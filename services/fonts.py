@@ -0,0 +1,136 @@
+"""
+Реестр шрифтов для рендеринга коллажей.
+
+Путь к шрифту определяется один раз (при первом обращении или при старте
+воркера), а объекты FreeTypeFont кэшируются по (путь, размер).
+"""
+
+import threading
+from pathlib import Path
+from typing import Optional
+
+from PIL import ImageFont
+
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Каталоги со шрифтами по умолчанию (Windows, Linux, macOS)
+DEFAULT_FONT_DIRS = [
+    "C:/Windows/Fonts",
+    "/usr/share/fonts",
+    "/usr/local/share/fonts",
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+]
+
+# Предпочтительные шрифты в порядке приоритета
+PREFERRED_FONTS = [
+    "arial.ttf",
+    "segoeui.ttf",
+    "tahoma.ttf",
+    "DejaVuSans.ttf",
+    "LiberationSans-Regular.ttf",
+    "NotoSans-Regular.ttf",
+    "Helvetica.ttc",
+]
+
+FONT_EXTENSIONS = (".ttf", ".ttc", ".otf")
+
+# Символ для проверки поддержки кириллицы
+_CYRILLIC_PROBE = "Ж"
+# Символ из приватной области — заведомо отсутствует, рисуется как «тофу»
+_MISSING_PROBE = "\U000F0000"
+
+
+def _supports_cyrillic(font: ImageFont.FreeTypeFont) -> bool:
+    """Проверяет, что шрифт рисует кириллицу, а не пустой глиф."""
+    try:
+        glyph = font.getmask(_CYRILLIC_PROBE)
+        missing = font.getmask(_MISSING_PROBE)
+    except Exception:
+        return False
+
+    if glyph.getbbox() is None:
+        return False
+    return glyph.size != missing.size or bytes(glyph) != bytes(missing)
+
+
+class FontRegistry:
+    """
+    Реестр шрифтов.
+
+    Сначала ищет предпочтительные шрифты в заданных каталогах, затем — любой
+    шрифт с кириллицей. Если ничего не найдено, используется встроенный шрифт
+    Pillow (без кириллицы).
+    """
+
+    def __init__(self, font_dirs: list[str], preferred: list[str] = PREFERRED_FONTS):
+        self.font_dirs = [Path(d) for d in font_dirs]
+        self.preferred = preferred
+
+        self.path: Optional[str] = self._resolve()
+        self._fonts: dict[tuple[Optional[str], int], ImageFont.FreeTypeFont] = {}
+        self._lock = threading.Lock()
+
+        if self.path:
+            logger.info(f"Шрифт для коллажей: {self.path}")
+        else:
+            logger.warning("Шрифт с кириллицей не найден, используется встроенный шрифт Pillow")
+
+    def _resolve(self) -> Optional[str]:
+        """Находит путь к шрифту с поддержкой кириллицы."""
+        existing_dirs = [d for d in self.font_dirs if d.is_dir()]
+
+        # 1. Предпочтительные шрифты: сначала прямо в каталоге, затем во вложенных
+        for name in self.preferred:
+            for font_dir in existing_dirs:
+                candidates = [font_dir / name, *font_dir.rglob(name)]
+                for path in candidates:
+                    if path.is_file() and self._is_usable(path):
+                        return str(path)
+
+        # 2. Любой шрифт с кириллицей
+        for font_dir in existing_dirs:
+            for path in sorted(font_dir.rglob("*")):
+                if path.suffix.lower() in FONT_EXTENSIONS and self._is_usable(path):
+                    return str(path)
+
+        return None
+
+    @staticmethod
+    def _is_usable(path: Path) -> bool:
+        """Шрифт открывается и поддерживает кириллицу."""
+        try:
+            return _supports_cyrillic(ImageFont.truetype(str(path), 24))
+        except Exception:
+            return False
+
+    def get(self, size: int) -> ImageFont.FreeTypeFont:
+        """Получает шрифт нужного размера (с кэшированием)."""
+        key = (self.path, size)
+
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                if self.path:
+                    font = ImageFont.truetype(self.path, size)
+                else:
+                    font = ImageFont.load_default(size)
+                self._fonts[key] = font
+
+        return font
+
+
+# Экземпляр реестра (создаётся при первом обращении)
+_registry: Optional[FontRegistry] = None
+
+
+def get_font_registry() -> FontRegistry:
+    """Получает общий реестр шрифтов (каталоги из config + системные)."""
+    global _registry
+
+    if _registry is None:
+        _registry = FontRegistry(font_dirs=[*config.FONT_DIRS, *DEFAULT_FONT_DIRS])
+    return _registry
@@ -0,0 +1,222 @@
+"""
+Общее для Google API (Sheets, Drive): токены доступа, ошибки, HTTP-сессия.
+
+Запросы идут напрямую в REST API через aiohttp — без синхронных
+клиентских библиотек, которые блокировали бы event loop. google-auth
+нужен только для сервисного аккаунта и импортируется лениво.
+Базовые адреса API настраиваются, поэтому всё можно проверить на
+локальном фейковом сервере со статическим токеном.
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional, Protocol
+
+import aiohttp
+from multidict import CIMultiDict
+
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCOPES = (
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+)
+
+# Причины 403, означающие исчерпание квоты (повтор поможет)
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "RATE_LIMIT_EXCEEDED"}
+
+
+class GoogleAPIError(Exception):
+    """Google API вернул ошибку (или запрос не дошёл)."""
+
+    def __init__(self, status: int, body: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {body[:500]}")
+        self.status = status            # 0 — сетевая ошибка или таймаут
+        self.body = body
+        self.retry_after = retry_after  # Заголовок Retry-After, секунды
+
+    @property
+    def retryable(self) -> bool:
+        """Повтор может помочь: сеть, квота, ошибка сервера."""
+        if self.status in (0, 408, 429) or self.status >= 500:
+            return True
+        return self.status == 403 and any(reason in self.body for reason in _RATE_LIMIT_REASONS)
+
+
+class TokenProvider(Protocol):
+    """Источник OAuth-токена доступа."""
+
+    async def token(self) -> str: ...
+
+
+class StaticTokenProvider:
+    """Готовый токен (локальный фейковый сервер, краткосрочный токен из gcloud)."""
+
+    def __init__(self, token: str):
+        self._token = token
+
+    async def token(self) -> str:
+        return self._token
+
+
+class ServiceAccountTokenProvider:
+    """
+    Токен сервисного аккаунта через google-auth.
+
+    Библиотека импортируется при первом запросе токена; обновление
+    (синхронный HTTP-запрос) выполняется в отдельном потоке.
+    """
+
+    def __init__(self, path: str, scopes: tuple[str, ...] = SCOPES):
+        self.path = path
+        self.scopes = scopes
+        self._credentials = None
+        self._lock = asyncio.Lock()
+
+    async def token(self) -> str:
+        async with self._lock:
+            if self._credentials is None:
+                self._credentials = await asyncio.to_thread(self._load)
+            if not self._credentials.valid:
+                from google.auth.transport.requests import Request
+                await asyncio.to_thread(self._credentials.refresh, Request())
+            return self._credentials.token
+
+    def _load(self):
+        """Читает ключ сервисного аккаунта."""
+        try:
+            from google.oauth2 import service_account
+        except ImportError as e:
+            raise RuntimeError("Для сервисного аккаунта Google нужен пакет google-auth") from e
+
+        return service_account.Credentials.from_service_account_file(self.path, scopes=list(self.scopes))
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах (дата вместо числа не поддерживается)."""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class GoogleResponse:
+    """Ответ Google API (тело прочитано целиком)."""
+    status: int
+    headers: Mapping[str, str]      # Без учёта регистра
+    body: bytes
+
+    def json(self) -> dict[str, Any]:
+        """Тело как JSON (пустое — пустой словарь)."""
+        return json.loads(self.body) if self.body else {}
+
+
+async def request(
+    method: str,
+    url: str,
+    *,
+    params: Optional[dict[str, str]] = None,
+    json_body: Any = None,
+    data: Optional[bytes] = None,
+    headers: Optional[dict[str, str]] = None,
+    expected: tuple[int, ...] = (),
+) -> GoogleResponse:
+    """
+    Запрос к Google API с токеном доступа.
+
+    Статусы 2xx и перечисленные в expected (например, 308 у загрузок
+    Drive) возвращаются, остальные — исключение.
+
+    Raises:
+        GoogleAPIError: Неожиданный статус, сетевая ошибка или таймаут (status=0)
+    """
+    headers = {**(headers or {}), "Authorization": f"Bearer {await get_token_provider().token()}"}
+
+    try:
+        async with get_google_session().request(
+            method, url, params=params, json=json_body, data=data, headers=headers, allow_redirects=False
+        ) as response:
+            body = await response.read()
+            if not (200 <= response.status < 300 or response.status in expected):
+                raise GoogleAPIError(
+                    response.status,
+                    body.decode("utf-8", errors="replace"),
+                    _parse_retry_after(response.headers.get("Retry-After")),
+                )
+            return GoogleResponse(response.status, CIMultiDict(response.headers), body)
+    except GoogleAPIError:
+        raise
+    except TimeoutError as e:
+        raise GoogleAPIError(0, f"Таймаут запроса ({config.GOOGLE_API_TIMEOUT}с)") from e
+    except aiohttp.ClientError as e:
+        raise GoogleAPIError(0, str(e)) from e
+
+
+async def request_json(
+    method: str,
+    url: str,
+    *,
+    params: Optional[dict[str, str]] = None,
+    json_body: Any = None,
+) -> dict[str, Any]:
+    """
+    JSON-запрос к Google API.
+
+    Raises:
+        GoogleAPIError: Статус не 2xx, сетевая ошибка, таймаут или невалидный JSON
+    """
+    response = await request(method, url, params=params, json_body=json_body)
+    try:
+        return response.json()
+    except ValueError as e:
+        raise GoogleAPIError(response.status, f"Невалидный JSON: {e}") from e
+
+
+def backoff_delay(error: GoogleAPIError, attempt: int, base: float, maximum: float) -> float:
+    """Задержка перед повтором: Retry-After или экспоненциальная."""
+    if error.retry_after is not None:
+        return min(maximum, error.retry_after)
+    return min(maximum, base * 2 ** (attempt - 1))
+
+
+# Общие экземпляры (создаются при первом обращении)
+_session: Optional[aiohttp.ClientSession] = None
+_token_provider: Optional[TokenProvider] = None
+
+
+def get_google_session() -> aiohttp.ClientSession:
+    """Получает общую сессию для Google API (создаёт при первом обращении)."""
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.GOOGLE_MAX_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=config.GOOGLE_API_TIMEOUT),
+        )
+    return _session
+
+
+def get_token_provider() -> TokenProvider:
+    """Получает источник токена: GOOGLE_ACCESS_TOKEN или сервисный аккаунт."""
+    global _token_provider
+
+    if _token_provider is None:
+        if config.GOOGLE_ACCESS_TOKEN:
+            _token_provider = StaticTokenProvider(config.GOOGLE_ACCESS_TOKEN)
+        else:
+            _token_provider = ServiceAccountTokenProvider(config.GOOGLE_SERVICE_ACCOUNT_FILE)
+    return _token_provider
+
+
+async def close_google_session() -> None:
+    """Закрывает общую сессию Google API."""
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
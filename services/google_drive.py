@@ -0,0 +1,426 @@
+"""
+Загрузка коллажей в Google Drive.
+
+- Загрузки идут в ограниченном пуле (не больше workers одновременно).
+- Большие файлы загружаются частями по протоколу resumable upload: после
+  сбоя загрузка продолжается с последнего принятого байта, а не с нуля.
+- Повторная загрузка того же содержимого не создаёт копию: по SHA-256
+  хранится ID уже загруженного файла, одновременные загрузки одного
+  файла объединяются.
+- Число загрузок, байты, задержка и пропускная способность доступны
+  через snapshot().
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Mapping, Optional
+
+from services.blob_store import BlobNotFoundError, get_blob_store
+from services.google_api import GoogleAPIError, backoff_delay, request
+from utils.config import config
+from utils.logger import get_logger
+from utils.metrics import LatencyWindow
+
+logger = get_logger(__name__)
+
+# Части resumable-загрузки должны быть кратны 256 КиБ (кроме последней)
+CHUNK_GRANULARITY = 256 * 1024
+
+_FIELDS = "id,webViewLink"
+_RANGE_RE = re.compile(r"bytes=\d+-(\d+)")
+_UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|]+')
+
+
+@dataclass
+class DriveFile:
+    """Загруженный файл."""
+    file_id: str
+    link: str
+    deduplicated: bool = False  # Содержимое уже было в Drive, новый файл не создан
+
+
+@dataclass
+class UploadStats:
+    """Счётчики загрузок с момента запуска."""
+    uploads: int = 0            # Загружено новых файлов
+    deduplicated: int = 0       # Запросов, обслуженных без загрузки
+    bytes: int = 0              # Загружено байт
+    chunks: int = 0             # Частей resumable-загрузки
+    resumes: int = 0            # Продолжений после сбоя
+    retries: int = 0            # Повторов после ошибок
+    failures: int = 0           # Загрузок, завершившихся ошибкой
+    seconds: float = 0.0        # Суммарное время загрузок
+
+    @property
+    def throughput(self) -> float:
+        """Средняя скорость загрузки, байт/с."""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+
+def guess_mime_type(data: bytes) -> str:
+    """MIME-тип изображения по сигнатуре."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class DriveUploader:
+    """
+    Загрузчик файлов в папку Google Drive с дедупликацией по содержимому.
+
+    Индекс загруженных файлов — SQLite; дисковые методы потокобезопасны.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        folder_id: str,
+        base_url: str = "https://www.googleapis.com",
+        workers: int = 3,
+        chunk_size: int = 1024 * 1024,
+        resumable_threshold: int = 5 * 1024 * 1024,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.index_path = Path(index_path)
+        self.folder_id = folder_id
+        self.base_url = base_url.rstrip("/")
+        self.workers = max(1, workers)
+        self.chunk_size = max(CHUNK_GRANULARITY, chunk_size // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+        self.resumable_threshold = resumable_threshold
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._stats = UploadStats()
+        self._latency = LatencyWindow()
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS drive_files ("
+            " sha256 TEXT PRIMARY KEY,"
+            " file_id TEXT NOT NULL,"
+            " link TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " uploaded REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @property
+    def stats(self) -> UploadStats:
+        """Снимок счётчиков."""
+        with self._lock:
+            return replace(self._stats)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Метрики: счётчики, задержка загрузки, скорость (МБ/с)."""
+        stats = self.stats
+        return {
+            **asdict(stats),
+            "throughput_mb_s": stats.throughput / (1024 * 1024),
+            "latency": self._latency.summary(),
+            "in_progress": len(self._inflight),
+        }
+
+    # ---------- Индекс (SQLite) ----------
+
+    def lookup(self, digest: str) -> Optional[DriveFile]:
+        """Ранее загруженный файл с таким SHA-256."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_id, link FROM drive_files WHERE sha256 = ?", (digest,)
+            ).fetchone()
+        return DriveFile(row[0], row[1]) if row else None
+
+    def _remember(self, digest: str, file: DriveFile, size: int) -> None:
+        """Сохраняет загруженный файл в индекс."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO drive_files (sha256, file_id, link, size, uploaded) VALUES (?, ?, ?, ?, ?)",
+                (digest, file.file_id, file.link, size, time.time()),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        """Закрывает индекс."""
+        with self._lock:
+            self._db.close()
+
+    # ---------- Загрузка ----------
+
+    async def upload(
+        self,
+        data: bytes,
+        name: str,
+        mime_type: Optional[str] = None,
+        digest: Optional[str] = None,
+    ) -> DriveFile:
+        """
+        Загружает файл (или возвращает уже загруженный с тем же содержимым).
+
+        Args:
+            data: Содержимое
+            name: Имя файла в Drive
+            mime_type: MIME-тип (по умолчанию — по сигнатуре)
+            digest: SHA-256 содержимого, если уже известен (ключ blob-а)
+
+        Raises:
+            GoogleAPIError: Загрузка не удалась после всех повторов
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+
+        known = await asyncio.to_thread(self.lookup, digest)
+        if known is not None:
+            with self._lock:
+                self._stats.deduplicated += 1
+            return replace(known, deduplicated=True)
+
+        task = self._inflight.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._upload_new(digest, data, name, mime_type or guess_mime_type(data)))
+            self._inflight[digest] = task
+            task.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        else:
+            with self._lock:
+                self._stats.deduplicated += 1
+
+        # Отмена одного ожидающего не должна обрывать общую загрузку
+        return await asyncio.shield(task)
+
+    async def _upload_new(self, digest: str, data: bytes, name: str, mime_type: str) -> DriveFile:
+        """Загрузка нового содержимого в пуле."""
+        async with self._semaphore:
+            started = time.perf_counter()
+            metadata = {"name": name, "parents": [self.folder_id]}
+
+            try:
+                if len(data) > self.resumable_threshold:
+                    file = await self._upload_resumable(data, metadata, mime_type)
+                else:
+                    file = await self._with_retries(lambda: self._upload_multipart(data, metadata, mime_type))
+            except GoogleAPIError:
+                with self._lock:
+                    self._stats.failures += 1
+                raise
+
+            elapsed = time.perf_counter() - started
+            self._latency.add(elapsed)
+            with self._lock:
+                self._stats.uploads += 1
+                self._stats.bytes += len(data)
+                self._stats.seconds += elapsed
+
+        await asyncio.to_thread(self._remember, digest, file, len(data))
+        logger.info(
+            f"Drive: {name} ({len(data) / 1024:.0f} КБ) загружен за {elapsed:.2f}с "
+            f"({len(data) / 1024 / 1024 / max(elapsed, 1e-6):.2f} МБ/с)"
+        )
+        return file
+
+    async def _with_retries(self, send) -> DriveFile:
+        """Повторяет запрос при ошибках квоты, сервера и сети."""
+        attempt = 0
+        while True:
+            try:
+                return await send()
+            except GoogleAPIError as e:
+                attempt += 1
+                if not e.retryable or attempt > self.max_retries:
+                    raise
+                await self._pause(e, attempt)
+
+    async def _pause(self, error: GoogleAPIError, attempt: int) -> None:
+        """Задержка перед повтором."""
+        delay = backoff_delay(error, attempt, self.backoff_base, self.backoff_max)
+        with self._lock:
+            self._stats.retries += 1
+        logger.warning(f"Drive: ошибка загрузки ({error}), повтор через {delay:.1f}с")
+        await asyncio.sleep(delay)
+
+    async def _upload_multipart(self, data: bytes, metadata: dict, mime_type: str) -> DriveFile:
+        """Загрузка одним запросом (multipart/related: метаданные + содержимое)."""
+        boundary = uuid.uuid4().hex
+        body = b"".join((
+            f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n".encode(),
+            json.dumps(metadata, ensure_ascii=False).encode("utf-8"),
+            f"\r\n--{boundary}\r\nContent-Type: {mime_type}\r\n\r\n".encode(),
+            data,
+            f"\r\n--{boundary}--".encode(),
+        ))
+        response = await request(
+            "POST",
+            f"{self.base_url}/upload/drive/v3/files",
+            params={"uploadType": "multipart", "fields": _FIELDS, "supportsAllDrives": "true"},
+            data=body,
+            headers={"Content-Type": f"multipart/related; boundary={boundary}"},
+        )
+        return self._to_file(response.json())
+
+    async def _upload_resumable(self, data: bytes, metadata: dict, mime_type: str) -> DriveFile:
+        """
+        Загрузка частями по протоколу resumable upload.
+
+        Каждая часть отправляется с Content-Range; 308 означает «принято,
+        продолжай». После сбоя сервер спрашивают, сколько байт дошло
+        (Content-Range: bytes */размер), и загрузка продолжается с этого места.
+        Истёкшая сессия (404/410) начинается заново.
+        """
+        total = len(data)
+        session_uri: Optional[str] = None
+        offset = 0
+        attempt = 0
+        interrupted = False
+
+        while True:
+            try:
+                if session_uri is None:
+                    session_uri = await self._start_session(metadata, mime_type, total)
+                    offset = 0
+                elif interrupted:
+                    status = await request(
+                        "PUT", session_uri, data=b"",
+                        headers={"Content-Range": f"bytes */{total}"}, expected=(308,),
+                    )
+                    if status.status != 308:
+                        return self._to_file(status.json())
+                    offset = self._next_offset(status.headers)
+                    with self._lock:
+                        self._stats.resumes += 1
+                    logger.info(f"Drive: продолжение загрузки с {offset} из {total} байт")
+                interrupted = False
+
+                while True:
+                    end = min(offset + self.chunk_size, total)
+                    response = await request(
+                        "PUT", session_uri, data=data[offset:end],
+                        headers={"Content-Range": f"bytes {offset}-{end - 1}/{total}"}, expected=(308,),
+                    )
+                    with self._lock:
+                        self._stats.chunks += 1
+                    if response.status != 308:
+                        return self._to_file(response.json())
+                    offset = self._next_offset(response.headers)
+
+            except GoogleAPIError as e:
+                attempt += 1
+                if e.status in (404, 410):
+                    session_uri = None
+                elif not e.retryable:
+                    raise
+                if attempt > self.max_retries:
+                    raise
+                interrupted = True
+                await self._pause(e, attempt)
+
+    async def _start_session(self, metadata: dict, mime_type: str, total: int) -> str:
+        """Открывает сессию resumable-загрузки, возвращает её URI."""
+        response = await request(
+            "POST",
+            f"{self.base_url}/upload/drive/v3/files",
+            params={"uploadType": "resumable", "fields": _FIELDS, "supportsAllDrives": "true"},
+            json_body=metadata,
+            headers={"X-Upload-Content-Type": mime_type, "X-Upload-Content-Length": str(total)},
+        )
+        location = response.headers.get("Location")
+        if not location:
+            raise GoogleAPIError(response.status, "Нет заголовка Location у resumable-сессии")
+        return location
+
+    @staticmethod
+    def _next_offset(headers: Mapping[str, str]) -> int:
+        """Следующий байт по заголовку Range ответа 308 (нет заголовка — ничего не принято)."""
+        match = _RANGE_RE.match(headers.get("Range", ""))
+        return int(match.group(1)) + 1 if match else 0
+
+    @staticmethod
+    def _to_file(data: dict) -> DriveFile:
+        """DriveFile из ответа files.create."""
+        file_id = data["id"]
+        link = data.get("webViewLink") or f"https://drive.google.com/file/d/{file_id}/view"
+        return DriveFile(file_id, link)
+
+
+# Экземпляр загрузчика (создаётся при первом обращении)
+_uploader: Optional[DriveUploader] = None
+
+
+def drive_enabled() -> bool:
+    """Задана ли папка Drive для коллажей."""
+    return bool(config.GOOGLE_DRIVE_FOLDER_ID)
+
+
+def get_drive_uploader() -> DriveUploader:
+    """Получает общий загрузчик (создаёт по настройкам из config)."""
+    global _uploader
+
+    if _uploader is None:
+        _uploader = DriveUploader(
+            index_path=config.DRIVE_INDEX_PATH,
+            folder_id=config.GOOGLE_DRIVE_FOLDER_ID,
+            base_url=config.GOOGLE_DRIVE_BASE_URL,
+            workers=config.DRIVE_UPLOAD_WORKERS,
+            chunk_size=config.DRIVE_CHUNK_KB * 1024,
+            resumable_threshold=config.DRIVE_RESUMABLE_THRESHOLD_KB * 1024,
+            max_retries=config.DRIVE_MAX_RETRIES,
+        )
+    return _uploader
+
+
+async def upload_collage(key: str, name: str) -> str:
+    """
+    Загружает коллаж из хранилища blob-ов и возвращает ссылку.
+
+    Пустая строка — коллажа нет в хранилище (строка поставлена до
+    закрепления коллажей за очередью) или Drive отверг файл (строка
+    журнала пишется без ссылки). Временные ошибки пробрасываются,
+    чтобы журнал повторил попытку позже.
+
+    Raises:
+        GoogleAPIError: Временная ошибка Drive (квота, сервер, сеть)
+    """
+    try:
+        data = await asyncio.to_thread(get_blob_store().get, key)
+    except BlobNotFoundError:
+        logger.warning(f"Коллаж {key[:12]} удалён из хранилища, ссылка не будет добавлена")
+        return ""
+
+    mime_type = guess_mime_type(data)
+    extension = mime_type.rsplit("/", 1)[-1].replace("jpeg", "jpg")
+    filename = f"{_UNSAFE_NAME_RE.sub('-', name).strip()}.{extension}"
+
+    try:
+        file = await get_drive_uploader().upload(data, filename, mime_type, digest=key)
+    except GoogleAPIError as e:
+        if e.retryable:
+            raise
+        logger.error(f"Drive отверг коллаж {key[:12]}: {e}")
+        return ""
+    return file.link
+
+
+def close_drive_uploader() -> None:
+    """Закрывает индекс загрузчика."""
+    global _uploader
+
+    if _uploader is not None:
+        _uploader.close()
+        _uploader = None
@@ -0,0 +1,532 @@
+"""
+Журнал сделок в Google-таблице: запись через локальную очередь (outbox).
+
+Обработчик бота только кладёт строку в SQLite и сразу отвечает
+пользователю. Фоновая задача собирает накопившиеся строки и отправляет их
+одним запросом values.append; при исчерпании квоты или сбое — повтор с
+экспоненциальной задержкой. Очередь переживает перезапуск.
+
+Ссылка на коллаж подставляется при отправке: коллаж загружается в Drive
+по ключу в хранилище blob-ов (link_resolver). Пока строка в очереди,
+сборщик blob-ов её коллаж не удаляет (pending_collage_keys).
+
+Каждая строка содержит ID сделки. Перед отправкой строки помечаются как
+«в пути»; если после сбоя (или падения процесса) исход неизвестен, перед
+повтором ID сверяются с колонкой таблицы — так каждая сделка попадает в
+журнал ровно один раз. Читается только хвост колонки: от последней
+известной записанной строки с запасом.
+
+Если таблица отвергла пачку (HTTP 400), пачка делится пополам, пока
+плохая строка не останется одна; она откладывается (dead letter) и
+больше не блокирует очередь.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+from urllib.parse import quote
+
+from services.google_api import GoogleAPIError, backoff_delay, request_json
+from services.google_drive import drive_enabled, upload_collage
+from services.trade_store import TradeRecord
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Колонки журнала (ID сделки — последняя, по ней проверяются дубли)
+JOURNAL_COLUMNS = (
+    "Дата", "Ticker", "Направление", "Тип входа (ТВХ)", "Результат",
+    "Рынок", "Примечание", "Ссылка на скриншот", "ID сделки",
+)
+_LAST_COLUMN = chr(ord("A") + len(JOURNAL_COLUMNS) - 1)
+
+# Начало значения, которое USER_ENTERED превратит в формулу
+_FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+# Последняя строка диапазона из ответа values.append: "'Журнал'!A120:I125" → 125
+_LAST_ROW_RE = re.compile(r"(\d+)$")
+
+
+@dataclass
+class JournalEntry:
+    """Строка журнала."""
+    trade_id: str
+    date: str
+    asset: str
+    scenario: str
+    note: str = ""
+    direction: str = ""
+    result: str = ""
+    market: str = "Крипта"
+    link: str = ""
+    collage_key: str = ""   # Ключ коллажа в хранилище blob-ов (ссылка — после загрузки в Drive)
+
+    def to_row(self) -> list[str]:
+        """Значения в порядке JOURNAL_COLUMNS."""
+        note = f"'{self.note}" if self.note.startswith(_FORMULA_PREFIXES) else self.note
+        return [
+            self.date, self.asset, self.direction, self.scenario, self.result,
+            self.market, note, self.link, self.trade_id,
+        ]
+
+
+@dataclass
+class JournalStats:
+    """Счётчики журнала с момента запуска."""
+    enqueued: int = 0       # Поставлено в очередь
+    sent: int = 0           # Записано в таблицу
+    batches: int = 0        # Успешных запросов values.append
+    duplicates: int = 0     # Уже были в таблице (запись подтверждена сверкой)
+    failures: int = 0       # Неудачных запросов
+    dead: int = 0           # Строк, отвергнутых таблицей и отложенных
+
+
+class SheetsJournal:
+    """
+    Очередь записи в Google-таблицу поверх SQLite.
+
+    Дисковые методы потокобезопасны и вызываются через asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        spreadsheet_id: str,
+        sheet: str = "Журнал",
+        base_url: str = "https://sheets.googleapis.com",
+        batch_size: int = 100,
+        flush_delay: float = 2.0,
+        poll_interval: float = 30.0,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        id_check_rows: int = 1000,
+        link_resolver: Optional[Callable[[str, str], Awaitable[str]]] = None,
+    ):
+        self.path = Path(path)
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet = sheet
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.flush_delay = flush_delay
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.id_check_rows = max(self.batch_size, id_check_rows)
+        self.link_resolver = link_resolver    # (ключ коллажа, имя файла) -> ссылка
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._stats = JournalStats()
+        self._lock = threading.Lock()
+        self._wake = asyncio.Event()
+
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS journal_outbox ("
+            " trade_id TEXT PRIMARY KEY,"
+            " entry TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " sent_at REAL,"
+            " last_error TEXT,"
+            " failed_at REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(journal_outbox)")}
+        if "failed_at" not in columns:
+            # Очередь, созданная до появления отложенных строк
+            self._db.execute("ALTER TABLE journal_outbox ADD COLUMN failed_at REAL")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS journal_outbox_pending ON journal_outbox (created) WHERE sent_at IS NULL"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS journal_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    @property
+    def stats(self) -> JournalStats:
+        """Снимок счётчиков."""
+        with self._lock:
+            return replace(self._stats)
+
+    # ---------- Очередь (SQLite) ----------
+
+    def add(self, entry: JournalEntry) -> bool:
+        """Кладёт строку в очередь. False — сделка с таким ID уже есть."""
+        with self._lock:
+            added = self._db.execute(
+                "INSERT OR IGNORE INTO journal_outbox (trade_id, entry, created) VALUES (?, ?, ?)",
+                (entry.trade_id, json.dumps(asdict(entry), ensure_ascii=False), time.time()),
+            ).rowcount
+            self._db.commit()
+            self._stats.enqueued += added
+            return bool(added)
+
+    def pending(self, limit: Optional[int] = None) -> list[tuple[JournalEntry, int]]:
+        """Неотправленные строки (в порядке постановки, без отложенных) и число попыток."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT entry, attempts FROM journal_outbox WHERE sent_at IS NULL AND failed_at IS NULL "
+                "ORDER BY created LIMIT ?",
+                (limit if limit is not None else -1,),
+            ).fetchall()
+        return [(JournalEntry(**json.loads(entry)), attempts) for entry, attempts in rows]
+
+    def pending_count(self) -> int:
+        """Сколько строк ждут отправки."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM journal_outbox WHERE sent_at IS NULL AND failed_at IS NULL"
+            ).fetchone()[0]
+
+    def dead_count(self) -> int:
+        """Сколько строк отложено (таблица их отвергла)."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM journal_outbox WHERE sent_at IS NULL AND failed_at IS NOT NULL"
+            ).fetchone()[0]
+
+    def pending_ids(self) -> set[str]:
+        """ID сделок, ещё не подтверждённых в таблице (включая отложенные)."""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT trade_id FROM journal_outbox WHERE sent_at IS NULL")}
+
+    def pending_collage_keys(self) -> set[str]:
+        """Ключи коллажей неотправленных строк (их нельзя удалять из хранилища blob-ов)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT entry FROM journal_outbox WHERE sent_at IS NULL AND failed_at IS NULL"
+            ).fetchall()
+        keys = (json.loads(entry).get("collage_key") for (entry,) in rows)
+        return {key for key in keys if key}
+
+    def _mark_attempt(self, trade_ids: list[str]) -> None:
+        """Отмечает попытку отправки (до запроса: исход может остаться неизвестным)."""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE journal_outbox SET attempts = attempts + 1 WHERE trade_id = ?",
+                [(trade_id,) for trade_id in trade_ids],
+            )
+            self._db.commit()
+
+    def _mark_error(self, trade_ids: list[str], error: str) -> None:
+        """Сохраняет текст последней ошибки."""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE journal_outbox SET last_error = ? WHERE trade_id = ?",
+                [(error[:1000], trade_id) for trade_id in trade_ids],
+            )
+            self._db.commit()
+
+    def _mark_dead(self, trade_ids: list[str], error: str) -> None:
+        """Откладывает строки, которые таблица отвергла: из очереди отправки они уходят."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE journal_outbox SET failed_at = ?, last_error = ? WHERE trade_id = ?",
+                [(now, error[:1000], trade_id) for trade_id in trade_ids],
+            )
+            self._db.commit()
+
+    def _last_row(self) -> Optional[int]:
+        """Последняя строка таблицы, записанная журналом (None — неизвестна)."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM journal_meta WHERE key = 'last_row'").fetchone()
+        return int(row[0]) if row else None
+
+    def _set_last_row(self, row: int) -> None:
+        """Запоминает последнюю записанную строку."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO journal_meta (key, value) VALUES ('last_row', ?)", (str(row),)
+            )
+            self._db.commit()
+
+    def _mark_sent(self, trade_ids: list[str]) -> None:
+        """Отмечает строки записанными."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE journal_outbox SET sent_at = ?, last_error = NULL WHERE trade_id = ?",
+                [(now, trade_id) for trade_id in trade_ids],
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite."""
+        with self._lock:
+            self._db.close()
+
+    # ---------- Отправка ----------
+
+    async def enqueue(self, entry: JournalEntry) -> bool:
+        """Ставит строку в очередь и будит фоновую отправку. Google не ждёт."""
+        added = await asyncio.to_thread(self.add, entry)
+        if added:
+            self._wake.set()
+        else:
+            logger.info(f"Сделка {entry.trade_id} уже в очереди журнала")
+        return added
+
+    async def flush(self) -> int:
+        """
+        Отправляет одну пачку из очереди.
+
+        Returns:
+            Сколько строк обработано (записано, найдено в таблице или отложено)
+
+        Raises:
+            GoogleAPIError: Запрос к таблице не удался (кроме отвергнутых строк)
+        """
+        batch = await asyncio.to_thread(self.pending, self.batch_size)
+        if not batch:
+            return 0
+
+        confirmed = 0
+        if any(attempts > 0 for _, attempts in batch):
+            # Прошлая попытка могла дойти до таблицы — сверяем ID
+            existing = await self._existing_ids()
+            present = [entry.trade_id for entry, _ in batch if entry.trade_id in existing]
+            if present:
+                await asyncio.to_thread(self._mark_sent, present)
+                with self._lock:
+                    self._stats.duplicates += len(present)
+                logger.info(f"Журнал: {len(present)} строк уже в таблице, повторно не отправляются")
+                confirmed = len(present)
+            batch = [(entry, attempts) for entry, attempts in batch if entry.trade_id not in existing]
+
+        if not batch:
+            return confirmed
+
+        if self.link_resolver is not None:
+            # Загрузки коллажей идут параллельно; уже загруженные не повторяются
+            await asyncio.gather(*(
+                self._resolve_link(entry) for entry, _ in batch if entry.collage_key and not entry.link
+            ))
+
+        entries = [entry for entry, _ in batch]
+        await asyncio.to_thread(self._mark_attempt, [entry.trade_id for entry in entries])
+        return confirmed + await self._send(entries)
+
+    async def _send(self, entries: list[JournalEntry]) -> int:
+        """
+        Записывает строки одним запросом. Если таблица отвергла запрос
+        (HTTP 400), пачка делится пополам, а одиночная плохая строка
+        откладывается.
+
+        Returns:
+            Сколько строк записано или отложено
+        """
+        trade_ids = [entry.trade_id for entry in entries]
+        try:
+            last_row = await self._append([entry.to_row() for entry in entries])
+        except GoogleAPIError as e:
+            with self._lock:
+                self._stats.failures += 1
+            await asyncio.to_thread(self._mark_error, trade_ids, str(e))
+            if e.status != 400:
+                raise
+
+            if len(entries) == 1:
+                await asyncio.to_thread(self._mark_dead, trade_ids, str(e))
+                with self._lock:
+                    self._stats.dead += 1
+                logger.error(f"Журнал: таблица отвергла сделку {trade_ids[0]}, строка отложена: {e}")
+                return 1
+
+            middle = len(entries) // 2
+            return await self._send(entries[:middle]) + await self._send(entries[middle:])
+
+        await asyncio.to_thread(self._mark_sent, trade_ids)
+        if last_row is not None:
+            await asyncio.to_thread(self._set_last_row, last_row)
+        with self._lock:
+            self._stats.sent += len(trade_ids)
+            self._stats.batches += 1
+        logger.info(f"Журнал: записано строк {len(trade_ids)}")
+        return len(trade_ids)
+
+    async def run(self) -> None:
+        """
+        Фоновая отправка: по сигналу enqueue (с задержкой, чтобы собрать
+        пачку) и периодически — для строк, оставшихся после сбоев.
+        """
+        failures = 0
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                await asyncio.sleep(self.flush_delay)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                while await self.flush() >= self.batch_size:
+                    pass
+                failures = 0
+            except GoogleAPIError as e:
+                failures += 1
+                delay = backoff_delay(e, failures, self.backoff_base, self.backoff_max)
+                if not e.retryable:
+                    # Ошибка доступа или запроса — сама не пройдёт, но строки не теряем
+                    delay = self.backoff_max
+                logger.warning(f"Журнал: ошибка записи в таблицу ({e}), повтор через {delay:.1f}с")
+                await asyncio.sleep(delay)
+                self._wake.set()
+            except Exception as e:
+                failures += 1
+                logger.error(f"Журнал: ошибка отправки: {e}")
+                await asyncio.sleep(min(self.backoff_max, self.backoff_base * 2 ** failures))
+
+    async def read_entries(self) -> list[JournalEntry]:
+        """
+        Все строки журнала из таблицы (заголовок и пустые строки пропускаются).
+
+        Строкам, добавленным вручную без ID, назначается ID по содержимому.
+        """
+        data = await request_json(
+            "GET", self._range_url(f"A:{_LAST_COLUMN}"), params={"majorDimension": "ROWS"}
+        )
+
+        entries = []
+        for values in data.get("values") or []:
+            row = [str(value) for value in values[:len(JOURNAL_COLUMNS)]]
+            row += [""] * (len(JOURNAL_COLUMNS) - len(row))
+            if not any(row) or row[0] == JOURNAL_COLUMNS[0]:
+                continue
+
+            date, asset, direction, scenario, result, market, note, link, trade_id = row
+            if not trade_id:
+                trade_id = "sheet-" + hashlib.sha1("\x1f".join(row).encode("utf-8")).hexdigest()[:16]
+            entries.append(JournalEntry(trade_id, date, asset, scenario, note, direction, result, market, link))
+        return entries
+
+    async def _resolve_link(self, entry: JournalEntry) -> None:
+        """Подставляет ссылку на коллаж (временная ошибка Drive откладывает всю пачку)."""
+        name = f"{entry.date} {entry.asset} {entry.scenario} {entry.trade_id}"
+        entry.link = await self.link_resolver(entry.collage_key, name)
+
+    def _range_url(self, a1_range: str) -> str:
+        """URL диапазона листа."""
+        sheet = self.sheet.replace("'", "''")
+        encoded = quote(f"'{sheet}'!{a1_range}", safe="")
+        return f"{self.base_url}/v4/spreadsheets/{self.spreadsheet_id}/values/{encoded}"
+
+    async def _append(self, rows: list[list[str]]) -> Optional[int]:
+        """
+        Один запрос values.append на все строки.
+
+        Returns:
+            Номер последней записанной строки (None — нет в ответе)
+        """
+        data = await request_json(
+            "POST",
+            self._range_url(f"A:{_LAST_COLUMN}") + ":append",
+            params={"valueInputOption": "USER_ENTERED", "insertDataOption": "INSERT_ROWS"},
+            json_body={"majorDimension": "ROWS", "values": rows},
+        )
+        match = _LAST_ROW_RE.search((data.get("updates") or {}).get("updatedRange", ""))
+        return int(match.group(1)) if match else None
+
+    async def _existing_ids(self) -> set[str]:
+        """
+        ID сделок в хвосте таблицы.
+
+        Неподтверждённая пачка могла попасть только после последней
+        известной записанной строки, поэтому читается колонка ID начиная
+        с id_check_rows строк до неё. Пока такой строки нет (первая
+        отправка), читается вся колонка.
+        """
+        last_row = await asyncio.to_thread(self._last_row)
+        first_row = max(1, last_row - self.id_check_rows + 1) if last_row else 1
+        data = await request_json(
+            "GET",
+            self._range_url(f"{_LAST_COLUMN}{first_row}:{_LAST_COLUMN}"),
+            params={"majorDimension": "COLUMNS"},
+        )
+        columns = data.get("values") or [[]]
+        return set(columns[0])
+
+
+# Экземпляр журнала (создаётся при первом обращении)
+_journal: Optional[SheetsJournal] = None
+
+
+def journal_enabled() -> bool:
+    """Задана ли таблица для журнала."""
+    return bool(config.GOOGLE_SHEET_ID)
+
+
+def get_journal() -> SheetsJournal:
+    """Получает общий журнал (создаёт по настройкам из config)."""
+    global _journal
+
+    if _journal is None:
+        _journal = SheetsJournal(
+            path=config.JOURNAL_OUTBOX_PATH,
+            spreadsheet_id=config.GOOGLE_SHEET_ID,
+            sheet=config.GOOGLE_SHEET_NAME,
+            base_url=config.GOOGLE_SHEETS_BASE_URL,
+            batch_size=config.SHEETS_BATCH_SIZE,
+            flush_delay=config.SHEETS_FLUSH_DELAY,
+            poll_interval=config.SHEETS_POLL_INTERVAL,
+            backoff_base=config.SHEETS_BACKOFF_BASE,
+            backoff_max=config.SHEETS_BACKOFF_MAX,
+            id_check_rows=config.SHEETS_ID_CHECK_ROWS,
+            link_resolver=upload_collage if drive_enabled() else None,
+        )
+    return _journal
+
+
+async def load_journal_trades() -> list[TradeRecord]:
+    """Сделки из таблицы — для сверки локального хранилища."""
+    entries = await get_journal().read_entries()
+    return [TradeRecord(e.trade_id, e.date, e.asset, e.scenario, e.result) for e in entries]
+
+
+async def pending_journal_ids() -> set[str]:
+    """ID сделок, ещё не записанных в таблицу."""
+    return await asyncio.to_thread(get_journal().pending_ids)
+
+
+async def pending_collage_keys() -> set[str]:
+    """Коллажи строк, ещё не записанных в таблицу (для сборщика blob-ов)."""
+    if not journal_enabled():
+        return set()
+    return await asyncio.to_thread(get_journal().pending_collage_keys)
+
+
+async def run_journal_flusher() -> None:
+    """Фоновая задача отправки журнала (ничего не делает без таблицы)."""
+    if not journal_enabled():
+        logger.info("GOOGLE_SHEET_ID не задан, журнал в таблицу отключён")
+        return
+
+    journal = get_journal()
+    pending = await asyncio.to_thread(journal.pending_count)
+    if pending:
+        logger.info(f"Журнал: в очереди {pending} строк с прошлого запуска")
+    dead = await asyncio.to_thread(journal.dead_count)
+    if dead:
+        logger.warning(f"Журнал: {dead} строк отложено (таблица их отвергла), см. last_error в очереди")
+    await journal.run()
+
+
+def close_journal() -> None:
+    """Закрывает общий журнал."""
+    global _journal
+
+    if _journal is not None:
+        _journal.close()
+        _journal = None
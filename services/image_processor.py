@@ -4,11 +4,14 @@
 
 import io
 from dataclasses import dataclass
-from pathlib import Path
+from functools import lru_cache
 from typing import Optional
 
 from PIL import Image, ImageDraw, ImageFont
 
+from services.fonts import get_font_registry
+from services.output_policy import EncodedImage, OutputPolicy, encode_image, scale_to_width
+from utils.config import config
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -23,49 +26,39 @@ class TradeHeader:
 
 
 def _get_font(size: int) -> ImageFont.FreeTypeFont:
-    """Получает шрифт нужного размера."""
-    # Пробуем загрузить системные шрифты
-    font_paths = [
-        "C:/Windows/Fonts/arial.ttf",
-        "C:/Windows/Fonts/segoeui.ttf",
-        "C:/Windows/Fonts/tahoma.ttf",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/System/Library/Fonts/Helvetica.ttc",
-    ]
-    
-    for font_path in font_paths:
-        if Path(font_path).exists():
-            try:
-                return ImageFont.truetype(font_path, size)
-            except Exception:
-                continue
-    
-    # Fallback на встроенный шрифт
-    return ImageFont.load_default()
+    """Получает шрифт нужного размера из реестра."""
+    return get_font_registry().get(size)
 
 
-def create_vertical_collage(images: list[bytes]) -> bytes:
+def create_vertical_collage(
+    images: list[bytes],
+    policy: Optional[OutputPolicy] = None
+) -> bytes:
     """
     Создаёт вертикальный коллаж из списка изображений (без заголовка).
     
     Args:
         images: Список изображений в виде байтов (bytes)
+        policy: Политика вывода (по умолчанию — из config)
     
     Returns:
-        Готовый коллаж в формате JPEG (bytes)
+        Готовый коллаж (bytes)
     """
     if not images:
         raise ValueError("Список изображений пуст")
     
+    policy = policy or OutputPolicy.from_config()
+    
     pil_images = _load_images(images)
-    collage = _stitch_images(pil_images)
+    collage = _stitch_images(pil_images, policy.target_width)
     
-    return _save_to_bytes(collage)
+    return encode_image(collage, policy).data
 
 
 def create_collage_with_header(
     images: list[bytes],
-    header: TradeHeader
+    header: TradeHeader,
+    policy: Optional[OutputPolicy] = None
 ) -> bytes:
     """
     Создаёт коллаж с заголовком (информация о сделке сверху).
@@ -73,21 +66,110 @@ def create_collage_with_header(
     Args:
         images: Список изображений в виде байтов
         header: Данные для заголовка (актив, сценарий, дата)
+        policy: Политика вывода (по умолчанию — из config)
     
     Returns:
-        Готовый коллаж с заголовком в формате JPEG (bytes)
+        Готовый коллаж с заголовком (bytes)
+    """
+    return render_collage(images, header, policy).data
+
+
+def render_collage(
+    images: list[bytes],
+    header: TradeHeader,
+    policy: Optional[OutputPolicy] = None,
+    streaming: Optional[bool] = None
+) -> EncodedImage:
+    """
+    Создаёт коллаж с заголовком и кодирует его по политике вывода.
+    
+    Args:
+        images: Список изображений в виде байтов
+        header: Данные для заголовка (актив, сценарий, дата)
+        policy: Политика вывода (по умолчанию — из config)
+        streaming: Потоковая сборка с низким потреблением памяти
+            (по умолчанию — из config)
+    
+    Returns:
+        EncodedImage — байты коллажа, формат и способ отправки
     """
     if not images:
         raise ValueError("Список изображений пуст")
     
-    # Создаём базовый коллаж
-    pil_images = _load_images(images)
-    base_collage = _stitch_images(pil_images)
+    policy = policy or OutputPolicy.from_config()
+    if streaming is None:
+        streaming = config.COLLAGE_STREAMING
+    
+    if streaming:
+        final_collage = _assemble_streaming(images, header, policy.target_width)
+    else:
+        # Создаём базовый коллаж
+        pil_images = _load_images(images)
+        base_collage = _stitch_images(pil_images, policy.target_width)
+        
+        # Добавляем заголовок
+        final_collage = _add_header(base_collage, header)
+    
+    return encode_image(final_collage, policy)
+
+
+def _assemble_streaming(
+    images: list[bytes],
+    header: TradeHeader,
+    target_width: int = 0
+) -> Image.Image:
+    """
+    Потоковая сборка коллажа с заголовком.
+    
+    Размеры читаются только из заголовков файлов, холст (вместе с шапкой)
+    выделяется один раз, а изображения декодируются, вставляются и
+    закрываются по одному. При уменьшении JPEG декодируется в draft-режиме
+    (масштабирование DCT), поэтому полноразмерная копия не создаётся.
+    Пиковая память — холст плюс одно исходное изображение.
+    """
+    # Проход 1: только размеры (Image.open не декодирует пиксели)
+    sizes: list[tuple[int, int]] = []
+    for i, img_bytes in enumerate(images):
+        try:
+            with Image.open(io.BytesIO(img_bytes)) as img:
+                sizes.append(scale_to_width(img.size[0], img.size[1], target_width))
+                logger.info(f"Изображение #{i+1}: {img.size[0]}x{img.size[1]}")
+        except Exception as e:
+            logger.error(f"Ошибка открытия изображения #{i+1}: {e}")
+            raise
     
-    # Добавляем заголовок
-    final_collage = _add_header(base_collage, header)
+    max_width = max(w for w, _ in sizes)
+    total_height = sum(h for _, h in sizes)
+    
+    header_strip = _render_header(max_width, header.asset, header.scenario, header.date)
+    header_height = header_strip.size[1]
+    
+    logger.info(f"Потоковая склейка: {max_width}x{total_height + header_height} из {len(images)} изображений")
+    
+    # Белый фон, шапка сверху
+    canvas = Image.new("RGB", (max_width, total_height + header_height), (255, 255, 255))
+    canvas.paste(header_strip, (0, 0))
+    
+    # Проход 2: декодируем, вставляем и закрываем по одному
+    y_offset = header_height
+    for img_bytes, size in zip(images, sizes):
+        with Image.open(io.BytesIO(img_bytes)) as img:
+            if size != img.size and img.format == "JPEG":
+                img.draft("RGB", size)
+            
+            frame = img if img.mode == "RGB" else img.convert("RGB")
+            if frame.size != size:
+                frame = frame.resize(size, Image.Resampling.LANCZOS)
+            
+            x_offset = (max_width - size[0]) // 2
+            canvas.paste(frame, (x_offset, y_offset))
+            y_offset += size[1]
+            
+            del frame
     
-    return _save_to_bytes(final_collage)
+    logger.info(f"Добавлен заголовок: {header.asset} | {header.scenario} | {header.date}")
+    
+    return canvas
 
 
 def _load_images(images: list[bytes]) -> list[Image.Image]:
@@ -108,10 +190,19 @@ def _load_images(images: list[bytes]) -> list[Image.Image]:
     return pil_images
 
 
-def _stitch_images(pil_images: list[Image.Image]) -> Image.Image:
-    """Склеивает изображения вертикально."""
-    max_width = max(img.size[0] for img in pil_images)
-    total_height = sum(img.size[1] for img in pil_images)
+def _stitch_images(pil_images: list[Image.Image], target_width: int = 0) -> Image.Image:
+    """
+    Склеивает изображения вертикально.
+    
+    Изображения шире target_width уменьшаются с сохранением пропорций,
+    более узкие — центрируются.
+    """
+    sizes = [
+        scale_to_width(img.size[0], img.size[1], target_width)
+        for img in pil_images
+    ]
+    max_width = max(w for w, _ in sizes)
+    total_height = sum(h for _, h in sizes)
     
     logger.info(f"Склейка: {max_width}x{total_height} из {len(pil_images)} изображений")
     
@@ -119,10 +210,12 @@ def _stitch_images(pil_images: list[Image.Image]) -> Image.Image:
     collage = Image.new("RGB", (max_width, total_height), (255, 255, 255))
     
     y_offset = 0
-    for i, img in enumerate(pil_images):
-        x_offset = (max_width - img.size[0]) // 2
+    for img, size in zip(pil_images, sizes):
+        if size != img.size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        x_offset = (max_width - size[0]) // 2
         collage.paste(img, (x_offset, y_offset))
-        y_offset += img.size[1]
+        y_offset += size[1]
     
     return collage
 
@@ -131,19 +224,32 @@ def _add_header(collage: Image.Image, header: TradeHeader) -> Image.Image:
     """Добавляет заголовок с информацией о сделке."""
     collage_width, collage_height = collage.size
     
-    # Размеры заголовка (две строки с увеличенным отступом)
-    header_height = 110
-    padding = 30
+    header_strip = _render_header(collage_width, header.asset, header.scenario, header.date)
+    header_height = header_strip.size[1]
     
     # Создаём новый холст: header + collage
-    new_height = collage_height + header_height
-    final = Image.new("RGB", (collage_width, new_height), (18, 18, 24))  # Тёмный фон
-    
-    # Вставляем коллаж ниже заголовка
+    final = Image.new("RGB", (collage_width, collage_height + header_height))
+    final.paste(header_strip, (0, 0))
     final.paste(collage, (0, header_height))
     
-    # Рисуем заголовок
-    draw = ImageDraw.Draw(final)
+    logger.info(f"Добавлен заголовок: {header.asset} | {header.scenario} | {header.date}")
+    
+    return final
+
+
+@lru_cache(maxsize=config.HEADER_CACHE_SIZE)
+def _render_header(width: int, asset: str, scenario: str, date: str) -> Image.Image:
+    """
+    Рисует полосу заголовка заданной ширины.
+    
+    Результат кэшируется — возвращаемое изображение нельзя изменять.
+    """
+    # Размеры заголовка (две строки с увеличенным отступом)
+    header_height = 110
+    padding = 30
+    
+    strip = Image.new("RGB", (width, header_height), (18, 18, 24))  # Тёмный фон
+    draw = ImageDraw.Draw(strip)
     
     # Шрифты (увеличены)
     font_title = _get_font(36)
@@ -151,12 +257,12 @@ def _add_header(collage: Image.Image, header: TradeHeader) -> Image.Image:
     font_value = _get_font(26)
     
     # === СТРОКА 1: Заголовок по центру ===
-    title_text = f"Сделка {header.asset}"
+    title_text = f"Сделка {asset}"
     title_bbox = draw.textbbox((0, 0), title_text, font=font_title)
     title_width = title_bbox[2] - title_bbox[0]
     
     draw.text(
-        ((collage_width - title_width) // 2, 12),
+        ((width - title_width) // 2, 12),
         title_text,
         font=font_title,
         fill=(255, 255, 255)
@@ -174,15 +280,14 @@ def _add_header(collage: Image.Image, header: TradeHeader) -> Image.Image:
     )
     
     # Центр: значение сценария (в плашке)
-    scenario_text = header.scenario
-    scenario_bbox = draw.textbbox((0, 0), scenario_text, font=font_value)
+    scenario_bbox = draw.textbbox((0, 0), scenario, font=font_value)
     scenario_width = scenario_bbox[2] - scenario_bbox[0]
     scenario_height = scenario_bbox[3] - scenario_bbox[1]
     
     box_padding = 20
     box_width = scenario_width + box_padding * 2
     box_height = scenario_height + 16
-    box_x = (collage_width - box_width) // 2
+    box_x = (width - box_width) // 2
     box_y = row2_y - 5
     
     # Плашка
@@ -195,35 +300,21 @@ def _add_header(collage: Image.Image, header: TradeHeader) -> Image.Image:
     # Текст сценария
     draw.text(
         (box_x + box_padding, row2_y),
-        scenario_text,
+        scenario,
         font=font_value,
         fill=(255, 255, 255)
     )
     
     # Правая часть: Дата
-    date_text = f"Дата {header.date}"
+    date_text = f"Дата {date}"
     date_bbox = draw.textbbox((0, 0), date_text, font=font_label)
     date_width = date_bbox[2] - date_bbox[0]
     
     draw.text(
-        (collage_width - date_width - padding, row2_y),
+        (width - date_width - padding, row2_y),
         date_text,
         font=font_label,
         fill=(255, 255, 255)  # Белый
     )
     
-    logger.info(f"Добавлен заголовок: {header.asset} | {header.scenario} | {header.date}")
-    
-    return final
-
-
-def _save_to_bytes(image: Image.Image) -> bytes:
-    """Сохраняет изображение в байты JPEG."""
-    output = io.BytesIO()
-    image.save(output, format="JPEG", quality=95)
-    output.seek(0)
-    
-    result_bytes = output.getvalue()
-    logger.info(f"Коллаж сохранён: {len(result_bytes) / 1024:.1f} KB")
-    
-    return result_bytes
+    return strip
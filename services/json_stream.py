@@ -0,0 +1,100 @@
+"""
+Инкрементальный разбор JSON-объекта из потока токенов LLM.
+
+Модель печатает ответ по кусочкам; парсер отслеживает вложенность и строки
+и сообщает, как только первый JSON-объект закрыт — или как только в нём
+уже есть все нужные поля. Остаток потока (пояснения, markdown) можно
+не дожидаться.
+"""
+
+import json
+from typing import Optional
+
+
+class IncrementalJSONParser:
+    """
+    Ищет первый JSON-объект в потоке текста.
+
+    feed() возвращает словарь, когда объект закрыт или когда все поля
+    required уже получены целиком (проверяется на запятых верхнего уровня).
+    """
+
+    def __init__(self, required: tuple[str, ...] = ()):
+        self.required = required
+        self.result: Optional[dict] = None
+        self.failed = False
+
+        self._buffer: list[str] = []
+        self._length = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self) -> str:
+        """Весь полученный текст."""
+        return "".join(self._buffer)
+
+    @property
+    def done(self) -> bool:
+        """Разбор завершён (успешно или нет)."""
+        return self.result is not None or self.failed
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        """
+        Добавляет очередной кусок текста.
+
+        Returns:
+            Разобранный объект, как только он готов; иначе None
+        """
+        if self.done:
+            return self.result
+
+        offset = self._length
+        self._buffer.append(chunk)
+        self._length += len(chunk)
+
+        for index, char in enumerate(chunk, start=offset):
+            if self._start is None:
+                if char == "{":
+                    self._start = index
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = self._parse(self.text[self._start:index + 1])
+                    self.failed = self.result is None
+                    return self.result
+            elif char == "," and self._depth == 1 and self.required:
+                # Все нужные поля уже пришли — закрывающей скобки не ждём
+                partial = self._parse(self.text[self._start:index] + "}")
+                if partial is not None and all(key in partial for key in self.required):
+                    self.result = partial
+                    return self.result
+
+        return None
+
+    @staticmethod
+    def _parse(text: str) -> Optional[dict]:
+        """json.loads, None при ошибке или если это не объект."""
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,253 @@
+"""
+Кэш результатов извлечения данных о сделке через LLM.
+
+Одинаковые (после нормализации) описания не отправляются в OpenRouter
+повторно. Два уровня: LRU в памяти (микросекунды) и SQLite на диске
+(переживает перезапуск). Ключ — нормализованный текст, модель и хэш
+системного промпта: смена модели или промпта инвалидирует кэш.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Относительные даты: результат зависит от дня запроса
+# («вчера», «в пятницу», «на прошлой неделе», «3 дня назад», «пт»)
+_RELATIVE_DATE_RE = re.compile(
+    r"\b(?:сегодня|вчера|позавчера|завтра|послезавтра|на днях"
+    r"|понедельник|вторник|сред[аеуы]|четверг|пятниц|суббот|воскресень"
+    r"|недел|месяц|прошл|позапрошл|назад)"
+    r"|\b(?:пн|вт|ср|чт|пт|сб|вс)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_text(text: str) -> str:
+    """Текст для ключа кэша: регистр, ё/е, пробелы и пунктуация по краям не важны."""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" .,!?;:")
+
+
+def cache_key(text: str, model: str, system_prompt: str, today: Optional[date] = None) -> str:
+    """
+    Ключ кэша для описания сделки.
+
+    Для текстов с относительными датами («вчера», «в пятницу», «3 дня
+    назад») в ключ входит текущий день — вчерашний ответ для них уже неверен.
+    """
+    normalized = normalize_text(text)
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    day = ""
+    if _RELATIVE_DATE_RE.search(normalized):
+        day = (today or date.today()).isoformat()
+
+    payload = json.dumps([normalized, model, prompt_hash, day], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """Счётчики кэша."""
+    memory_hits: int = 0    # Найдено в памяти
+    disk_hits: int = 0      # Найдено в SQLite
+    misses: int = 0         # Не найдено (или устарело)
+    writes: int = 0         # Сохранено записей
+    evictions: int = 0      # Удалено из SQLite по размеру или TTL
+
+    @property
+    def hits(self) -> int:
+        """Всего попаданий."""
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля попаданий (0..1)."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LLMCache:
+    """
+    Двухуровневый кэш ответов LLM: LRU в памяти поверх SQLite.
+
+    Потокобезопасно: дисковые методы можно вызывать из asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        memory_items: int = 1024,
+        max_entries: int = 50000,
+        ttl: float = 30 * 24 * 3600,
+    ):
+        self.path = Path(path)
+        self.memory_items = max(0, memory_items)
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._db.commit()
+
+    @property
+    def stats(self) -> CacheStats:
+        """Снимок счётчиков."""
+        with self._lock:
+            return replace(self._stats)
+
+    def get_from_memory(self, key: str) -> Optional[dict]:
+        """Ищет только в памяти (без обращения к диску)."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+
+            created, value = entry
+            if time.time() - created > self.ttl:
+                del self._memory[key]
+                return None
+
+            self._memory.move_to_end(key)
+            self._stats.memory_hits += 1
+            return value
+
+    def get(self, key: str) -> Optional[dict]:
+        """Ищет в памяти, затем в SQLite. None — промах."""
+        value = self.get_from_memory(key)
+        if value is not None:
+            return value
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats.evictions += 1
+                self._stats.misses += 1
+                return None
+
+            self._db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._stats.disk_hits += 1
+
+            value = json.loads(row[0])
+            self._memory_put(key, row[1], value)
+            return value
+
+    def put(self, key: str, model: str, value: dict) -> None:
+        """Сохраняет ответ в оба уровня и вытесняет лишнее из SQLite."""
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, now, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, value, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._stats.writes += 1
+            self._evict(now)
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Очищает оба уровня."""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM llm_cache")
+            self._db.commit()
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite."""
+        with self._lock:
+            self._db.close()
+
+    def _evict(self, now: float) -> None:
+        """Удаляет устаревшие записи и самые давно использованные сверх лимита."""
+        expired = self._db.execute(
+            "DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,)
+        ).rowcount
+
+        count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        excess = max(0, count - self.max_entries)
+        if excess:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+        if expired or excess:
+            self._stats.evictions += expired + excess
+            logger.info(f"Кэш LLM: удалено {expired} устаревших и {excess} лишних записей")
+
+    def _memory_put(self, key: str, created: float, value: dict) -> None:
+        """Добавляет запись в LRU в памяти (вызывается под блокировкой)."""
+        if self.memory_items == 0:
+            return
+
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+
+# Экземпляр кэша (создаётся при первом обращении)
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """Получает общий кэш LLM (создаёт по настройкам из config)."""
+    global _cache
+
+    if _cache is None:
+        _cache = LLMCache(
+            path=config.LLM_CACHE_PATH,
+            memory_items=config.LLM_CACHE_MEMORY_ITEMS,
+            max_entries=config.LLM_CACHE_MAX_ENTRIES,
+            ttl=config.LLM_CACHE_TTL_HOURS * 3600,
+        )
+    return _cache
+
+
+def close_llm_cache() -> None:
+    """Закрывает общий кэш LLM."""
+    global _cache
+
+    if _cache is not None:
+        _cache.close()
+        _cache = None
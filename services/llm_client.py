@@ -0,0 +1,257 @@
+"""
+Асинхронный HTTP-клиент OpenRouter.
+
+Одна общая aiohttp-сессия с пулом keep-alive соединений на всё приложение:
+запросы к LLM не блокируют event loop и не открывают новое TLS-соединение
+на каждый вызов.
+"""
+
+import json
+import time
+from typing import Any, Optional
+
+import aiohttp
+
+from services.json_stream import IncrementalJSONParser
+from services.prompt_budget import estimate_tokens
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMClientError(Exception):
+    """Ошибка запроса к LLM (сеть, таймаут, некорректный ответ)."""
+
+
+class LLMHTTPError(LLMClientError):
+    """LLM вернул HTTP-статус, отличный от 200."""
+
+    def __init__(self, status: int, body: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after   # Заголовок Retry-After, секунды
+
+    @property
+    def retryable(self) -> bool:
+        """Повтор может помочь: лимит запросов или ошибка сервера."""
+        return self.status == 429 or self.status >= 500
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах (дата вместо числа не поддерживается)."""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class OpenRouterClient:
+    """
+    Клиент OpenRouter Chat Completions API.
+
+    Сессия создаётся лениво при первом запросе (внутри работающего event loop)
+    и переиспользуется до вызова close().
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://openrouter.ai/api/v1",
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        keepalive_timeout: float = 60.0,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Получает общую сессию (создаёт при первом обращении)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+            logger.info(
+                f"Сессия OpenRouter создана: {self.base_url}, "
+                f"соединений={self.max_connections}"
+            )
+        return self._session
+
+    async def chat_completion(
+        self,
+        payload: dict[str, Any],
+        stop_on_json: Optional[tuple[str, ...]] = None
+    ) -> dict[str, Any]:
+        """
+        Отправляет запрос /chat/completions.
+
+        С "stream": true в payload ответ читается потоком (SSE) и собирается
+        в тот же формат, что и обычный ответ.
+
+        Args:
+            payload: Тело запроса (model, messages, ...)
+            stop_on_json: Только для потока — закончить чтение, как только
+                в ответе появился JSON-объект с этими полями (остаток
+                генерации отменяется закрытием соединения). Разобранный
+                объект кладётся в ответ под ключом "parsed". Если usage
+                не пришёл (поток оборван раньше последнего события), токены
+                оцениваются локально, в usage ставится "estimated": true.
+
+        Returns:
+            JSON-ответ API
+
+        Raises:
+            LLMHTTPError: Статус ответа не 200
+            LLMClientError: Сетевая ошибка, таймаут или невалидный JSON
+        """
+        session = self._get_session()
+        url = f"{self.base_url}/chat/completions"
+
+        try:
+            async with session.post(url, json=payload) as response:
+                if response.status != 200:
+                    raise LLMHTTPError(
+                        response.status,
+                        await response.text(),
+                        _parse_retry_after(response.headers.get("Retry-After")),
+                    )
+                if payload.get("stream"):
+                    return await self._read_stream(response, payload, stop_on_json)
+                return await response.json(content_type=None)
+        except LLMClientError:
+            raise
+        except TimeoutError as e:
+            raise LLMClientError(f"Таймаут запроса ({self.timeout}с)") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            raise LLMClientError(str(e)) from e
+
+    async def _read_stream(
+        self,
+        response: aiohttp.ClientResponse,
+        payload: dict[str, Any],
+        stop_on_json: Optional[tuple[str, ...]]
+    ) -> dict[str, Any]:
+        """
+        Читает SSE-поток и собирает ответ в формате обычного completion.
+
+        При раннем завершении соединение закрывается, а не возвращается
+        в пул: недочитанный поток нельзя переиспользовать.
+        """
+        parser = IncrementalJSONParser(stop_on_json) if stop_on_json is not None else None
+        parts: list[str] = []
+        finish_reason: Optional[str] = None
+        usage: Optional[dict] = None
+        started = time.perf_counter()
+        first_token: Optional[float] = None
+
+        async for raw_line in response.content:
+            line = raw_line.strip()
+            # Пустые строки разделяют события, ":" — комментарии (keep-alive)
+            if not line.startswith(b"data:"):
+                continue
+
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise LLMClientError(f"Ошибка в потоке: {chunk['error']}")
+            usage = chunk.get("usage") or usage
+
+            for choice in chunk.get("choices") or []:
+                finish_reason = choice.get("finish_reason") or finish_reason
+                content = (choice.get("delta") or {}).get("content")
+                if not content:
+                    continue
+
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                parts.append(content)
+
+                if parser is not None and parser.feed(content) is not None:
+                    finish_reason = "early_stop"
+                    response.close()
+                    break
+
+            if finish_reason == "early_stop":
+                break
+
+        logger.debug(
+            f"Поток LLM: первый токен через {first_token or 0:.2f}с, "
+            f"всего {time.perf_counter() - started:.2f}с, завершение={finish_reason}"
+        )
+
+        message: dict[str, Any] = {"role": "assistant", "content": "".join(parts)}
+        result: dict[str, Any] = {"choices": [{"message": message, "finish_reason": finish_reason}]}
+        result["usage"] = usage if usage is not None else _estimate_usage(payload, message["content"])
+        if parser is not None and parser.result is not None:
+            result["parsed"] = parser.result
+        return result
+
+    async def close(self) -> None:
+        """Закрывает сессию и все соединения пула."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def _estimate_usage(payload: dict[str, Any], completion: str) -> dict[str, Any]:
+    """
+    Оценка usage, когда провайдер его не прислал (поток оборван раньше).
+
+    Токены ответа — только полученные: оборванная генерация могла быть
+    оплачена чуть больше.
+    """
+    prompt = sum(estimate_tokens(str(m.get("content") or "")) for m in payload.get("messages") or [])
+    completion_tokens = estimate_tokens(completion)
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt + completion_tokens,
+        "estimated": True,
+    }
+
+
+# Экземпляр клиента (создаётся при первом обращении)
+_client: Optional[OpenRouterClient] = None
+
+
+def get_llm_client() -> OpenRouterClient:
+    """Получает общий клиент OpenRouter (создаёт по настройкам из config)."""
+    global _client
+
+    if _client is None:
+        _client = OpenRouterClient(
+            api_key=config.OPENROUTER_API_KEY,
+            base_url=config.OPENROUTER_BASE_URL,
+            timeout=config.LLM_TIMEOUT,
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            keepalive_timeout=config.LLM_KEEPALIVE_TIMEOUT,
+        )
+    return _client
+
+
+async def close_llm_client() -> None:
+    """Закрывает общий клиент OpenRouter."""
+    global _client
+
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,390 @@
+"""
+Политика запросов к LLM: повторы, хеджирование, резервные модели.
+
+Один медленный или упавший ответ OpenRouter не должен оборачиваться
+полуминутным ожиданием пользователя:
+
+- повторы с экспоненциальной задержкой на 429 и 5xx (с учётом Retry-After);
+- хеджирование — если ответа нет дольше p95 для модели, параллельно
+  отправляется дубль запроса, побеждает первый успешный;
+- резервные модели по порядку (основная — config.LLM_MODEL);
+- если модель не поддерживает json_schema (HTTP 400), запрос к ней сразу
+  повторяется без response_format, и дальше она вызывается без схемы;
+- автомат-предохранитель (circuit breaker) на каждую модель;
+- общий дедлайн запроса.
+
+Каждая попытка записывается в метрики: модель, номер, дубль ли это,
+исход, задержка и токены из usage ответа.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from services.llm_client import LLMClientError, LLMHTTPError, OpenRouterClient, get_llm_client
+from utils.config import config
+from utils.logger import get_logger
+from utils.metrics import LatencyWindow
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class AttemptRecord:
+    """Одна попытка запроса к модели."""
+    model: str
+    attempt: int                # Номер попытки для этой модели (с 1)
+    hedge: bool                 # Дубль хеджирования
+    outcome: str                # ok | http_<код> | timeout | error | cancelled | circuit_open
+    latency: float              # Секунды
+    started_at: float           # time.time()
+    prompt_tokens: Optional[int] = None      # Из usage ответа (если провайдер прислал)
+    completion_tokens: Optional[int] = None
+    usage_estimated: bool = False            # usage не пришёл, токены оценены локально
+
+
+@dataclass
+class ModelStats:
+    """Счётчики по модели."""
+    attempts: int = 0
+    successes: int = 0
+    failures: int = 0
+    hedges: int = 0             # Отправлено дублей
+    hedge_wins: int = 0         # Дубль ответил раньше основного запроса
+    circuit_rejections: int = 0 # Запрос не отправлен: предохранитель разомкнут
+    prompt_tokens: int = 0      # Сумма по успешным ответам с usage
+    completion_tokens: int = 0
+    estimated_usage: int = 0    # Ответов, где usage оценён локально (поток оборван)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель модели.
+
+    После threshold неудач подряд размыкается: запросы к модели не
+    отправляются reset_timeout секунд. Затем пропускает пробный запрос —
+    успех замыкает, неудача снова размыкает.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 60.0):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"       # closed | open | half_open
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос."""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        return True
+
+    def record_success(self) -> None:
+        """Успешный ответ — предохранитель замыкается."""
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        """Неудача — при превышении порога предохранитель размыкается."""
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class LLMRequestPolicy:
+    """Выполняет chat completion по политике повторов, хеджирования и резервных моделей."""
+
+    def __init__(
+        self,
+        models: list[str],
+        client: Optional[OpenRouterClient] = None,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        attempt_timeout: float = 15.0,
+        deadline: float = 45.0,
+        hedge: bool = True,
+        hedge_min_delay: float = 1.0,
+        hedge_default_delay: float = 4.0,
+        hedge_min_samples: int = 10,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 60.0,
+    ):
+        if not models:
+            raise ValueError("Нужна хотя бы одна модель")
+
+        self.models = list(dict.fromkeys(models))
+        self._client = client
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+
+        self._breakers = {model: CircuitBreaker(breaker_threshold, breaker_reset) for model in self.models}
+        self._latency = {model: LatencyWindow() for model in self.models}
+        self._stats = {model: ModelStats() for model in self.models}
+        self._attempts: deque[AttemptRecord] = deque(maxlen=500)
+        self._no_schema: set[str] = set()     # Модели, отвергшие json_schema
+
+    @property
+    def client(self) -> OpenRouterClient:
+        """HTTP-клиент (по умолчанию — общий)."""
+        return self._client or get_llm_client()
+
+    @property
+    def recent_attempts(self) -> list[AttemptRecord]:
+        """Последние попытки (до 500)."""
+        return list(self._attempts)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """Метрики по моделям: счётчики, задержки, состояние предохранителя."""
+        return {
+            model: {
+                **asdict(self._stats[model]),
+                "latency": self._latency[model].summary(),
+                "hedge_delay": self.hedge_delay(model),
+                "breaker": self._breakers[model].state,
+                "structured": model not in self._no_schema,
+            }
+            for model in self.models
+        }
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Через сколько секунд без ответа отправлять дубль (None — не хеджировать)."""
+        if not self.hedge:
+            return None
+
+        window = self._latency[model]
+        if len(window) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, window.percentile(0.95))
+
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка с джиттером."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def chat_completion(self, payload: dict[str, Any], **options: Any) -> dict[str, Any]:
+        """
+        Отправляет запрос, перебирая модели по порядку.
+
+        Поле model в payload заменяется на текущую модель, options
+        передаются в OpenRouterClient.chat_completion (например, stop_on_json).
+        Модель, которая ответила, записывается в поле served_by ответа.
+
+        Raises:
+            LLMHTTPError: Последняя ошибка — HTTP-статус
+            LLMClientError: Все модели недоступны, дедлайн или сетевая ошибка
+        """
+        deadline = time.monotonic() + self.deadline
+        last_error: Optional[LLMClientError] = None
+
+        for model in self.models:
+            breaker = self._breakers[model]
+            if not breaker.allow():
+                self._stats[model].circuit_rejections += 1
+                self._record(AttemptRecord(model, 0, False, "circuit_open", 0.0, time.time()))
+                logger.warning(f"LLM {model}: предохранитель разомкнут, пропуск")
+                continue
+
+            attempt = 1
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise last_error or LLMClientError(f"Дедлайн запроса ({self.deadline}с)")
+
+                try:
+                    response = await self._hedged(model, self._model_payload(model, payload), options, attempt, remaining)
+                except LLMHTTPError as e:
+                    last_error = e
+                    if self._reject_schema(model, payload, e):
+                        # Сразу повтор без схемы — попытка не засчитывается
+                        continue
+                    if not e.retryable:
+                        # Ошибка запроса (4xx) — повтор не поможет, пробуем следующую модель
+                        break
+                    breaker.record_failure()
+                    delay = e.retry_after if e.retry_after is not None else self._backoff(attempt)
+                except LLMClientError as e:
+                    last_error = e
+                    breaker.record_failure()
+                    delay = self._backoff(attempt)
+                else:
+                    breaker.record_success()
+                    if model != self.models[0]:
+                        logger.info(f"Ответ получен от резервной модели {model}")
+                    response["served_by"] = model
+                    return response
+
+                # Долгое ожидание (Retry-After) — лучше сразу к резервной модели
+                if attempt > self.max_retries or delay > self.backoff_max or not breaker.allow():
+                    break
+                if time.monotonic() + delay >= deadline:
+                    break
+
+                logger.warning(f"LLM {model}: попытка {attempt} неудачна ({last_error}), повтор через {delay:.1f}с")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        raise last_error or LLMClientError("Все модели недоступны (предохранители разомкнуты)")
+
+    def _model_payload(self, model: str, payload: dict[str, Any]) -> dict[str, Any]:
+        """Тело запроса к модели (без response_format, если модель схему не поддерживает)."""
+        request = {**payload, "model": model}
+        if model in self._no_schema:
+            request.pop("response_format", None)
+        return request
+
+    def _reject_schema(self, model: str, payload: dict[str, Any], error: LLMHTTPError) -> bool:
+        """
+        HTTP 400 на запрос со схемой: модель запоминается как не
+        поддерживающая json_schema.
+
+        Returns:
+            True — запрос нужно повторить без схемы
+        """
+        if error.status != 400 or "response_format" not in payload or model in self._no_schema:
+            return False
+
+        self._no_schema.add(model)
+        logger.warning(f"LLM {model}: json_schema не поддерживается ({error.body[:200]}), повтор без structured outputs")
+        return True
+
+    async def _hedged(
+        self,
+        model: str,
+        payload: dict[str, Any],
+        options: dict[str, Any],
+        attempt: int,
+        remaining: float
+    ) -> dict[str, Any]:
+        """
+        Попытка с хеджированием.
+
+        Если основной запрос не ответил за hedge_delay, отправляется дубль.
+        Возвращается первый успешный ответ, проигравший отменяется.
+        """
+        timeout = min(self.attempt_timeout, remaining)
+        primary = asyncio.create_task(self._attempt(model, payload, options, attempt, False, timeout))
+        tasks = [primary]
+
+        try:
+            delay = self.hedge_delay(model)
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    logger.info(f"LLM {model}: нет ответа за {delay:.1f}с, отправляем дубль")
+                    self._stats[model].hedges += 1
+                    tasks.append(asyncio.create_task(
+                        self._attempt(model, payload, options, attempt, True, timeout - delay)
+                    ))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if primary not in succeeded:
+                        self._stats[model].hedge_wins += 1
+                    return succeeded[0].result()
+                error = next(iter(done)).exception()
+
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _attempt(
+        self,
+        model: str,
+        payload: dict[str, Any],
+        options: dict[str, Any],
+        attempt: int,
+        hedge: bool,
+        timeout: float
+    ) -> dict[str, Any]:
+        """Один HTTP-запрос с таймаутом и записью в метрики."""
+        stats = self._stats[model]
+        stats.attempts += 1
+        started, started_at = time.perf_counter(), time.time()
+        outcome = "error"
+        usage: dict[str, Any] = {}
+
+        try:
+            response = await asyncio.wait_for(self.client.chat_completion(payload, **options), timeout)
+            outcome = "ok"
+            usage = response.get("usage") or {}
+            return response
+        except TimeoutError:
+            outcome = "timeout"
+            raise LLMClientError(f"Таймаут попытки ({timeout:.1f}с)") from None
+        except LLMHTTPError as e:
+            outcome = f"http_{e.status}"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            prompt_tokens = usage.get("prompt_tokens")
+            completion_tokens = usage.get("completion_tokens")
+            estimated = bool(usage.get("estimated"))
+            if outcome == "ok":
+                stats.successes += 1
+                stats.prompt_tokens += prompt_tokens or 0
+                stats.completion_tokens += completion_tokens or 0
+                stats.estimated_usage += estimated
+                self._latency[model].add(latency)
+            elif outcome != "cancelled":
+                stats.failures += 1
+
+            self._record(AttemptRecord(
+                model, attempt, hedge, outcome, latency, started_at, prompt_tokens, completion_tokens, estimated
+            ))
+            tokens = f", токены {'~' if estimated else ''}{prompt_tokens}+{completion_tokens}" if usage else ""
+            logger.info(
+                f"LLM попытка: {model} #{attempt}{' (дубль)' if hedge else ''} → {outcome} за {latency:.2f}с{tokens}"
+            )
+
+    def _record(self, record: AttemptRecord) -> None:
+        """Сохраняет попытку в журнал метрик."""
+        self._attempts.append(record)
+
+
+# Экземпляр политики (создаётся при первом обращении)
+_policy: Optional[LLMRequestPolicy] = None
+
+
+def get_llm_policy() -> LLMRequestPolicy:
+    """Получает общую политику запросов (создаёт по настройкам из config)."""
+    global _policy
+
+    if _policy is None:
+        _policy = LLMRequestPolicy(
+            models=[config.LLM_MODEL, *config.LLM_FALLBACK_MODELS],
+            max_retries=config.LLM_MAX_RETRIES,
+            backoff_base=config.LLM_BACKOFF_BASE,
+            backoff_max=config.LLM_BACKOFF_MAX,
+            attempt_timeout=config.LLM_ATTEMPT_TIMEOUT,
+            deadline=config.LLM_DEADLINE,
+            hedge=config.LLM_HEDGE_ENABLED,
+            hedge_min_delay=config.LLM_HEDGE_MIN_DELAY,
+            hedge_default_delay=config.LLM_HEDGE_DEFAULT_DELAY,
+            breaker_threshold=config.LLM_BREAKER_THRESHOLD,
+            breaker_reset=config.LLM_BREAKER_RESET,
+        )
+        logger.info(f"Политика LLM: модели {_policy.models}, хеджирование={'вкл' if _policy.hedge else 'выкл'}")
+    return _policy
@@ -3,13 +3,20 @@
 Извлечение структурированных данных о сделке.
 """
 
+import asyncio
 import json
 import re
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional
-
-import requests
+from datetime import datetime
+from typing import Callable, Optional
 
+from services.llm_cache import cache_key, get_llm_cache
+from services.llm_client import LLMClientError, LLMHTTPError
+from services.llm_policy import get_llm_policy
+from services.prompt_budget import compact_prompt, estimate_tokens
+from services.rule_extractor import extract_rules, split_trade_segments
 from utils.config import config
 from utils.logger import get_logger
 
@@ -38,10 +45,83 @@ SYSTEM_PROMPT = """Ты помощник криптовалютного фьюч
 Ответь ТОЛЬКО валидным JSON без markdown:
 {"asset": "BTC/USDT", "scenario": "ЛП", "date": "03.10.2025"}"""
 
+# Поля, без которых ответ не нужен (по ним же останавливается поток)
+REQUIRED_FIELDS = ("asset", "scenario", "date")
+
+# JSON-схема ответа для structured outputs (response_format: json_schema)
+TRADE_INFO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "asset": {"type": "string", "description": "Тикер в формате BTC/USDT"},
+        "scenario": {"type": "string", "description": "ЛП, ЛПП, Пробой, Ретест или другое"},
+        "date": {"type": "string", "description": "Дата DD.MM.YYYY или \"не указана\""},
+    },
+    "required": list(REQUIRED_FIELDS),
+    "additionalProperties": False,
+}
+
+BULK_SYSTEM_PROMPT = """Ты помощник криптовалютного фьючерсного трейдера. Тебе дан пронумерованный список описаний сделок.
+
+Для КАЖДОГО описания извлеки:
+1. Актив (тикер) — формат: BTC/USDT, ETH/USDT и т.д.
+2. Сценарий — тип входа: ЛП, ЛПП, Пробой, Ретест, или другое
+3. Дата — формат: DD.MM.YYYY
+
+Если информация не указана явно, попробуй определить из контекста описания.
+Если дата не указана, используй "не указана".
+
+Ответь ТОЛЬКО валидным JSON без markdown, по одному объекту на каждый номер:
+{"trades": [{"index": 1, "asset": "BTC/USDT", "scenario": "ЛП", "date": "03.10.2025"}]}"""
+
+BULK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "trades": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer", "description": "Номер описания в списке"},
+                    **TRADE_INFO_SCHEMA["properties"],
+                },
+                "required": ["index", *REQUIRED_FIELDS],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["trades"],
+    "additionalProperties": False,
+}
+
+_ASSET_RE = re.compile(r"^[A-Z0-9]{2,15}/[A-Z0-9]{2,10}$")
+
+
+@dataclass
+class LLMCallRecord:
+    """Один запрос к LLM (со всеми повторами и дублями)."""
+    kind: str                           # single | bulk
+    latency: float                      # Секунды до ответа
+    estimated_prompt_tokens: int        # Оценка по тексту сообщений
+    prompt_tokens: Optional[int]        # Из usage (None — провайдер не прислал)
+    completion_tokens: Optional[int]
+    usage_estimated: bool = False       # usage оценён локально (поток оборван до него)
+
+
+# Последние запросы — для оценки экономии от сжатия промптов
+_calls: deque[LLMCallRecord] = deque(maxlen=500)
+
 
-def extract_trade_info(text: str) -> Optional[TradeInfo]:
+def recent_llm_calls() -> list[LLMCallRecord]:
+    """Последние запросы к LLM (до 500)."""
+    return list(_calls)
+
+
+async def extract_trade_info(text: str) -> Optional[TradeInfo]:
     """
-    Извлекает информацию о сделке из текста через LLM.
+    Извлекает информацию о сделке из текста.
+    
+    Сначала текст разбирается локальными правилами; если они уверены
+    во всех полях — LLM не вызывается. Иначе — кэш, затем OpenRouter.
     
     Args:
         text: Текст описания сделки (от пользователя)
@@ -49,58 +129,370 @@ def extract_trade_info(text: str) -> Optional[TradeInfo]:
     Returns:
         TradeInfo с извлечёнными данными или None при ошибке
     """
+    info, key = await _extract_local(text)
+    if info is not None:
+        return info
+    
     if not config.OPENROUTER_API_KEY:
         logger.error("OPENROUTER_API_KEY не задан")
         return None
     
-    logger.info(f"Отправка в LLM: {text[:100]}...")
-    
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": config.LLM_MODEL,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": f"Извлеки данные из этого описания сделки:\n\n{text}"}
-        ],
-        "temperature": 0,
-        "max_tokens": 200
-    }
+    prompt = _compact(text)
+    logger.info(f"Отправка в LLM: {prompt[:100]}...")
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = await _request_completion(lambda structured: _build_payload(prompt, structured), "single")
         
-        if response.status_code != 200:
-            logger.error(f"Ошибка OpenRouter: {response.status_code} - {response.text}")
-            return None
-        
-        answer = response.json()['choices'][0]['message']['content']
+        answer = response['choices'][0]['message']['content']
         logger.info(f"Ответ LLM: {answer}")
         
-        data = _parse_json_response(answer)
+        # В потоке объект уже разобран инкрементально
+        data = response.get("parsed") or _parse_json_response(answer)
         
         if data:
-            return TradeInfo(
-                asset=data.get("asset", "Не указан"),
-                scenario=data.get("scenario", "Не указан"),
-                date=data.get("date", "Не указана"),
-                raw_text=text
-            )
+            if key is not None:
+                await _cache_store(key, data, response.get("served_by", config.LLM_MODEL))
+            return _to_trade_info(data, text)
         
         return None
         
-    except requests.RequestException as e:
+    except LLMHTTPError as e:
+        logger.error(f"Ошибка OpenRouter: {e.status} - {e.body}")
+        return None
+    except LLMClientError as e:
         logger.error(f"Ошибка запроса к OpenRouter: {e}")
         return None
-    except (KeyError, json.JSONDecodeError) as e:
+    except (KeyError, IndexError, TypeError) as e:
         logger.error(f"Ошибка парсинга ответа: {e}")
         return None
 
 
+@dataclass
+class BulkExtraction:
+    """Результат пакетного извлечения."""
+    segments: list[str]                     # Описания отдельных сделок
+    trades: list[Optional[TradeInfo]]      # По одному на описание, None — не распознано
+    llm_calls: int = 0                      # Запросов к LLM (пакетный + повторы)
+    retried: int = 0                        # Описаний, повторённых по одному
+    
+    @property
+    def extracted(self) -> int:
+        """Сколько сделок распознано."""
+        return sum(trade is not None for trade in self.trades)
+
+
+async def extract_trades_bulk(text: str) -> BulkExtraction:
+    """
+    Извлекает несколько сделок из одного текста.
+    
+    Текст делится на описания; разобранные правилами или найденные в кэше
+    в LLM не отправляются. Остальные уходят одним пакетным запросом,
+    каждая запись ответа проверяется. Не прошедшие проверку (или
+    пропущенные моделью) повторяются по одному через extract_trade_info.
+    
+    Args:
+        text: Текст с описаниями нескольких сделок
+    
+    Returns:
+        BulkExtraction: описания и сделки в том же порядке
+    """
+    segments = split_trade_segments(text, config.BULK_MAX_TRADES)
+    result = BulkExtraction(segments=segments, trades=[None] * len(segments))
+    keys: list[Optional[str]] = [None] * len(segments)
+    
+    for index, segment in enumerate(segments):
+        result.trades[index], keys[index] = await _extract_local(segment)
+    
+    pending = [index for index, trade in enumerate(result.trades) if trade is None]
+    if not pending or not config.OPENROUTER_API_KEY:
+        return result
+    
+    if len(pending) > 1:
+        records, model = await _request_bulk([segments[index] for index in pending])
+        result.llm_calls += 1
+        
+        for position, index in enumerate(pending, start=1):
+            data = records.get(position)
+            problems = validate_trade_data(data)
+            if problems:
+                logger.info(f"Пакет: запись {position} отклонена ({', '.join(problems)}), повтор по одной")
+                continue
+            
+            result.trades[index] = _to_trade_info(data, segments[index])
+            if keys[index] is not None:
+                await _cache_store(keys[index], data, model)
+    
+    failed = [index for index in pending if result.trades[index] is None]
+    if failed:
+        result.retried = len(failed) if len(pending) > 1 else 0
+        result.llm_calls += len(failed)
+        retries = await asyncio.gather(*(extract_trade_info(segments[index]) for index in failed))
+        for index, info in zip(failed, retries):
+            if info is not None and not validate_trade_data(vars(info)):
+                result.trades[index] = info
+    
+    logger.info(
+        f"Пакетное извлечение: {result.extracted}/{len(segments)} сделок, "
+        f"запросов к LLM {result.llm_calls}, повторов {result.retried}"
+    )
+    return result
+
+
+def validate_trade_data(data: Optional[dict]) -> list[str]:
+    """
+    Проверяет запись о сделке из ответа LLM.
+    
+    Returns:
+        Список проблем (пустой — запись корректна)
+    """
+    if not isinstance(data, dict):
+        return ["нет записи"]
+    
+    problems = []
+    asset = data.get("asset")
+    if not isinstance(asset, str) or not _ASSET_RE.match(asset):
+        problems.append(f"актив {asset!r}")
+    
+    scenario = data.get("scenario")
+    if not isinstance(scenario, str) or not scenario.strip():
+        problems.append(f"сценарий {scenario!r}")
+    
+    trade_date = data.get("date")
+    if not isinstance(trade_date, str):
+        problems.append(f"дата {trade_date!r}")
+    elif trade_date.lower() != "не указана":
+        try:
+            datetime.strptime(trade_date, "%d.%m.%Y")
+        except ValueError:
+            problems.append(f"дата {trade_date!r}")
+    
+    return problems
+
+
+async def _extract_local(text: str) -> tuple[Optional[TradeInfo], Optional[str]]:
+    """
+    Извлечение без запроса к LLM: правила, затем кэш.
+    
+    Returns:
+        (TradeInfo или None, ключ кэша для сохранения ответа LLM или None)
+    """
+    if config.RULE_EXTRACTOR_ENABLED:
+        rules = extract_rules(text)
+        if rules.confidence >= config.RULE_EXTRACTOR_MIN_CONFIDENCE:
+            logger.info(
+                f"Локальное извлечение (уверенность {rules.confidence:.2f}): "
+                f"{rules.asset}, {rules.scenario}, {rules.date}"
+            )
+            info = TradeInfo(asset=rules.asset, scenario=rules.scenario, date=rules.date, raw_text=text)
+            return info, None
+        logger.info(f"Правила не уверены ({rules.fields}), запрос к LLM")
+    
+    if not config.LLM_CACHE_ENABLED:
+        return None, None
+    
+    key = cache_key(text, config.LLM_MODEL, SYSTEM_PROMPT)
+    data = await _cache_lookup(key)
+    if data is not None:
+        logger.info(f"Ответ LLM из кэша: {data}")
+        return _to_trade_info(data, text), None
+    return None, key
+
+
+async def _request_bulk(segments: list[str]) -> tuple[dict[int, dict], Optional[str]]:
+    """
+    Один запрос к LLM на несколько описаний.
+    
+    Returns:
+        (записи ответа по номеру описания (с 1), ответившая модель);
+        при ошибке — пустой словарь и None
+    """
+    logger.info(f"Пакетный запрос к LLM: {len(segments)} описаний")
+    
+    try:
+        prompts = [_compact(segment) for segment in segments]
+        response = await _request_completion(lambda structured: _build_bulk_payload(prompts, structured), "bulk")
+        answer = response['choices'][0]['message']['content']
+    except LLMHTTPError as e:
+        logger.error(f"Ошибка OpenRouter (пакет): {e.status} - {e.body}")
+        return {}, None
+    except LLMClientError as e:
+        logger.error(f"Ошибка пакетного запроса к OpenRouter: {e}")
+        return {}, None
+    except (KeyError, IndexError, TypeError) as e:
+        logger.error(f"Ошибка парсинга пакетного ответа: {e}")
+        return {}, None
+    
+    logger.info(f"Пакетный ответ LLM: {answer}")
+    
+    parsed = _parse_bulk_response(answer)
+    if parsed is None:
+        return {}, None
+    
+    records: dict[int, dict] = {}
+    for position, item in enumerate(parsed, start=1):
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index")
+        # Без номера — по порядку в ответе
+        records.setdefault(index if isinstance(index, int) else position, item)
+    return records, response.get("served_by", config.LLM_MODEL)
+
+
+def _build_bulk_payload(segments: list[str], structured: bool) -> dict:
+    """Тело пакетного запроса: пронумерованный список описаний."""
+    numbered = "\n".join(f"{number}. {segment}" for number, segment in enumerate(segments, start=1))
+    payload = {
+        "model": config.LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": BULK_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Извлеки данные из этих описаний сделок:\n\n{numbered}"}
+        ],
+        "temperature": 0,
+        "max_tokens": 60 * len(segments) + 50,
+        "usage": {"include": True}
+    }
+    
+    if structured:
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "trade_batch", "strict": True, "schema": BULK_SCHEMA},
+        }
+    
+    return payload
+
+
+def _parse_bulk_response(text: str) -> Optional[list]:
+    """Извлекает список trades из пакетного ответа LLM."""
+    start, end = text.find("{"), text.rfind("}")
+    for candidate in (text, text[start:end + 1] if 0 <= start < end else None):
+        if candidate is None:
+            continue
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict) and isinstance(data.get("trades"), list):
+            return data["trades"]
+    
+    logger.warning(f"Не удалось распарсить пакетный ответ: {text[:500]}")
+    return None
+
+
+def _build_payload(text: str, structured: bool) -> dict:
+    """Тело запроса к OpenRouter."""
+    payload = {
+        "model": config.LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Извлеки данные из этого описания сделки:\n\n{text}"}
+        ],
+        "temperature": 0,
+        "max_tokens": 200,
+        # Учёт токенов OpenRouter: usage приходит и в потоке (последним событием)
+        "usage": {"include": True}
+    }
+    
+    if config.LLM_STREAMING:
+        payload["stream"] = True
+    
+    if structured:
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "trade_info", "strict": True, "schema": TRADE_INFO_SCHEMA},
+        }
+    
+    return payload
+
+
+async def _request_completion(build: Callable[[bool], dict], kind: str) -> dict:
+    """
+    Запрос к LLM через политику повторов.
+    
+    build(structured) собирает тело запроса, kind — метка для метрик.
+    Задержка и токены (из usage) записываются в recent_llm_calls().
+    В потоковом режиме поток обрывается, как только пришли все поля.
+    Если модель не поддерживает json_schema (HTTP 400), политика
+    повторяет запрос к ней без схемы, не переходя к резервной модели.
+    """
+    payload = build(config.LLM_STRUCTURED_OUTPUT)
+    options = {"stop_on_json": REQUIRED_FIELDS} if payload.get("stream") else {}
+    started = time.perf_counter()
+    
+    response = await get_llm_policy().chat_completion(payload, **options)
+    
+    usage = response.get("usage") or {}
+    record = LLMCallRecord(
+        kind=kind,
+        latency=time.perf_counter() - started,
+        estimated_prompt_tokens=sum(estimate_tokens(m["content"]) for m in payload["messages"]),
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        usage_estimated=bool(usage.get("estimated")),
+    )
+    _calls.append(record)
+    logger.info(
+        f"Запрос к LLM ({kind}): {record.latency:.2f}с, токены {'~' if record.usage_estimated else ''}"
+        f"{record.prompt_tokens if record.prompt_tokens is not None else f'~{record.estimated_prompt_tokens}'}"
+        f"+{record.completion_tokens if record.completion_tokens is not None else '?'}"
+    )
+    return response
+
+
+def _compact(text: str) -> str:
+    """Сжимает описание до LLM_MAX_INPUT_TOKENS (если сжатие включено)."""
+    if not config.LLM_PROMPT_COMPACTION:
+        return text
+    
+    prompt = compact_prompt(text, config.LLM_MAX_INPUT_TOKENS)
+    if prompt.saved > 0:
+        logger.info(
+            f"Сжатие промпта: ~{prompt.original_tokens} → ~{prompt.tokens} токенов, "
+            f"отброшено предложений: {prompt.dropped}{', обрезано' if prompt.truncated else ''}"
+        )
+    return prompt.text
+
+
+def _to_trade_info(data: dict, text: str) -> TradeInfo:
+    """Собирает TradeInfo из ответа LLM."""
+    return TradeInfo(
+        asset=data.get("asset", "Не указан"),
+        scenario=data.get("scenario", "Не указан"),
+        date=data.get("date", "Не указана"),
+        raw_text=text
+    )
+
+
+async def _cache_lookup(key: str) -> Optional[dict]:
+    """Ищет ответ в кэше: память — сразу, SQLite — в отдельном потоке."""
+    cache = get_llm_cache()
+    try:
+        data = cache.get_from_memory(key)
+        if data is None:
+            data = await asyncio.to_thread(cache.get, key)
+        return data
+    except Exception as e:
+        # Сломанный кэш не должен ломать извлечение
+        logger.warning(f"Ошибка чтения кэша LLM: {e}")
+        return None
+
+
+async def _cache_store(key: str, data: dict, model: Optional[str]) -> None:
+    """
+    Сохраняет ответ в кэш.
+    
+    Ключ кэша считается по основной модели, поэтому ответы резервных
+    моделей не сохраняются: иначе они выдавались бы за ответы основной.
+    """
+    if model != config.LLM_MODEL:
+        logger.info(f"Ответ резервной модели {model} в кэш не сохраняется")
+        return
+    
+    try:
+        await asyncio.to_thread(get_llm_cache().put, key, config.LLM_MODEL, data)
+    except Exception as e:
+        logger.warning(f"Ошибка записи в кэш LLM: {e}")
+
+
 def _parse_json_response(text: str) -> Optional[dict]:
     """Извлекает JSON из ответа LLM."""
     try:
@@ -0,0 +1,211 @@
+"""
+Политика вывода коллажей.
+
+Подбирает размер и параметры кодирования так, чтобы коллаж укладывался
+в ограничения Telegram для фото. Если это невозможно (или нужен результат
+без потерь) — коллаж отправляется документом.
+"""
+
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image
+
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Ограничения Telegram для sendPhoto
+TELEGRAM_PHOTO_MAX_BYTES = 10 * 1024 * 1024
+TELEGRAM_PHOTO_MAX_SIDES = 10000     # Сумма ширины и высоты
+TELEGRAM_PHOTO_MAX_RATIO = 20        # Соотношение сторон
+
+# Ограничение для sendDocument
+TELEGRAM_DOCUMENT_MAX_BYTES = 50 * 1024 * 1024
+
+OUTPUT_FORMATS = ("jpeg", "webp")
+
+
+@dataclass(frozen=True)
+class OutputPolicy:
+    """Параметры вывода коллажа."""
+    target_width: int = 1280            # Максимальная ширина (0 — без уменьшения)
+    max_bytes: int = 5 * 1024 * 1024    # Бюджет размера файла
+    format: str = "jpeg"                # jpeg | webp
+    min_quality: int = 50
+    max_quality: int = 95
+    lossless: bool = False              # Без потерь (PNG, отправка документом)
+
+    @classmethod
+    def from_config(cls) -> "OutputPolicy":
+        """Создаёт политику по настройкам из config."""
+        output_format = config.COLLAGE_FORMAT.lower()
+        if output_format not in OUTPUT_FORMATS:
+            logger.warning(f"Неизвестный формат коллажа {output_format}, используется jpeg")
+            output_format = "jpeg"
+
+        return cls(
+            target_width=config.COLLAGE_TARGET_WIDTH,
+            max_bytes=min(config.COLLAGE_MAX_KB * 1024, TELEGRAM_PHOTO_MAX_BYTES),
+            format=output_format,
+            lossless=config.COLLAGE_LOSSLESS,
+        )
+
+
+@dataclass
+class EncodedImage:
+    """Закодированный коллаж."""
+    data: bytes
+    format: str                 # jpeg | webp | png
+    width: int
+    height: int
+    quality: Optional[int]      # None для lossless
+    as_document: bool           # Отправлять документом, а не фото
+
+    @property
+    def filename(self) -> str:
+        """Имя файла для отправки."""
+        extension = "jpg" if self.format == "jpeg" else self.format
+        return f"trade_collage.{extension}"
+
+
+def scale_to_width(width: int, height: int, target_width: int) -> tuple[int, int]:
+    """Размеры после уменьшения до target_width (с сохранением пропорций)."""
+    if target_width <= 0 or width <= target_width:
+        return width, height
+    return target_width, max(1, round(height * target_width / width))
+
+
+def fits_photo_limits(width: int, height: int) -> bool:
+    """Подходят ли размеры под ограничения Telegram для фото."""
+    ratio = max(width, height) / max(1, min(width, height))
+    return width + height <= TELEGRAM_PHOTO_MAX_SIDES and ratio <= TELEGRAM_PHOTO_MAX_RATIO
+
+
+def encode_image(image: Image.Image, policy: OutputPolicy) -> EncodedImage:
+    """
+    Кодирует изображение по политике вывода.
+
+    1. Lossless — PNG, всегда документом (в пределах лимита документа).
+    2. Размеры уменьшаются до лимита Telegram (сумма сторон).
+    3. Бинарный поиск максимального качества в пределах бюджета.
+       Если не помещается даже с минимальным качеством — уменьшаем изображение.
+    4. Слишком вытянутое изображение (соотношение сторон) — документом.
+    5. Не помещается в бюджет фото даже после уменьшения — документом
+       (исходного размера, с лимитом Telegram для документов).
+
+    Raises:
+        ValueError: Изображение не помещается в лимит документа
+    """
+    if policy.lossless:
+        data = _encode(image, "png", None)
+        if len(data) > TELEGRAM_DOCUMENT_MAX_BYTES:
+            raise ValueError(
+                f"Коллаж без потерь ({len(data) / 1024 / 1024:.1f} MB) больше лимита документа "
+                f"{TELEGRAM_DOCUMENT_MAX_BYTES / 1024 / 1024:.0f} MB"
+            )
+        logger.info(f"Коллаж сохранён без потерь: {len(data) / 1024:.1f} KB (документ)")
+        return EncodedImage(
+            data=data,
+            format="png",
+            width=image.size[0],
+            height=image.size[1],
+            quality=None,
+            as_document=True,
+        )
+
+    # Сумма сторон не должна превышать лимит Telegram: уменьшаем до проверки,
+    # иначе высокий коллаж ушёл бы документом вместо фото
+    width, height = image.size
+    sides = width + height
+    if sides > TELEGRAM_PHOTO_MAX_SIDES:
+        scale = TELEGRAM_PHOTO_MAX_SIDES / sides
+        new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        if fits_photo_limits(*new_size):
+            image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+    # Соотношение сторон уменьшением не исправить — такие коллажи документом
+    as_document = not fits_photo_limits(*image.size)
+
+    max_bytes = policy.max_bytes if not as_document else TELEGRAM_DOCUMENT_MAX_BYTES
+    full_size = image
+
+    while True:
+        quality, data = _search_quality(image, policy, max_bytes)
+        if data is not None or min(image.size) < 200:
+            break
+
+        # Даже минимальное качество не помещается — уменьшаем на 20%
+        new_size = (int(image.size[0] * 0.8), int(image.size[1] * 0.8))
+        logger.info(f"Коллаж не помещается в {max_bytes / 1024:.0f} KB, уменьшаем до {new_size[0]}x{new_size[1]}")
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+    if data is None and not as_document:
+        # В бюджет фото не помещается — отправляем документом без уменьшения
+        logger.info(f"Коллаж не помещается в {max_bytes / 1024:.0f} KB как фото, отправляем документом")
+        as_document = True
+        max_bytes = TELEGRAM_DOCUMENT_MAX_BYTES
+        image = full_size
+        quality, data = _search_quality(image, policy, max_bytes)
+
+    if data is None:
+        raise ValueError(f"Коллаж не помещается в {max_bytes / 1024 / 1024:.0f} MB даже с минимальным качеством")
+
+    logger.info(
+        f"Коллаж сохранён: {len(data) / 1024:.1f} KB, {image.size[0]}x{image.size[1]}, "
+        f"{policy.format} q={quality}{' (документ)' if as_document else ''}"
+    )
+
+    return EncodedImage(
+        data=data,
+        format=policy.format,
+        width=image.size[0],
+        height=image.size[1],
+        quality=quality,
+        as_document=as_document,
+    )
+
+
+def _search_quality(
+    image: Image.Image,
+    policy: OutputPolicy,
+    max_bytes: int,
+) -> tuple[Optional[int], Optional[bytes]]:
+    """Бинарный поиск максимального качества, укладывающегося в бюджет."""
+    low, high = policy.min_quality, policy.max_quality
+    best_quality: Optional[int] = None
+    best_data: Optional[bytes] = None
+
+    # Обычно максимальное качество сразу помещается — проверяем его первым
+    data = _encode(image, policy.format, high)
+    if len(data) <= max_bytes:
+        return high, data
+    high -= 1
+
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, policy.format, quality)
+
+        if len(data) <= max_bytes:
+            best_quality, best_data = quality, data
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    return best_quality, best_data
+
+
+def _encode(image: Image.Image, output_format: str, quality: Optional[int]) -> bytes:
+    """Кодирует изображение в байты."""
+    output = io.BytesIO()
+
+    if output_format == "png":
+        image.save(output, format="PNG", optimize=True)
+    elif output_format == "webp":
+        image.save(output, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+
+    return output.getvalue()
@@ -0,0 +1,188 @@
+"""
+Фоновая предзагрузка скриншотов.
+
+Скачивание каждого скриншота начинается сразу после его получения,
+поэтому к нажатию «Готово» большая часть файлов уже загружена.
+
+Загруженные байты живут в памяти только до collect: черновики, брошенные
+без /cancel, удаляются по сроку бездействия, а число файлов одного
+пользователя ограничено.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from aiogram import Bot
+
+from services.downloader import DownloadResult, FileDownload, download_file
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ScreenshotPrefetcher:
+    """
+    Трекер фоновых загрузок скриншотов по пользователям.
+
+    Для каждого пользователя хранит задачи загрузки в порядке получения
+    file_id. Общее число одновременных загрузок ограничено семафором.
+    Пользователи без новых скриншотов дольше ttl секунд вытесняются,
+    у одного пользователя хранится не больше max_files загрузок (старые
+    вытесняются; collect скачает их заново).
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        retries: int = 2,
+        retry_delay: float = 0.5,
+        ttl: float = 1800.0,
+        max_files: int = 20,
+    ):
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.ttl = ttl
+        self.max_files = max(1, max_files)
+
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._tasks: dict[int, dict[str, asyncio.Task[FileDownload]]] = {}
+        self._touched: dict[int, float] = {}   # Последний start пользователя (time.monotonic)
+
+    def start(self, bot: Bot, user_id: int, file_id: str) -> None:
+        """Запускает фоновую загрузку файла для пользователя."""
+        self.evict_expired()
+        self._touched[user_id] = time.monotonic()
+
+        user_tasks = self._tasks.setdefault(user_id, {})
+        if file_id in user_tasks:
+            return
+
+        while len(user_tasks) >= self.max_files:
+            oldest = next(iter(user_tasks))
+            user_tasks.pop(oldest).cancel()
+            logger.debug(f"Предзагрузка {oldest} пользователя {user_id} вытеснена (лимит {self.max_files})")
+
+        task = asyncio.create_task(
+            self._download(bot, file_id),
+            name=f"prefetch:{user_id}:{file_id}",
+        )
+        task.add_done_callback(self._on_task_done)
+        user_tasks[file_id] = task
+
+    def evict_expired(self) -> int:
+        """
+        Удаляет загрузки пользователей, бездействующих дольше ttl.
+
+        Returns:
+            Количество вытесненных пользователей
+        """
+        deadline = time.monotonic() - self.ttl
+        expired = [user_id for user_id, touched in self._touched.items() if touched < deadline]
+        for user_id in expired:
+            self.cancel(user_id)
+
+        if expired:
+            logger.info(f"Предзагрузка: удалены брошенные черновики {len(expired)} пользователей")
+        return len(expired)
+
+    async def _download(self, bot: Bot, file_id: str) -> FileDownload:
+        """Скачивает файл с учётом общего лимита загрузок."""
+        async with self._semaphore:
+            return await download_file(bot, file_id, self.retries, self.retry_delay)
+
+    @staticmethod
+    def _on_task_done(task: asyncio.Task) -> None:
+        """Забирает исключение у завершившейся задачи, чтобы оно не терялось."""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.warning(f"Ошибка предзагрузки ({task.get_name()}): {error}")
+
+    def pending(self, user_id: int) -> int:
+        """Количество ещё не завершённых загрузок пользователя."""
+        return sum(1 for task in self._tasks.get(user_id, {}).values() if not task.done())
+
+    async def collect(self, bot: Bot, user_id: int, file_ids: list[str]) -> DownloadResult:
+        """
+        Возвращает содержимое файлов пользователя в порядке file_ids.
+
+        Ожидает только ещё не завершённые загрузки. Файлы без задачи
+        (или с неудачной предзагрузкой) скачиваются заново.
+        """
+        started = time.perf_counter()
+        user_tasks = self._tasks.pop(user_id, {})
+        self._touched.pop(user_id, None)
+        pending = sum(1 for task in user_tasks.values() if not task.done())
+
+        async def _resolve(file_id: str) -> FileDownload:
+            task = user_tasks.get(file_id)
+            if task is not None:
+                try:
+                    return await task
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        raise
+                except Exception:
+                    pass
+            return await self._download(bot, file_id)
+
+        try:
+            files = await asyncio.gather(*(_resolve(fid) for fid in file_ids))
+        except BaseException:
+            for task in user_tasks.values():
+                task.cancel()
+            raise
+
+        result = DownloadResult(files=list(files), total_latency=time.perf_counter() - started)
+        per_file = ", ".join(f"{latency * 1000:.0f}" for latency in result.latencies)
+        retried = sum(1 for f in result.files if f.attempts > 1)
+        logger.info(
+            f"Предзагрузка пользователя {user_id}: {len(file_ids)} файлов, "
+            f"ожидалось {pending}, готово за {result.total_latency * 1000:.0f} мс "
+            f"(по файлам, мс: {per_file}; с повторами: {retried})"
+        )
+
+        return result
+
+    def cancel(self, user_id: int) -> int:
+        """
+        Отменяет все загрузки пользователя.
+
+        Returns:
+            Количество отменённых (ещё не завершённых) задач
+        """
+        user_tasks = self._tasks.pop(user_id, {})
+        self._touched.pop(user_id, None)
+        cancelled = 0
+
+        for task in user_tasks.values():
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+
+        if cancelled:
+            logger.info(f"Отменено {cancelled} предзагрузок пользователя {user_id}")
+
+        return cancelled
+
+
+# Экземпляр трекера (создаётся при первом обращении)
+_prefetcher: Optional[ScreenshotPrefetcher] = None
+
+
+def get_prefetcher() -> ScreenshotPrefetcher:
+    """Получает общий трекер предзагрузки (создаёт по настройкам из config)."""
+    global _prefetcher
+
+    if _prefetcher is None:
+        _prefetcher = ScreenshotPrefetcher(
+            concurrency=config.PREFETCH_CONCURRENCY,
+            retries=config.DOWNLOAD_RETRIES,
+            retry_delay=config.DOWNLOAD_RETRY_DELAY,
+            ttl=config.PREFETCH_TTL,
+            max_files=config.PREFETCH_MAX_FILES,
+        )
+    return _prefetcher
@@ -0,0 +1,184 @@
+"""
+Бюджет токенов для описания сделки.
+
+Длинные голосовые разборы уходили в LLM целиком, хотя для извлечения нужны
+только актив, сценарий и дата. Перед запросом текст сжимается:
+
+- убираются слова-паразиты и повторы, типичные для расшифровки Whisper;
+- если текст всё ещё больше лимита, остаются предложения с тикерами,
+  датами и сценариями (в исходном порядке), остальные отбрасываются.
+
+Токены оцениваются приближённо, без токенизатора конкретной модели.
+"""
+
+import math
+import re
+import threading
+from dataclasses import dataclass, replace
+
+from services.llm_cache import normalize_text
+from services.rule_extractor import extract_asset, extract_date, extract_scenario
+
+# Слова-паразиты устной речи (только целыми словами)
+FILLERS = (
+    "ну", "вот", "типа", "короче", "значит", "как бы", "в общем", "в общем-то",
+    "так сказать", "собственно", "как говорится",
+    "э", "ээ", "эээ", "эм", "эмм", "ммм", "мм", "хм", "ага",
+)
+
+# Символов на токен: латиница и цифры кодируются плотнее кириллицы
+CHARS_PER_TOKEN_ASCII = 4.0
+CHARS_PER_TOKEN_OTHER = 3.0
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_FILLER_RE = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(f) for f in sorted(FILLERS, key=len, reverse=True)) + r")(?![\w-])",
+    re.IGNORECASE,
+)
+# Одно и то же слово несколько раз подряд («я я я», «биткоин, биткоин»); числа не трогаем
+_REPEAT_RE = re.compile(r"(?<!\w)([^\W\d]+)(?:[\s,]+\1)+(?!\w)", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+@dataclass
+class CompactedPrompt:
+    """Результат сжатия."""
+    text: str
+    original_tokens: int        # Оценка до сжатия
+    tokens: int                 # Оценка после сжатия
+    dropped: int = 0            # Отброшено предложений
+    truncated: bool = False     # Пришлось обрезать самое важное предложение
+
+    @property
+    def saved(self) -> int:
+        """Сэкономлено токенов (оценка)."""
+        return self.original_tokens - self.tokens
+
+
+@dataclass
+class CompactionStats:
+    """Счётчики сжатия с момента запуска."""
+    calls: int = 0
+    compacted: int = 0          # Текст изменился
+    original_tokens: int = 0
+    tokens: int = 0
+
+    @property
+    def saved(self) -> int:
+        """Сэкономлено токенов (оценка)."""
+        return self.original_tokens - self.tokens
+
+
+_stats = CompactionStats()
+_stats_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное число токенов (с запасом для кириллицы)."""
+    total = 0
+    for piece in _TOKEN_RE.findall(text):
+        chars = CHARS_PER_TOKEN_ASCII if piece.isascii() else CHARS_PER_TOKEN_OTHER
+        total += max(1, math.ceil(len(piece) / chars))
+    return total
+
+
+def remove_fillers(text: str) -> str:
+    """Убирает слова-паразиты, повторы слов и повторённые предложения."""
+    text = _FILLER_RE.sub("", text)
+    text = _REPEAT_RE.sub(r"\1", text)
+
+    # Остатки после удаления: «, ,», пробел перед знаком, запятая в начале
+    text = re.sub(r"(?:\s*,)+\s*(?=[,.!?;])", "", text)
+    text = re.sub(r"\s+([,.!?;])", r"\1", text)
+    text = re.sub(r"(^|[.!?;]\s*),\s*", r"\1", text)
+    text = re.sub(r"\s{2,}", " ", text).strip(" ,")
+
+    sentences = []
+    seen = set()
+    for sentence in _SENTENCE_RE.split(text):
+        key = normalize_text(sentence)
+        if key and key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def sentence_score(sentence: str) -> float:
+    """Насколько предложение важно для извлечения: тикер, сценарий, дата."""
+    score = 0.0
+    if extract_asset(sentence)[0] is not None:
+        score += 3.0
+    if extract_scenario(sentence)[0] is not None:
+        score += 2.0
+
+    trade_date, date_score = extract_date(sentence)
+    if trade_date is not None:
+        score += 2.0
+    elif date_score < 0.9:
+        # Дата упомянута, но правила её не разобрали («в пятницу») — пусть решает LLM
+        score += 1.0
+    return score
+
+
+def compact_prompt(text: str, max_tokens: int) -> CompactedPrompt:
+    """
+    Сжимает описание сделки до max_tokens (оценка).
+
+    Сначала убираются паразиты и повторы. Если этого мало — предложения
+    отбираются по важности (при равной — ближе к началу) и выводятся в
+    исходном порядке. Если не помещается даже самое важное предложение,
+    оно обрезается по словам.
+    """
+    original_tokens = estimate_tokens(text)
+    cleaned = remove_fillers(text) or text.strip()
+    tokens = estimate_tokens(cleaned)
+    result = CompactedPrompt(cleaned, original_tokens, tokens)
+
+    if tokens > max_tokens:
+        sentences = _SENTENCE_RE.split(cleaned)
+        costs = [estimate_tokens(sentence) for sentence in sentences]
+        ranked = sorted(range(len(sentences)), key=lambda i: (-sentence_score(sentences[i]), i))
+
+        chosen: list[int] = []
+        budget = max_tokens
+        for index in ranked:
+            if costs[index] <= budget:
+                chosen.append(index)
+                budget -= costs[index]
+
+        if chosen:
+            kept = " ".join(sentences[index] for index in sorted(chosen))
+        else:
+            kept = _truncate(sentences[ranked[0]], max_tokens)
+            result.truncated = True
+
+        result.text = kept
+        result.tokens = estimate_tokens(kept)
+        result.dropped = len(sentences) - max(1, len(chosen))
+
+    with _stats_lock:
+        _stats.calls += 1
+        _stats.compacted += result.text != text.strip()
+        _stats.original_tokens += result.original_tokens
+        _stats.tokens += result.tokens
+
+    return result
+
+
+def get_compaction_stats() -> CompactionStats:
+    """Снимок счётчиков сжатия."""
+    with _stats_lock:
+        return replace(_stats)
+
+
+def _truncate(sentence: str, max_tokens: int) -> str:
+    """Первые слова предложения, помещающиеся в max_tokens."""
+    words = []
+    budget = max_tokens
+    for word in sentence.split():
+        cost = estimate_tokens(word)
+        if cost > budget:
+            break
+        words.append(word)
+        budget -= cost
+    return " ".join(words)
@@ -0,0 +1,110 @@
+"""
+Пул процессов для рендеринга коллажей.
+
+Декодирование, склейка и JPEG-кодирование скриншотов — CPU-bound работа,
+поэтому она выполняется в отдельных процессах. Между процессами передаются
+только байты изображений и строки заголовка.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from services.fonts import get_font_registry
+from services.image_processor import TradeHeader, render_collage
+from services.output_policy import EncodedImage, OutputPolicy
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _init_worker() -> None:
+    """Инициализация процесса пула: шрифты определяются один раз при старте."""
+    get_font_registry()
+
+
+def _render_collage(
+    images: list[bytes],
+    asset: str,
+    scenario: str,
+    date: str,
+    policy: OutputPolicy,
+) -> EncodedImage:
+    """Рендерит коллаж внутри процесса пула."""
+    header = TradeHeader(asset=asset, scenario=scenario, date=date)
+    return render_collage(images, header, policy)
+
+
+class CollageRenderer:
+    """Рендеринг коллажей в пуле процессов."""
+
+    def __init__(self, workers: Optional[int] = None, policy: Optional[OutputPolicy] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = policy or OutputPolicy.from_config()
+
+        # spawn — безопасно для процессов, запущенных из работающего event loop
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+        logger.info(f"Пул рендеринга запущен: workers={self.workers}")
+
+    async def render(self, images: list[bytes], header: TradeHeader) -> EncodedImage:
+        """
+        Создаёт коллаж с заголовком в отдельном процессе.
+
+        Args:
+            images: Список изображений в виде байтов
+            header: Данные для заголовка (актив, сценарий, дата)
+
+        Returns:
+            EncodedImage — байты коллажа, формат и способ отправки
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        result = await loop.run_in_executor(
+            self._pool,
+            _render_collage,
+            images,
+            header.asset,
+            header.scenario,
+            header.date,
+            self.policy,
+        )
+
+        logger.info(f"Коллаж отрендерен за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return result
+
+    def shutdown(self) -> None:
+        """Останавливает пул процессов."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("Пул рендеринга остановлен")
+
+
+# Экземпляр пула (создаётся при первом обращении)
+_renderer: Optional[CollageRenderer] = None
+
+
+def get_renderer() -> CollageRenderer:
+    """Получает общий пул рендеринга (создаёт по настройкам из config)."""
+    global _renderer
+
+    if _renderer is None:
+        _renderer = CollageRenderer(workers=config.RENDER_WORKERS or None)
+    return _renderer
+
+
+def shutdown_renderer() -> None:
+    """Останавливает общий пул рендеринга."""
+    global _renderer
+
+    if _renderer is not None:
+        _renderer.shutdown()
+        _renderer = None
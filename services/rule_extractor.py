@@ -0,0 +1,398 @@
+"""
+Локальное извлечение данных о сделке по правилам (без LLM).
+
+Большинство описаний устроены одинаково: тикер, сценарий из фиксированного
+набора и дата («сегодня», «3 октября», «от 03.10»). Такие тексты разбираются
+словарями и регулярными выражениями за микросекунды; в OpenRouter уходят
+только неоднозначные. Каждое поле получает оценку уверенности, итоговая
+уверенность — минимум по полям.
+"""
+
+import difflib
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Котируемая валюта по умолчанию (как в SYSTEM_PROMPT)
+DEFAULT_QUOTE = "USDT"
+
+QUOTES = ("USDT", "USDC", "USD", "BTC", "ETH")
+
+# Тикер → варианты написания (регулярные выражения, без учёта регистра).
+# Русские названия — основой со словоизменением; короткие слова, совпадающие
+# с обычной лексикой («тон», «сол»), не используются, а совпадающие с ней
+# основы («трон» — «тронула») перечислены точными словоформами.
+TICKER_ALIASES: dict[str, tuple[str, ...]] = {
+    "BTC": ("btc", "биткоин\\w*", "биткойн\\w*", "биток\\w*", "битка"),
+    "ETH": ("eth", "эфир\\w*", "эфириум\\w*", "этериум\\w*", "ефир\\w*"),
+    "SOL": ("sol", "солан\\w*"),
+    "XRP": ("xrp", "рипл\\w*"),
+    "DOGE": ("doge", "доги", "догикоин\\w*", "дожкоин\\w*"),
+    "TON": ("ton", "тонкоин\\w*", "тон коин\\w*"),
+    "BNB": ("bnb", "бнб"),
+    "ADA": ("ada", "кардано"),
+    "AVAX": ("avax", "авакс\\w*", "аваланч\\w*"),
+    "LINK": ("link", "чейнлинк\\w*"),
+    "DOT": ("dot", "полкадот\\w*"),
+    "LTC": ("ltc", "лайткоин\\w*"),
+    "TRX": ("trx", "трон", "трона", "трону", "троне", "троном"),
+    "SUI": ("sui",),
+    "APT": ("apt", "аптос\\w*"),
+    "ARB": ("arb", "арбитрум\\w*"),
+    "NEAR": ("near",),
+    "ATOM": ("atom",),
+    "PEPE": ("pepe", "пепе"),
+    "SHIB": ("shib", "шиб\\w*"),
+    "WIF": ("wif",),
+    "INJ": ("inj", "инжектив\\w*"),
+    "FIL": ("fil", "филкоин\\w*"),
+    "ETC": ("etc",),
+    "BCH": ("bch",),
+    "UNI": ("uni", "юнисвоп\\w*", "юнисвап\\w*"),
+    "AAVE": ("aave",),
+    "OP": ("op",),
+}
+
+# Латинские тикеры, совпадающие с английскими словами: без верхнего регистра
+# или «$» («OP», «$op») не считаются надёжным упоминанием тикера
+AMBIGUOUS_ALIASES = frozenset({"op", "link", "near", "dot", "etc", "uni", "atom", "apt"})
+
+# Сценарий → устойчивые формулировки
+SCENARIO_PHRASES: dict[str, tuple[str, ...]] = {
+    "ЛП": ("лп", "эл пэ", "ложный пробой", "ложного пробоя", "ложным пробоем", "ложняк"),
+    "ЛПП": ("лпп", "эл пэ пэ"),
+    "Пробой": ("пробой", "пробоя", "пробою", "пробоем", "пробили", "пробитие"),
+    "Ретест": ("ретест", "ретеста", "ретесте", "ретесту", "ретестом", "перетест"),
+}
+
+# Слова для нечёткого сравнения (опечатки распознавания): «ритест», «пробй»
+_FUZZY_WORDS = {"пробой": "Пробой", "ретест": "Ретест", "ложняк": "ЛП"}
+_FUZZY_CUTOFF = 0.75
+
+MONTHS = {
+    "январ": 1, "феврал": 2, "март": 3, "апрел": 4, "мая": 5, "июн": 6,
+    "июл": 7, "август": 8, "сентябр": 9, "октябр": 10, "ноябр": 11, "декабр": 12,
+}
+
+# Порядковые числительные (основы): «третье», «пятнадцатого»
+_ORDINALS = {
+    "перв": 1, "втор": 2, "трет": 3, "четверт": 4, "пят": 5, "шест": 6,
+    "седьм": 7, "восьм": 8, "девят": 9, "десят": 10, "одиннадцат": 11,
+    "двенадцат": 12, "тринадцат": 13, "четырнадцат": 14, "пятнадцат": 15,
+    "шестнадцат": 16, "семнадцат": 17, "восемнадцат": 18, "девятнадцат": 19,
+    "двадцат": 20, "тридцат": 30,
+}
+
+_RELATIVE_DAYS = {"сегодня": 0, "вчера": 1, "позавчера": 2}
+
+
+def _compile_tickers() -> re.Pattern:
+    """Одно регулярное выражение на все тикеры: имя группы — тикер."""
+    groups = [
+        f"(?P<{ticker}>{'|'.join(sorted(aliases, key=len, reverse=True))})"
+        for ticker, aliases in TICKER_ALIASES.items()
+    ]
+    return re.compile(r"(?<!\w)(?:" + "|".join(groups) + r")(?!\w)", re.IGNORECASE)
+
+
+def _compile_scenarios() -> list[tuple[re.Pattern, str]]:
+    """Фразы сценариев, от длинных к коротким (ЛПП раньше ЛП)."""
+    phrases = [(phrase, scenario) for scenario, items in SCENARIO_PHRASES.items() for phrase in items]
+    phrases.sort(key=lambda item: len(item[0]), reverse=True)
+    return [
+        (re.compile(r"(?<!\w)" + re.escape(phrase).replace(r"\ ", r"\s+") + r"(?!\w)"), scenario)
+        for phrase, scenario in phrases
+    ]
+
+
+_MONTH_RE = "(?P<month>" + "|".join(f"{stem}\\w*" for stem in sorted(MONTHS, key=len, reverse=True)) + ")"
+_ORDINAL_RE = r"(?<!\w)(?P<ordinal>" + "|".join(sorted(_ORDINALS, key=len, reverse=True)) + r")\w*"
+
+_TICKER_RE = _compile_tickers()
+_PAIR_RE = re.compile(
+    r"(?<![A-Za-z0-9])(?P<base>[A-Za-z0-9]{2,10}?)(?:\s*[/\-]\s*)?(?P<quote>" + "|".join(QUOTES) + r")(?![A-Za-z0-9])",
+    re.IGNORECASE,
+)
+_SCENARIO_RES = _compile_scenarios()
+# Месяц — двумя цифрами, чтобы не путать дату с ценой или процентом («1.5%»)
+_NUMERIC_DATE_RE = re.compile(
+    r"(?<![\d.,])(?P<day>\d{1,2})[./](?P<month>\d{2})(?:[./](?P<year>\d{4}|\d{2}))?(?![\d%]|[.,]\d)"
+)
+_DAY_MONTH_RE = re.compile(r"(?<!\d)(?P<day>\d{1,2})\s+" + _MONTH_RE + r"(?:\s+(?P<year>\d{4}))?")
+_ORDINAL_DATE_RE = re.compile(r"(?:(?P<tens>двадцать|тридцать)\s+)?" + _ORDINAL_RE + r"\s+" + _MONTH_RE)
+_RELATIVE_RE = re.compile(r"(?<!\w)(" + "|".join(_RELATIVE_DAYS) + r")(?!\w)")
+
+# Слово перед числовой датой без года, отличающее её от цены («от 5.12», «дата: 05.12»)
+_DATE_KEYWORD_RE = re.compile(
+    r"(?<!\w)(?:от|дат\w*|числ\w*|понедельник\w*|вторник\w*|сред[аеуы]|четверг\w*|пятниц\w*"
+    r"|суббот\w*|воскресень\w*|пн|вт|ср|чт|пт|сб|вс)[\s:,]*$"
+)
+
+# Признаки даты, которую правила не разбирают («в пятницу», «на прошлой неделе»)
+_DATE_HINT_RE = re.compile(
+    r"понедельник|вторник|сред[уы]|четверг|пятниц|суббот|воскресень|недел|числа|\d{1,2}\s*-?\s*го\b"
+)
+
+
+# Разбиение пакета описаний: нумерация и маркеры начала новой сделки
+_ENUMERATOR_RE = re.compile(r"^\s*(?:\d{1,2}[.)]|[-•*—–])\s+")
+_TRADE_WORD_RE = (
+    r"(?:(?:перв|втор|трет|четв[её]рт|пят|шест|седьм|восьм|девят|десят)\w*\s+сделк\w*"
+    r"|следующ\w*\s+сделк\w*|ещ[её]\s+одн\w*\s+сделк\w*|сделк\w*\s*(?:№\s*)?\d{1,2}(?!\d))"
+)
+_MARKER_RE = re.compile(
+    r"^\s*(?:" + _TRADE_WORD_RE + r"|следующая|ещ[её]\s+одна|дальше|потом|затем)(?!\w)", re.IGNORECASE
+)
+_INLINE_MARKER_RE = re.compile(r"[\s,;]+(?=" + _TRADE_WORD_RE + r")", re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+@dataclass
+class RuleExtraction:
+    """Результат локального извлечения."""
+    asset: Optional[str]
+    scenario: Optional[str]
+    date: str
+    confidence: float                                   # Минимум по полям (0..1)
+    fields: dict[str, float] = field(default_factory=dict)
+
+
+def _normalize(text: str) -> str:
+    """Нижний регистр, ё → е."""
+    return text.lower().replace("ё", "е")
+
+
+def extract_asset(text: str) -> tuple[Optional[str], float]:
+    """
+    Тикер в формате BASE/QUOTE.
+
+    Явная пара («ETH/BTC», «SOLUSDT») важнее словаря. Несколько разных
+    тикеров — неоднозначность, уверенность низкая; так же и тикер,
+    найденный только по неоднозначному слову («near», «op»).
+    """
+    found: list[str] = []
+
+    for match in _PAIR_RE.finditer(text):
+        base, quote = match.group("base").upper(), match.group("quote").upper()
+        if base != quote and not base.isdigit():
+            found.append(f"{base}/{quote}")
+
+    weak: list[str] = []
+    if not found:
+        for match in _TICKER_RE.finditer(text):
+            ticker = f"{match.lastgroup}/{DEFAULT_QUOTE}"
+            if _is_weak_alias(text, match):
+                weak.append(ticker)
+            else:
+                found.append(ticker)
+
+    unique = list(dict.fromkeys(found))
+    if not unique:
+        # Только слова вроде «op», «link»: возможно, тикер, но решает LLM
+        return (weak[0], 0.5) if weak else (None, 0.0)
+    if len(unique) > 1:
+        return unique[0], 0.3
+    return unique[0], 1.0
+
+
+def _is_weak_alias(text: str, match: re.Match) -> bool:
+    """Совпадение — неоднозначное латинское слово без верхнего регистра и «$»."""
+    word = match.group(0)
+    if word.lower() not in AMBIGUOUS_ALIASES or word.isupper():
+        return False
+    return text[match.start() - 1:match.start()] != "$"
+
+
+def extract_scenario(text: str) -> tuple[Optional[str], float]:
+    """
+    Сценарий из словаря ЛП/ЛПП/Пробой/Ретест.
+
+    Сначала точные фразы (найденные куски вырезаются, чтобы «ложный
+    пробой» не засчитался ещё и как «Пробой»), затем нечёткое сравнение
+    слов через difflib. Несколько разных сценариев — неоднозначность.
+    """
+    normalized = _normalize(text)
+    found: dict[str, float] = {}
+
+    for pattern, scenario in _SCENARIO_RES:
+        if pattern.search(normalized):
+            found[scenario] = 1.0
+            normalized = pattern.sub(" ", normalized)
+
+    if not found:
+        for word in re.findall(r"\w{5,}", normalized):
+            matches = difflib.get_close_matches(word, _FUZZY_WORDS, n=1, cutoff=_FUZZY_CUTOFF)
+            if matches:
+                score = difflib.SequenceMatcher(None, word, matches[0]).ratio()
+                scenario = _FUZZY_WORDS[matches[0]]
+                found[scenario] = max(found.get(scenario, 0.0), score)
+
+    if not found:
+        return None, 0.0
+    if len(found) > 1:
+        return max(found, key=found.get), 0.3
+
+    scenario, score = next(iter(found.items()))
+    return scenario, score
+
+
+def _month_number(word: str) -> Optional[int]:
+    """Номер месяца по слову («октября» → 10)."""
+    for stem, number in sorted(MONTHS.items(), key=lambda item: len(item[0]), reverse=True):
+        if word.startswith(stem):
+            return number
+    return None
+
+
+def _build_date(day: int, month: int, year: Optional[int], today: date) -> Optional[date]:
+    """
+    Дата из частей; без года — ближайшая прошедшая (сделки записываются
+    после факта, поэтому «25 декабря» в январе — прошлый год).
+    """
+    try:
+        if year is not None:
+            return date(year + 2000 if year < 100 else year, month, day)
+        candidate = date(today.year, month, day)
+        if candidate > today + timedelta(days=1):
+            candidate = date(today.year - 1, month, day)
+        return candidate
+    except ValueError:
+        return None
+
+
+def extract_date(text: str, today: Optional[date] = None) -> tuple[Optional[date], float]:
+    """
+    Дата сделки: относительная («сегодня», «вчера»), числовая («03.10.2025»,
+    «от 03.10») или словами («3 октября», «третьего октября»).
+
+    Числовая дата без года принимается только после слова-признака даты
+    («от», «дата», день недели): иначе «5.12» может быть ценой.
+
+    Returns:
+        (дата, уверенность). Дата не найдена: без намёков на дату —
+        уверенность высокая (ответ «не указана»), с намёками или
+        несуществующей датой («31.02.2024») — низкая.
+    """
+    today = today or date.today()
+    normalized = _normalize(text)
+    candidates: list[date] = []
+
+    for match in _RELATIVE_RE.finditer(normalized):
+        candidates.append(today - timedelta(days=_RELATIVE_DAYS[match.group(1)]))
+
+    bare_numeric = False
+    invalid = False     # Дата указана явно, но такой нет («31.02»): пусть решает LLM
+    for match in _NUMERIC_DATE_RE.finditer(normalized):
+        year = int(match.group("year")) if match.group("year") else None
+        if year is None and not _DATE_KEYWORD_RE.search(normalized, 0, match.start()):
+            # «вход 5.12» — скорее цена, чем дата
+            bare_numeric = True
+            continue
+        parsed = _build_date(int(match.group("day")), int(match.group("month")), year, today)
+        if parsed:
+            candidates.append(parsed)
+        else:
+            invalid = True
+
+    for match in _DAY_MONTH_RE.finditer(normalized):
+        month = _month_number(match.group("month"))
+        year = int(match.group("year")) if match.group("year") else None
+        parsed = _build_date(int(match.group("day")), month, year, today) if month else None
+        if parsed:
+            candidates.append(parsed)
+        else:
+            invalid = True
+
+    for match in _ORDINAL_DATE_RE.finditer(normalized):
+        day = _ORDINALS[match.group("ordinal")]
+        if match.group("tens"):
+            day += 20 if match.group("tens") == "двадцать" else 30
+        month = _month_number(match.group("month"))
+        parsed = _build_date(day, month, None, today) if month else None
+        if parsed:
+            candidates.append(parsed)
+        else:
+            invalid = True
+
+    unique = list(dict.fromkeys(candidates))
+    if not unique:
+        return None, (0.4 if bare_numeric or invalid or _DATE_HINT_RE.search(normalized) else 0.9)
+    if len(unique) > 1 or invalid:
+        return unique[0], 0.3
+    return unique[0], 1.0
+
+
+def extract_rules(text: str, today: Optional[date] = None) -> RuleExtraction:
+    """
+    Извлекает актив, сценарий и дату по правилам.
+
+    Args:
+        text: Описание сделки
+        today: Текущая дата (для «сегодня»/«вчера»; по умолчанию — системная)
+
+    Returns:
+        RuleExtraction с итоговой уверенностью и уверенностью по полям
+    """
+    asset, asset_score = extract_asset(text)
+    scenario, scenario_score = extract_scenario(text)
+    trade_date, date_score = extract_date(text, today)
+
+    fields = {"asset": asset_score, "scenario": scenario_score, "date": date_score}
+    return RuleExtraction(
+        asset=asset,
+        scenario=scenario,
+        date=trade_date.strftime("%d.%m.%Y") if trade_date else "не указана",
+        confidence=min(fields.values()),
+        fields=fields,
+    )
+
+
+def split_trade_segments(text: str, limit: Optional[int] = None) -> list[str]:
+    """
+    Делит текст с несколькими сделками на описания отдельных сделок.
+
+    Единица разбора — строка (если текст многострочный) или предложение
+    (надиктованный текст). Новая сделка начинается с нумерации («1.», «-»),
+    маркера («вторая сделка», «дальше», «ещё одна») или с тикера,
+    отличного от уже названного в текущем описании (повтор того же
+    тикера — продолжение сделки).
+
+    Args:
+        text: Текст пакета
+        limit: Максимум описаний (лишние отбрасываются)
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    units = lines if len(lines) > 1 else _SENTENCE_RE.split(text.strip())
+
+    segments: list[str] = []
+    current: list[str] = []
+    current_asset: Optional[str] = None
+
+    for unit in units:
+        for part in _INLINE_MARKER_RE.split(unit):
+            part = part.strip()
+            if not part:
+                continue
+
+            explicit = bool(_ENUMERATOR_RE.match(part) or _MARKER_RE.match(part))
+            asset = extract_asset(part)[0]
+            new_asset = asset is not None and current_asset is not None and asset != current_asset
+            if current and (explicit or new_asset):
+                segments.append(" ".join(current))
+                current, current_asset = [], None
+
+            current.append(_ENUMERATOR_RE.sub("", part, count=1))
+            current_asset = current_asset or asset
+
+    if current:
+        segments.append(" ".join(current))
+
+    if limit is not None and len(segments) > limit:
+        logger.warning(f"Описаний сделок {len(segments)}, обрабатываются первые {limit}")
+        segments = segments[:limit]
+    return segments
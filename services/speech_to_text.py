@@ -2,16 +2,39 @@
 Распознавание речи через Faster Whisper.
 """
 
-from dataclasses import dataclass
+import bisect
+import io
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Callable, Optional, Union
 
-from faster_whisper import WhisperModel
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.audio import decode_audio as _decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps, merge_segments
 
+from utils.config import config
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Частота дискретизации, с которой работает Whisper
+SAMPLE_RATE = 16000
+
+# Длина окна Whisper, секунды
+CHUNK_LENGTH = 30
+
+# Источник аудио: путь к файлу, байты, файловый объект или уже декодированный PCM
+AudioSource = Union[str, Path, bytes, bytearray, BinaryIO, np.ndarray]
+
+# Минимальная пауза, по которой можно резать длинную запись, секунды
+MIN_CUT_SILENCE = 0.3
+
 
 @dataclass(frozen=True)
 class WhisperConfig:
@@ -21,69 +44,647 @@ class WhisperConfig:
     beam_size: int = 5
     vad_filter: bool = True
     use_gpu: bool = False
+    compute_type: Optional[str] = None   # None — float16 на GPU, int8 на CPU
+    cpu_threads: int = 0                 # 0 — по умолчанию CTranslate2
+    num_workers: int = 1                 # Параллельных транскрипций на модель
+
+    @classmethod
+    def from_config(cls) -> "WhisperConfig":
+        """Создаёт конфигурацию по настройкам из config (.env)."""
+        return cls(
+            model_size=config.WHISPER_MODEL_SIZE,
+            beam_size=config.WHISPER_BEAM_SIZE,
+            use_gpu=config.WHISPER_USE_GPU,
+            compute_type=config.WHISPER_COMPUTE_TYPE or None,
+            cpu_threads=config.WHISPER_CPU_THREADS,
+            num_workers=config.WHISPER_NUM_WORKERS,
+        )
+
+
+# Примерное число параметров моделей Whisper, млн. Порядок важен: имя
+# модели сравнивается по подстроке, поэтому «large-v3-turbo» и
+# «distil-large-v3» должны найтись раньше полной «large»
+_MODEL_PARAMS_M = {
+    "turbo": 809,
+    "distil-large": 756,
+    "tiny": 39,
+    "base": 74,
+    "small": 244,
+    "medium": 769,
+    "large": 1550,
+}
+
+# Байт на параметр для типов вычислений CTranslate2
+_BYTES_PER_PARAM = {
+    "int8": 1,
+    "int8_float16": 1,
+    "int8_float32": 1,
+    "int8_bfloat16": 1,
+    "float16": 2,
+    "bfloat16": 2,
+    "float32": 4,
+}
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """Уровень модели для маршрутизации по длительности речи."""
+    name: str
+    max_speech: float        # Максимум секунд речи (inf — без ограничения)
+    cfg: WhisperConfig
 
 
-# Кэш модели
-_model: Optional[WhisperModel] = None
-_model_cfg: Optional[WhisperConfig] = None
+# Кэш моделей: ключ — параметры загрузки, порядок — LRU
+_models: "OrderedDict[tuple, WhisperModel]" = OrderedDict()
+_model_memory: dict[tuple, int] = {}
+_model_lock = threading.Lock()
+# Загружаемые сейчас модели: остальные потоки ждут ту же загрузку
+_model_loading: dict[tuple, Future] = {}
+
+# Модели, для которых уже выполнен прогрев
+_warmed_up: set[tuple] = set()
+
+# Уровни моделей (разбираются из config при первом обращении)
+_tiers: Optional[list[ModelTier]] = None
+
+
+def _resolve_device(cfg: WhisperConfig) -> tuple[str, str]:
+    """Устройство и тип вычислений для конфигурации."""
+    if cfg.use_gpu:
+        return "cuda", cfg.compute_type or "float16"
+    return "cpu", cfg.compute_type or "int8"
+
+
+def _model_key(cfg: WhisperConfig) -> tuple:
+    """Ключ кэша — только параметры загрузки (beam_size и т.п. не важны)."""
+    return (cfg.model_size, *_resolve_device(cfg), cfg.cpu_threads, cfg.num_workers)
+
+
+def estimate_model_memory_mb(cfg: WhisperConfig) -> int:
+    """Оценка памяти, занимаемой моделью, MB."""
+    family = next(
+        (name for name in _MODEL_PARAMS_M if name in cfg.model_size.lower()),
+        "large",
+    )
+    _, compute_type = _resolve_device(cfg)
+    bytes_per_param = _BYTES_PER_PARAM.get(compute_type, 2)
+    # +20% на буферы и токенизатор
+    return int(_MODEL_PARAMS_M[family] * bytes_per_param * 1.2)
 
 
 def _get_model(cfg: WhisperConfig) -> WhisperModel:
     """
     Получает модель Whisper (с кэшированием).
-    Модель загружается один раз и переиспользуется.
+
+    Модели загружаются один раз и остаются в памяти, пока их суммарный
+    объём укладывается в WHISPER_MODELS_MEMORY_MB. Сверх лимита вытесняется
+    давно не использованная модель.
+
+    Загрузка (секунды) идёт без общей блокировки: запросы к уже
+    загруженным моделям не ждут, а параллельные запросы той же модели
+    ждут одну загрузку.
     """
-    global _model, _model_cfg
+    key = _model_key(cfg)
+
+    with _model_lock:
+        model = _models.get(key)
+        if model is not None:
+            _models.move_to_end(key)
+            return model
+
+        loading = _model_loading.get(key)
+        if loading is None:
+            loading = _model_loading[key] = Future()
+            owner = True
+        else:
+            owner = False
+
+    if not owner:
+        return loading.result()
+
+    try:
+        model = _load_model(cfg)
+    except BaseException as e:
+        with _model_lock:
+            _model_loading.pop(key, None)
+        loading.set_exception(e)
+        raise
+
+    with _model_lock:
+        _models[key] = model
+        _model_memory[key] = estimate_model_memory_mb(cfg)
+        _model_loading.pop(key, None)
 
-    if _model is not None and _model_cfg == cfg:
-        return _model
+        # Вытесняем старые модели сверх лимита памяти (запрошенную — никогда)
+        while sum(_model_memory.values()) > config.WHISPER_MODELS_MEMORY_MB and len(_models) > 1:
+            evicted_key = next(iter(_models))
+            if evicted_key == key:
+                break
+            _models.pop(evicted_key)
+            _model_memory.pop(evicted_key, None)
+            _warmed_up.discard(evicted_key)
+            logger.info(f"Модель Whisper {evicted_key[0]} выгружена (лимит памяти)")
 
+    loading.set_result(model)
+    return model
+
+
+def _load_model(cfg: WhisperConfig) -> WhisperModel:
+    """Загружает модель Whisper с диска (или скачивает при первом запуске)."""
     logger.info(f"Загрузка модели Whisper: {cfg.model_size}")
+    started = time.perf_counter()
 
-    if cfg.use_gpu:
-        device = "cuda"
-        compute_type = "float16"
-    else:
-        device = "cpu"
-        compute_type = "int8"
+    device, compute_type = _resolve_device(cfg)
+    model = WhisperModel(
+        cfg.model_size,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cfg.cpu_threads,
+        num_workers=cfg.num_workers,
+    )
+
+    logger.info(
+        f"Модель Whisper загружена за {time.perf_counter() - started:.1f}с: "
+        f"device={device}, compute_type={compute_type}, "
+        f"cpu_threads={cfg.cpu_threads}, num_workers={cfg.num_workers}"
+    )
+    return model
+
+
+def parse_tiers(value: str, base: WhisperConfig) -> list[ModelTier]:
+    """
+    Разбирает уровни моделей из строки вида "small:1:20,medium:5".
+
+    Формат уровня: модель:beam_size[:макс_секунд_речи]. Уровень без лимита
+    (обычно последний) принимает всё остальное. Остальные параметры
+    (устройство, потоки) берутся из base.
+    """
+    tiers: list[ModelTier] = []
+
+    for item in value.split(","):
+        parts = [part.strip() for part in item.split(":")]
+        if not parts[0]:
+            continue
+        try:
+            beam_size = int(parts[1]) if len(parts) > 1 and parts[1] else base.beam_size
+            max_speech = float(parts[2]) if len(parts) > 2 and parts[2] else float("inf")
+        except ValueError:
+            logger.warning(f"Некорректный уровень модели: {item}")
+            continue
+
+        tiers.append(ModelTier(
+            name=f"{parts[0]}/beam{beam_size}",
+            max_speech=max_speech,
+            cfg=replace(base, model_size=parts[0], beam_size=beam_size),
+        ))
+
+    tiers.sort(key=lambda tier: tier.max_speech)
+    return tiers
 
-    _model = WhisperModel(cfg.model_size, device=device, compute_type=compute_type)
-    _model_cfg = cfg
-    
-    logger.info(f"Модель Whisper загружена: device={device}, compute_type={compute_type}")
-    return _model
+
+def get_tiers() -> list[ModelTier]:
+    """Уровни моделей из config (или один уровень — модель по умолчанию)."""
+    global _tiers
+
+    if _tiers is None:
+        base = WhisperConfig.from_config()
+        _tiers = parse_tiers(config.WHISPER_TIERS, base) or [
+            ModelTier(name="default", max_speech=float("inf"), cfg=base)
+        ]
+    return _tiers
+
+
+def speech_ratio(samples: np.ndarray, speech: Optional[list[dict]] = None) -> float:
+    """Доля речи в записи по VAD (0..1); speech — уже найденные участки речи."""
+    if len(samples) == 0:
+        return 0.0
+
+    if speech is None:
+        speech = get_speech_timestamps(samples, VadOptions())
+    speech_samples = sum(chunk["end"] - chunk["start"] for chunk in speech)
+    return min(1.0, speech_samples / len(samples))
+
+
+def select_tier(
+    samples: np.ndarray,
+    tiers: Optional[list[ModelTier]] = None,
+    speech: Optional[list[dict]] = None
+) -> ModelTier:
+    """
+    Выбирает уровень модели по количеству речи в записи.
+
+    Секунды речи = длительность × доля речи по VAD. Короткие реплики
+    уходят в быструю модель, длинные разборы — в точную.
+    """
+    tiers = tiers or get_tiers()
+    if len(tiers) == 1:
+        return tiers[0]
+
+    duration = len(samples) / SAMPLE_RATE
+    ratio = speech_ratio(samples, speech)
+    speech_seconds = duration * ratio
+
+    for tier in tiers:
+        if speech_seconds <= tier.max_speech:
+            break
+
+    logger.info(
+        f"Маршрутизация STT: {duration:.1f}с аудио, речь {ratio:.0%} "
+        f"({speech_seconds:.1f}с) → {tier.name}"
+    )
+    return tier
+
+
+def preload_model(cfg: Optional[WhisperConfig] = None) -> None:
+    """
+    Загружает модель и прогревает её на короткой тишине.
+
+    Первый реальный запрос не ждёт ни загрузки весов, ни инициализации
+    вычислительных ядер. Без cfg прогреваются все уровни моделей.
+    """
+    if cfg is None:
+        for tier in get_tiers():
+            preload_model(tier.cfg)
+        return
+
+    model = _get_model(cfg)
+    key = _model_key(cfg)
+
+    if key in _warmed_up:
+        return
+
+    started = time.perf_counter()
+
+    # 1 секунда тишины; VAD выключен, чтобы encoder/decoder действительно отработали
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    segments, _ = model.transcribe(
+        silence,
+        vad_filter=False,
+        beam_size=cfg.beam_size,
+        language=cfg.language,
+    )
+    for _ in segments:
+        pass
+
+    _warmed_up.add(key)
+    logger.info(f"Прогрев модели Whisper {cfg.model_size} завершён за {time.perf_counter() - started:.1f}с")
+
+
+def decode_audio(source: AudioSource) -> np.ndarray:
+    """
+    Декодирует аудио в float32 PCM (моно, 16 кГц) — формат входа Whisper.
+
+    Байты и файловые объекты декодируются в памяти (PyAV), без временных
+    файлов. Поддерживаются все форматы FFmpeg: ogg/opus, mp3, m4a, mp4, wav.
+
+    Args:
+        source: Путь к файлу, байты, файловый объект или готовый массив PCM
+
+    Returns:
+        Массив float32 с отсчётами 16 кГц
+    """
+    if isinstance(source, np.ndarray):
+        return source.astype(np.float32, copy=False)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    elif isinstance(source, Path):
+        source = str(source)
+
+    return _decode_audio(source, sampling_rate=SAMPLE_RATE)
+
+
+def _describe_source(source: AudioSource) -> str:
+    """Короткое описание источника аудио для логов."""
+    if isinstance(source, (str, Path)):
+        return str(source)
+    if isinstance(source, (bytes, bytearray)):
+        return f"<{len(source) / 1024:.1f} KB в памяти>"
+    if isinstance(source, np.ndarray):
+        return f"<PCM {len(source) / SAMPLE_RATE:.1f}с>"
+    return "<файловый объект>"
 
 
 def transcribe_audio(
-    audio_path: str | Path,
-    cfg: WhisperConfig = WhisperConfig()
+    audio: AudioSource,
+    cfg: Optional[WhisperConfig] = None,
+    on_segment: Optional[Callable[[str], None]] = None
 ) -> str:
     """
-    Транскрибирует аудиофайл в текст.
-    
+    Транскрибирует аудио в текст.
+
     Args:
-        audio_path: Путь к аудиофайлу (ogg, mp3, wav и др.)
-        cfg: Конфигурация Whisper
-    
+        audio: Путь к аудиофайлу (ogg, mp3, wav и др.), байты,
+            файловый объект или декодированный PCM
+        cfg: Конфигурация Whisper (по умолчанию — уровень модели
+            выбирается по длительности речи)
+        on_segment: Вызывается с текстом каждого сегмента сразу после
+            его распознавания. Исключение из колбэка прерывает транскрипцию.
+
     Returns:
         Распознанный текст
     """
-    audio_path = str(audio_path)
+    logger.info(f"Начало транскрипции: {_describe_source(audio)}")
+
+    started = time.perf_counter()
+    samples = decode_audio(audio)
+
+    if cfg is None:
+        tier = select_tier(samples)
+        cfg, tier_name = tier.cfg, tier.name
+    else:
+        tier_name = cfg.model_size
+
     model = _get_model(cfg)
-    
-    logger.info(f"Начало транскрипции: {audio_path}")
 
     segments, info = model.transcribe(
-        audio_path,
+        samples,
         vad_filter=cfg.vad_filter,
         beam_size=cfg.beam_size,
         language=cfg.language,
     )
 
-    # Собираем текст из всех сегментов
-    text = " ".join(seg.text.strip() for seg in segments if seg.text)
-    text = text.strip()
-    
-    logger.info(f"Транскрипция завершена: {len(text)} символов, язык={info.language}")
-    
+    # Собираем текст из сегментов по мере их распознавания
+    parts: list[str] = []
+    for seg in segments:
+        if not seg.text:
+            continue
+        parts.append(seg.text.strip())
+        if on_segment is not None:
+            on_segment(parts[-1])
+
+    text = " ".join(parts).strip()
+
+    duration = len(samples) / SAMPLE_RATE
+    elapsed = time.perf_counter() - started
+    rtf = elapsed / duration if duration else 0.0
+    logger.info(
+        f"Транскрипция завершена: {len(text)} символов, язык={info.language}, "
+        f"модель={tier_name}, {duration:.1f}с аудио за {elapsed:.1f}с (RTF {rtf:.2f})"
+    )
+
     return text
+
+
+def _speech_clips(samples: np.ndarray, cfg: WhisperConfig) -> list[dict]:
+    """
+    Делит запись на участки речи (в отсчётах) не длиннее окна Whisper.
+
+    С VAD — по границам речи, без VAD — равными окнами.
+    """
+    if cfg.vad_filter:
+        vad_options = VadOptions(max_speech_duration_s=CHUNK_LENGTH, min_silence_duration_ms=160)
+        speech = get_speech_timestamps(samples, vad_options)
+        return [
+            {"start": clip["start"], "end": clip["end"]}
+            for clip in merge_segments(speech, vad_options)
+        ]
+
+    window = CHUNK_LENGTH * SAMPLE_RATE
+    return [
+        {"start": start, "end": min(start + window, len(samples))}
+        for start in range(0, len(samples), window)
+    ]
+
+
+def transcribe_batch(
+    audios: list[AudioSource],
+    cfg: Optional[WhisperConfig] = None,
+    batch_size: int = 8
+) -> list[str]:
+    """
+    Транскрибирует несколько записей за один батчевый проход модели.
+
+    Записи склеиваются в одну дорожку, участки речи каждой передаются
+    в BatchedInferencePipeline как clip_timestamps, а распознанные сегменты
+    раскладываются обратно по владельцам.
+
+    Args:
+        audios: Список записей (пути, байты, файловые объекты или PCM)
+        cfg: Конфигурация Whisper (по умолчанию — из config)
+        batch_size: Количество окон в одном проходе модели
+
+    Returns:
+        Тексты в порядке audios
+    """
+    cfg = cfg or WhisperConfig.from_config()
+    model = _get_model(cfg)
+
+    started = time.perf_counter()
+    decoded = [decode_audio(audio) for audio in audios]
+
+    # Склеиваем записи в одну дорожку, запоминая владельца каждого участка
+    clips: list[dict] = []
+    clip_starts: list[float] = []
+    clip_owners: list[int] = []
+    offset = 0
+
+    for owner, samples in enumerate(decoded):
+        for clip in _speech_clips(samples, cfg):
+            clips.append({"start": clip["start"] + offset, "end": clip["end"] + offset})
+            clip_starts.append((clip["start"] + offset) / SAMPLE_RATE)
+            clip_owners.append(owner)
+        offset += len(samples)
+
+    texts: list[list[str]] = [[] for _ in audios]
+
+    if clips:
+        track = np.concatenate(decoded)
+        pipeline = BatchedInferencePipeline(model)
+        segments, _ = pipeline.transcribe(
+            track,
+            language=cfg.language,
+            beam_size=cfg.beam_size,
+            vad_filter=False,
+            clip_timestamps=clips,
+            batch_size=batch_size,
+        )
+
+        for seg in segments:
+            if not seg.text:
+                continue
+            # Начало сегмента округлено до мс — допускаем небольшой сдвиг
+            index = max(0, bisect.bisect_right(clip_starts, seg.start + 0.01) - 1)
+            texts[clip_owners[index]].append(seg.text.strip())
+
+    audio_seconds = offset / SAMPLE_RATE
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Батч транскрипции: {len(audios)} записей, {len(clips)} окон, "
+        f"{audio_seconds:.1f}с аудио за {elapsed:.1f}с"
+    )
+
+    return [" ".join(parts).strip() for parts in texts]
+
+
+@dataclass(frozen=True)
+class AudioChunk:
+    """Фрагмент длинной записи (границы в отсчётах)."""
+    start: int
+    end: int
+    overlap: int = 0    # Перекрытие с предыдущим фрагментом (0 — разрез по паузе)
+
+
+@dataclass
+class ChunkPlan:
+    """План параллельной транскрипции длинной записи."""
+    samples: np.ndarray
+    cfg: WhisperConfig
+    chunks: list[AudioChunk]
+
+    @property
+    def duration(self) -> float:
+        """Длительность записи, секунды."""
+        return len(self.samples) / SAMPLE_RATE
+
+
+def split_on_silence(
+    total: int,
+    speech: list[dict],
+    chunk_seconds: float = 60.0,
+    overlap_seconds: float = 1.0
+) -> list[AudioChunk]:
+    """
+    Делит запись на фрагменты около chunk_seconds по паузам между речью.
+
+    Разрез ставится посередине самой длинной паузы во второй половине
+    очередного окна. Если пауз нет (сплошная речь) — режем по длине окна,
+    а следующий фрагмент начинается на overlap_seconds раньше, чтобы слово
+    на стыке попало в него целиком.
+
+    Args:
+        total: Длина записи, отсчёты
+        speech: Участки речи по VAD ({"start", "end"} в отсчётах)
+        chunk_seconds: Желаемая длина фрагмента
+        overlap_seconds: Перекрытие при разрезе посреди речи
+
+    Returns:
+        Фрагменты в порядке записи
+
+    Raises:
+        ValueError: chunk_seconds не больше нуля (разбиение не закончилось бы)
+    """
+    if chunk_seconds <= 0:
+        raise ValueError(f"Длина фрагмента должна быть больше 0, получено {chunk_seconds}")
+
+    # Не меньше двух отсчётов: иначе разрез может не сдвинуть начало фрагмента
+    chunk = max(2, int(chunk_seconds * SAMPLE_RATE))
+    overlap = min(int(overlap_seconds * SAMPLE_RATE), chunk // 2)
+    min_silence = int(MIN_CUT_SILENCE * SAMPLE_RATE)
+
+    # Паузы между участками речи: (начало, конец)
+    edges = [0] + [bound for clip in speech for bound in (clip["start"], clip["end"])] + [total]
+    silences = [
+        (edges[i], edges[i + 1])
+        for i in range(0, len(edges) - 1, 2)
+        if edges[i + 1] - edges[i] >= min_silence
+    ]
+
+    chunks: list[AudioChunk] = []
+    start, start_overlap = 0, 0
+
+    while total - start > chunk:
+        window_start, window_end = start + chunk // 2, start + chunk
+        candidates = [
+            (min(end, window_end) - max(begin, window_start), begin, end)
+            for begin, end in silences
+            if begin < window_end and end > window_start
+        ]
+
+        if candidates:
+            _, begin, end = max(candidates)
+            cut = (max(begin, window_start) + min(end, window_end)) // 2
+            chunks.append(AudioChunk(start, cut, start_overlap))
+            start, start_overlap = cut, 0
+        else:
+            chunks.append(AudioChunk(start, window_end, start_overlap))
+            start, start_overlap = window_end - overlap, overlap
+
+    chunks.append(AudioChunk(start, total, start_overlap))
+    return chunks
+
+
+def plan_chunks(
+    audio: AudioSource,
+    cfg: Optional[WhisperConfig] = None,
+    chunk_seconds: float = 60.0,
+    overlap_seconds: float = 1.0,
+    min_seconds: float = 90.0
+) -> ChunkPlan:
+    """
+    Декодирует запись и готовит план параллельной транскрипции.
+
+    VAD выполняется один раз: по нему выбирается уровень модели (если cfg
+    не задан) и ищутся паузы для разрезов. Записи не длиннее min_seconds
+    не делятся.
+    """
+    samples = decode_audio(audio)
+    speech = get_speech_timestamps(samples, VadOptions())
+
+    if cfg is None:
+        cfg = select_tier(samples, speech=speech).cfg
+
+    if len(samples) <= min_seconds * SAMPLE_RATE:
+        chunks = [AudioChunk(0, len(samples))]
+    else:
+        chunks = split_on_silence(len(samples), speech, chunk_seconds, overlap_seconds)
+
+    logger.info(
+        f"План транскрипции: {len(samples) / SAMPLE_RATE:.1f}с аудио, "
+        f"{len(chunks)} фрагментов, модель={cfg.model_size}"
+    )
+    return ChunkPlan(samples=samples, cfg=cfg, chunks=chunks)
+
+
+def _normalize_word(word: str) -> str:
+    """Слово без регистра и пунктуации — для сравнения на стыках."""
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def _overlap_span(left: list[str], right: list[str], max_words: int) -> tuple[int, int]:
+    """
+    Ищет повтор на стыке двух фрагментов.
+
+    Конец left и начало right распознаны по одному и тому же куску аудио.
+    Крайние слова могут быть обрезаны разрезом, поэтому допускается пропуск
+    одного слова с каждой стороны (тогда повтор должен быть от двух слов).
+
+    Returns:
+        (сколько слов убрать с конца left, сколько — с начала right)
+    """
+    left_norm = [_normalize_word(word) for word in left[-(max_words + 1):]]
+    right_norm = [_normalize_word(word) for word in right[:max_words + 1]]
+    best: tuple[int, int, int] = (0, 0, 0)   # (длина повтора, обрезка left, обрезка right)
+
+    for left_skip in (0, 1):
+        for right_skip in (0, 1):
+            min_words = 1 if not (left_skip or right_skip) else 2
+            tail = left_norm[:len(left_norm) - left_skip]
+            head = right_norm[right_skip:]
+
+            for k in range(min(len(tail), len(head), max_words), min_words - 1, -1):
+                if k > best[0] and tail[-k:] == head[:k]:
+                    best = (k, left_skip, right_skip + k)
+                    break
+
+    return best[1], best[2]
+
+
+def stitch_transcripts(chunks: list[AudioChunk], texts: list[str], max_overlap_words: int = 8) -> str:
+    """
+    Склеивает тексты фрагментов в порядке записи.
+
+    На стыках с перекрытием повторённые слова удаляются; стыки по паузам
+    склеиваются как есть.
+    """
+    words: list[str] = []
+
+    for chunk, text in zip(chunks, texts):
+        part = text.split()
+        if chunk.overlap and words and part:
+            left_cut, right_cut = _overlap_span(words, part, max_overlap_words)
+            if left_cut:
+                del words[-left_cut:]
+            part = part[right_cut:]
+        words.extend(part)
+
+    return " ".join(words)
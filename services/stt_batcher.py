@@ -0,0 +1,102 @@
+"""
+Микро-батчинг запросов на распознавание речи.
+
+Запросы разных пользователей копятся короткое окно времени и выполняются
+одним батчевым проходом модели (transcribe_batch) в пуле STT. Каждый
+вызывающий получает свой текст.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from services.speech_to_text import AudioSource, WhisperConfig, transcribe_batch
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class _BatchItem:
+    """Запрос, ожидающий батча."""
+    audio: AudioSource
+    cfg: WhisperConfig
+    future: asyncio.Future
+
+
+class STTBatcher:
+    """
+    Планировщик батчей распознавания.
+
+    Батч отправляется, когда истекло окно ожидания или набралось
+    max_batch запросов. Запросы с разными WhisperConfig в один батч не попадают.
+    """
+
+    def __init__(
+        self,
+        executor: Any,
+        window: float = 0.3,
+        max_batch: int = 8,
+        batch_size: int = 8,
+    ):
+        self.executor = executor  # STTExecutor
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.batch_size = batch_size
+
+        self._pending: list[_BatchItem] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def transcribe(self, audio: AudioSource, cfg: WhisperConfig) -> str:
+        """Ставит запись в очередь батча и ожидает её текст."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_BatchItem(audio=audio, cfg=cfg, future=future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Отправляет накопленные запросы в пул (группами по конфигурации)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Отменённые запросы (пользователь ушёл) не распознаём
+        items = [item for item in self._pending if not item.future.done()]
+        self._pending = []
+
+        groups: dict[WhisperConfig, list[_BatchItem]] = {}
+        for item in items:
+            groups.setdefault(item.cfg, []).append(item)
+
+        for cfg, group in groups.items():
+            task = asyncio.create_task(self._run_batch(cfg, group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, cfg: WhisperConfig, items: list[_BatchItem]) -> None:
+        """Выполняет батч в пуле и раздаёт результаты."""
+        logger.info(f"Батч STT: {len(items)} запросов")
+
+        try:
+            texts = await self.executor.submit(
+                transcribe_batch,
+                [item.audio for item in items],
+                cfg,
+                self.batch_size,
+            )
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        for item, text in zip(items, texts):
+            if not item.future.done():
+                item.future.set_result(text)
@@ -0,0 +1,429 @@
+"""
+Пул исполнителей для распознавания речи.
+
+Транскрипция Whisper — тяжёлая синхронная операция, поэтому она выполняется
+в отдельном пуле потоков или процессов, а event loop бота остаётся свободным.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from services.speech_to_text import (
+    AudioSource,
+    WhisperConfig,
+    plan_chunks,
+    preload_model,
+    stitch_transcripts,
+    transcribe_audio,
+)
+from services.stt_batcher import STTBatcher
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class STTQueueFullError(RuntimeError):
+    """Очередь распознавания переполнена — задача отклонена."""
+
+
+class STTTimeoutError(TimeoutError):
+    """Задача распознавания не уложилась в отведённое время."""
+
+
+class _StreamClosed(Exception):
+    """Потребитель потока сегментов ушёл — транскрипцию можно прервать."""
+
+
+@dataclass
+class STTMetrics:
+    """Счётчики пула распознавания."""
+    queued: int = 0            # Ждут свободного воркера
+    running: int = 0           # Выполняются прямо сейчас
+    completed: int = 0         # Успешно завершены
+    failed: int = 0            # Завершились с ошибкой
+    timed_out: int = 0         # Превысили таймаут
+    rejected: int = 0          # Отклонены из-за переполнения очереди
+    max_queue_depth: int = 0   # Максимальная глубина очереди
+
+
+class STTExecutor:
+    """
+    Пул исполнителей для задач распознавания речи.
+
+    Количество одновременно выполняемых задач ограничено числом воркеров,
+    остальные ждут в очереди ограниченного размера. Модель Whisper кэшируется
+    внутри воркера (в потоках — общая, в процессах — своя у каждого процесса).
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        workers: int = 1,
+        max_queue: int = 8,
+        job_timeout: float = 300.0,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Неизвестный режим пула STT: {mode}")
+
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.job_timeout = job_timeout
+
+        self._pool: Executor = self._create_pool()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pending = 0
+        self._metrics = STTMetrics()
+
+        logger.info(
+            f"Пул STT запущен: mode={self.mode}, workers={self.workers}, "
+            f"max_queue={self.max_queue}, timeout={self.job_timeout}с"
+        )
+
+    def _create_pool(self) -> Executor:
+        """Создаёт пул потоков или процессов."""
+        if self.mode == "process":
+            # spawn — безопасно для процессов, запущенных из работающего event loop
+            context = multiprocessing.get_context("spawn")
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(context.Barrier(self.workers),),
+            )
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stt")
+
+    @property
+    def metrics(self) -> STTMetrics:
+        """Снимок текущих метрик."""
+        return replace(self._metrics)
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество задач, ожидающих свободного воркера."""
+        return self._metrics.queued
+
+    async def submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Выполняет функцию в пуле и ожидает результат.
+
+        Raises:
+            STTQueueFullError: Очередь переполнена
+            STTTimeoutError: Задача не уложилась в таймаут
+        """
+        if self._pending >= self.workers + self.max_queue:
+            self._metrics.rejected += 1
+            logger.warning(f"Очередь STT переполнена ({self._pending} задач), задача отклонена")
+            raise STTQueueFullError("Очередь распознавания переполнена")
+
+        self._pending += 1
+        self._metrics.queued += 1
+        self._metrics.max_queue_depth = max(self._metrics.max_queue_depth, self._metrics.queued)
+        logger.info(f"Задача STT в очереди: глубина={self._metrics.queued}, выполняется={self._metrics.running}")
+
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            self._metrics.queued -= 1
+            self._pending -= 1
+            raise
+
+        self._metrics.queued -= 1
+        self._metrics.running += 1
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, func, *args)
+        future.add_done_callback(self._on_job_done)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            self._metrics.timed_out += 1
+            logger.error(f"Задача STT превысила таймаут {self.job_timeout}с")
+            raise STTTimeoutError(f"Распознавание дольше {self.job_timeout}с") from None
+        except Exception:
+            self._metrics.failed += 1
+            raise
+
+        self._metrics.completed += 1
+        return result
+
+    def _on_job_done(self, _future: asyncio.Future) -> None:
+        """
+        Освобождает слот воркера.
+
+        Слот освобождается только когда задача реально завершилась в пуле —
+        даже если ожидающий её уже получил таймаут, — иначе пул перегружается.
+        """
+        self._metrics.running -= 1
+        self._pending -= 1
+        self._slots.release()
+
+        # Ошибку получает ожидающий; если он ушёл (таймаут, отмена) — не шумим в логах
+        if not _future.cancelled():
+            _future.exception()
+
+    async def warm_up(self, cfg: Optional[WhisperConfig] = None) -> None:
+        """
+        Загружает и прогревает модель в воркерах пула.
+
+        Без cfg прогреваются все уровни моделей из config.
+
+        В режиме потоков модель общая — достаточно одного прогрева.
+        В режиме процессов каждому воркеру отправляется задача прогрева,
+        которая после загрузки модели ждёт на барьере остальных: один
+        процесс не может взять две задачи, поэтому прогреваются все
+        (заодно это запускает сами процессы). Задачи идут через submit
+        и учитываются в очереди и метриках.
+        """
+        started = time.perf_counter()
+
+        if self.mode == "thread":
+            await self.submit(preload_model, cfg)
+        else:
+            await asyncio.gather(*(
+                self.submit(_warm_worker, cfg, self.job_timeout)
+                for _ in range(self.workers)
+            ))
+
+        logger.info(f"Пул STT прогрет за {time.perf_counter() - started:.1f}с")
+
+    def shutdown(self) -> None:
+        """Останавливает пул, не дожидаясь незавершённых задач."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("Пул STT остановлен")
+
+
+# Барьер прогрева внутри процесса пула (задаётся инициализатором)
+_worker_barrier: Optional[Any] = None
+
+
+def _init_worker(barrier: Any) -> None:
+    """Инициализатор процесса пула: запоминает общий барьер прогрева."""
+    global _worker_barrier
+    _worker_barrier = barrier
+
+
+def _warm_worker(cfg: Optional[WhisperConfig], timeout: float) -> None:
+    """
+    Прогревает модель в процессе пула и ждёт, пока прогреются остальные.
+
+    Пока процесс стоит на барьере, он не берёт следующую задачу прогрева —
+    каждая достаётся другому процессу.
+    """
+    preload_model(cfg)
+    _worker_barrier.wait(timeout)
+
+
+# Экземпляры пула и планировщика батчей (создаются при первом обращении)
+_executor: Optional[STTExecutor] = None
+_batcher: Optional[STTBatcher] = None
+
+
+def get_stt_executor() -> STTExecutor:
+    """Получает общий пул распознавания (создаёт по настройкам из config)."""
+    global _executor
+
+    if _executor is None:
+        _executor = STTExecutor(
+            mode=config.STT_EXECUTOR,
+            workers=config.STT_WORKERS,
+            max_queue=config.STT_MAX_QUEUE,
+            job_timeout=config.STT_JOB_TIMEOUT,
+        )
+    return _executor
+
+
+def get_stt_batcher() -> STTBatcher:
+    """Получает общий планировщик батчей (поверх общего пула)."""
+    global _batcher
+
+    if _batcher is None:
+        _batcher = STTBatcher(
+            get_stt_executor(),
+            window=config.STT_BATCH_WINDOW_MS / 1000,
+            max_batch=config.STT_BATCH_MAX,
+            batch_size=config.STT_BATCH_SIZE,
+        )
+    return _batcher
+
+
+def shutdown_stt_executor() -> None:
+    """Останавливает общий пул распознавания."""
+    global _executor, _batcher
+
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+    _batcher = None
+
+
+async def warm_up_stt() -> None:
+    """Фоновый прогрев модели Whisper при старте бота."""
+    try:
+        await get_stt_executor().warm_up()
+    except Exception as e:
+        logger.error(f"Ошибка прогрева модели Whisper: {e}")
+
+
+def _portable_source(audio: AudioSource) -> AudioSource:
+    """
+    Приводит источник аудио к виду, который можно передать в другой процесс.
+
+    Файловые объекты вычитываются в байты, Path — в строку.
+    """
+    if isinstance(audio, Path):
+        return str(audio)
+    if hasattr(audio, "read"):
+        return audio.read()
+    return audio
+
+
+async def transcribe_audio_async(
+    audio: AudioSource,
+    cfg: Optional[WhisperConfig] = None
+) -> str:
+    """
+    Асинхронно транскрибирует аудио в пуле STT.
+
+    При включённом батчинге запрос объединяется с запросами
+    других пользователей в один проход модели.
+
+    Args:
+        audio: Путь к аудиофайлу, байты, файловый объект или PCM
+        cfg: Конфигурация Whisper (по умолчанию — уровень модели выбирается
+            по длительности речи; в батчах — модель по умолчанию)
+
+    Returns:
+        Распознанный текст
+    """
+    audio = _portable_source(audio)
+
+    if config.STT_BATCHING:
+        return await get_stt_batcher().transcribe(audio, cfg or WhisperConfig.from_config())
+    return await get_stt_executor().submit(transcribe_audio, audio, cfg)
+
+
+async def stream_transcribe_async(
+    audio: AudioSource,
+    cfg: Optional[WhisperConfig] = None
+) -> AsyncIterator[str]:
+    """
+    Асинхронно транскрибирует аудио, отдавая сегменты по мере распознавания.
+
+    Склеенные через пробел сегменты дают тот же текст, что transcribe_audio.
+    В режиме процессов и при батчинге промежуточных сегментов нет —
+    весь текст отдаётся одним элементом.
+
+    Args:
+        audio: Путь к аудиофайлу, байты, файловый объект или PCM
+        cfg: Конфигурация Whisper (по умолчанию — уровень модели выбирается
+            по длительности речи)
+
+    Yields:
+        Текст очередного сегмента
+    """
+    audio = _portable_source(audio)
+    executor = get_stt_executor()
+
+    if config.STT_BATCHING or executor.mode != "thread":
+        text = await transcribe_audio_async(audio, cfg)
+        if text:
+            yield text
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+    closed = False
+
+    def on_segment(text: str) -> None:
+        # Вызывается из потока пула
+        if closed:
+            raise _StreamClosed()
+        loop.call_soon_threadsafe(queue.put_nowait, text)
+
+    job = asyncio.create_task(executor.submit(transcribe_audio, audio, cfg, on_segment))
+    job.add_done_callback(lambda _: queue.put_nowait(None))
+
+    try:
+        while (segment := await queue.get()) is not None:
+            yield segment
+        await job
+    finally:
+        closed = True
+        if not job.done():
+            job.cancel()
+
+
+async def transcribe_long_async(
+    audio: AudioSource,
+    cfg: Optional[WhisperConfig] = None,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> str:
+    """
+    Транскрибирует длинную запись параллельными фрагментами.
+
+    Запись делится по паузам (VAD) на фрагменты около STT_CHUNK_SECONDS,
+    фрагменты распознаются одновременно в воркерах пула и склеиваются
+    по порядку с удалением повторов на стыках. Одна запись занимает
+    не больше воркеров, чем есть в пуле, — остальные фрагменты ждут
+    и не переполняют общую очередь. Реальный параллелизм даёт
+    STT_EXECUTOR=process (или потоки с WHISPER_NUM_WORKERS > 1).
+
+    Args:
+        audio: Путь к аудиофайлу, байты, файловый объект или PCM
+        cfg: Конфигурация Whisper (по умолчанию — уровень модели выбирается
+            по длительности речи всей записи)
+        on_progress: Вызывается с (готово, всего) после каждого фрагмента
+
+    Returns:
+        Распознанный текст
+    """
+    audio = _portable_source(audio)
+    executor = get_stt_executor()
+    started = time.perf_counter()
+
+    plan = await asyncio.to_thread(
+        plan_chunks,
+        audio,
+        cfg,
+        config.STT_CHUNK_SECONDS,
+        config.STT_CHUNK_OVERLAP,
+        config.STT_LONG_AUDIO_SECONDS,
+    )
+
+    slots = asyncio.Semaphore(executor.workers)
+    done = 0
+
+    async def run_chunk(start: int, end: int) -> str:
+        nonlocal done
+        async with slots:
+            text = await executor.submit(transcribe_audio, plan.samples[start:end], plan.cfg)
+        done += 1
+        if on_progress is not None:
+            await on_progress(done, len(plan.chunks))
+        return text
+
+    tasks = [asyncio.create_task(run_chunk(chunk.start, chunk.end)) for chunk in plan.chunks]
+    try:
+        texts = await asyncio.gather(*tasks)
+    except BaseException:
+        # Ошибка одного фрагмента (или отмена) — остальные не нужны
+        for task in tasks:
+            task.cancel()
+        raise
+
+    text = stitch_transcripts(plan.chunks, texts)
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Длинная запись распознана: {plan.duration:.1f}с аудио, {len(plan.chunks)} фрагментов "
+        f"за {elapsed:.1f}с (RTF {elapsed / max(plan.duration, 0.001):.2f})"
+    )
+    return text
@@ -0,0 +1,306 @@
+"""
+Локальное хранилище сделок (SQLite) с накопительными агрегатами.
+
+Каждая завершённая сделка записывается сюда одновременно с постановкой
+в очередь журнала. Счётчики по активу, сценарию, месяцу и результату
+обновляются в той же транзакции, поэтому /stats читает готовые числа и
+не зависит ни от размера истории, ни от Google.
+
+Таблица остаётся источником истины: периодическая сверка подтягивает
+правки, сделанные в ней вручную (например, заполненный результат), и
+пересчитывает агрегаты с нуля.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from utils.config import config
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Измерения агрегатов (total — общее число сделок)
+DIMENSIONS = ("asset", "scenario", "month", "result")
+
+
+@dataclass
+class TradeRecord:
+    """Сделка в локальном хранилище."""
+    trade_id: str
+    date: str               # DD.MM.YYYY или «не указана»
+    asset: str
+    scenario: str
+    result: str = ""        # Пусто, пока результат не записан
+
+    @property
+    def month(self) -> str:
+        """Месяц сделки YYYY-MM (пусто, если дата не разобрана)."""
+        try:
+            return datetime.strptime(self.date.strip(), "%d.%m.%Y").strftime("%Y-%m")
+        except ValueError:
+            return ""
+
+    def dimension_values(self) -> dict[str, str]:
+        """Значения по измерениям агрегатов."""
+        return {"asset": self.asset, "scenario": self.scenario, "month": self.month, "result": self.result}
+
+
+@dataclass
+class TradeStats:
+    """Статистика из агрегатов."""
+    total: int = 0
+    by_asset: list[tuple[str, int]] = field(default_factory=list)
+    by_scenario: list[tuple[str, int]] = field(default_factory=list)
+    by_month: list[tuple[str, int]] = field(default_factory=list)       # Последние месяцы, новые первыми
+    by_result: list[tuple[str, int]] = field(default_factory=list)
+
+
+@dataclass
+class ReconcileReport:
+    """Итог сверки с таблицей."""
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    rejected: bool = False      # Сверка удалила бы всё — не применена
+
+
+class TradeStore:
+    """
+    Сделки и агрегаты в SQLite.
+
+    Потокобезопасно: методы можно вызывать из asyncio.to_thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS trades ("
+            " trade_id TEXT PRIMARY KEY,"
+            " date TEXT NOT NULL,"
+            " asset TEXT NOT NULL,"
+            " scenario TEXT NOT NULL,"
+            " result TEXT NOT NULL DEFAULT '',"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS trade_aggregates ("
+            " dimension TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " PRIMARY KEY (dimension, value))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS trade_aggregates_top ON trade_aggregates (dimension, count DESC)"
+        )
+        self._db.commit()
+
+    # ---------- Запись ----------
+
+    def record(self, trade: TradeRecord) -> bool:
+        """
+        Добавляет сделку или обновляет изменившиеся поля.
+
+        Returns:
+            True, если сделка добавлена или изменена
+        """
+        with self._lock, self._db:
+            return self._upsert(trade, time.time()) is not None
+
+    def reconcile(
+        self,
+        trades: list[TradeRecord],
+        keep: set[str] = frozenset(),
+        since: Optional[float] = None,
+    ) -> ReconcileReport:
+        """
+        Приводит хранилище к списку сделок из таблицы и пересчитывает агрегаты.
+
+        Сверка, которая удалила бы все локальные сделки (пустой или чужой
+        лист, сбой чтения), не применяется.
+
+        Args:
+            trades: Все сделки из таблицы
+            keep: ID сделок, которых в таблице ещё нет (ждут отправки) — не удаляются
+            since: Начало сверки (time.time()); сделки, записанные позже, не удаляются
+        """
+        report = ReconcileReport()
+        now = time.time()
+        incoming = {trade.trade_id: trade for trade in trades}
+
+        with self._lock, self._db:
+            local = self._db.execute("SELECT trade_id, created FROM trades").fetchall()
+            stale = [
+                (trade_id,) for trade_id, created in local
+                if trade_id not in incoming and trade_id not in keep and (since is None or created < since)
+            ]
+            if local and len(stale) == len(local):
+                logger.warning(
+                    f"Сверка отклонена: в таблице нет ни одной из {len(local)} локальных сделок "
+                    f"(получено строк: {len(trades)})"
+                )
+                report.rejected = True
+                return report
+
+            for trade in incoming.values():
+                change = self._upsert(trade, now, aggregate=False)
+                if change == "added":
+                    report.added += 1
+                elif change == "updated":
+                    report.updated += 1
+
+            self._db.executemany("DELETE FROM trades WHERE trade_id = ?", stale)
+            report.removed = len(stale)
+
+            self._rebuild_aggregates()
+
+        return report
+
+    def _get(self, trade_id: str) -> Optional[TradeRecord]:
+        """Сделка по ID (вызывается под блокировкой)."""
+        row = self._db.execute(
+            "SELECT trade_id, date, asset, scenario, result FROM trades WHERE trade_id = ?", (trade_id,)
+        ).fetchone()
+        return TradeRecord(*row) if row else None
+
+    def _upsert(self, trade: TradeRecord, now: float, aggregate: bool = True) -> Optional[str]:
+        """
+        Добавляет или обновляет сделку (под блокировкой, внутри транзакции).
+
+        Returns:
+            "added", "updated" или None (ничего не изменилось)
+        """
+        old = self._get(trade.trade_id)
+        if old == trade:
+            return None
+
+        self._db.execute(
+            "INSERT INTO trades (trade_id, date, asset, scenario, result, created, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (trade_id) DO UPDATE SET "
+            " date = excluded.date, asset = excluded.asset, scenario = excluded.scenario,"
+            " result = excluded.result, updated = excluded.updated",
+            (trade.trade_id, trade.date, trade.asset, trade.scenario, trade.result, now, now),
+        )
+
+        if aggregate:
+            if old is not None:
+                self._apply(old, -1)
+            self._apply(trade, +1)
+        return "added" if old is None else "updated"
+
+    def _apply(self, trade: TradeRecord, delta: int) -> None:
+        """Сдвигает счётчики агрегатов на delta (пустые значения не считаются)."""
+        updates = [("total", "", delta)]
+        updates += [(dimension, value, delta) for dimension, value in trade.dimension_values().items() if value]
+
+        self._db.executemany(
+            "INSERT INTO trade_aggregates (dimension, value, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (dimension, value) DO UPDATE SET count = count + excluded.count",
+            updates,
+        )
+        self._db.execute("DELETE FROM trade_aggregates WHERE count <= 0")
+
+    def _rebuild_aggregates(self) -> None:
+        """Пересчитывает агрегаты по всем сделкам (после сверки)."""
+        self._db.execute("DELETE FROM trade_aggregates")
+        rows = self._db.execute("SELECT trade_id, date, asset, scenario, result FROM trades").fetchall()
+        for row in rows:
+            self._apply(TradeRecord(*row), +1)
+
+    # ---------- Чтение ----------
+
+    def stats(self, top: int = 5, months: int = 6) -> TradeStats:
+        """Статистика из агрегатов: общее число и top значений по измерениям."""
+        with self._lock:
+            total = self._db.execute(
+                "SELECT count FROM trade_aggregates WHERE dimension = 'total'"
+            ).fetchone()
+
+            def top_values(dimension: str, limit: int, order: str = "count DESC, value") -> list[tuple[str, int]]:
+                return self._db.execute(
+                    f"SELECT value, count FROM trade_aggregates WHERE dimension = ? ORDER BY {order} LIMIT ?",
+                    (dimension, limit),
+                ).fetchall()
+
+            return TradeStats(
+                total=total[0] if total else 0,
+                by_asset=top_values("asset", top),
+                by_scenario=top_values("scenario", top),
+                by_month=top_values("month", months, order="value DESC"),
+                by_result=top_values("result", top),
+            )
+
+    def close(self) -> None:
+        """Закрывает соединение с SQLite."""
+        with self._lock:
+            self._db.close()
+
+
+# Экземпляр хранилища (создаётся при первом обращении)
+_store: Optional[TradeStore] = None
+
+
+def get_trade_store() -> TradeStore:
+    """Получает общее хранилище сделок."""
+    global _store
+
+    if _store is None:
+        _store = TradeStore(config.TRADE_STORE_PATH)
+    return _store
+
+
+async def run_reconciliation(
+    interval: float,
+    load: Callable[[], Awaitable[list[TradeRecord]]],
+    pending: Callable[[], Awaitable[set[str]]],
+) -> None:
+    """
+    Фоновая сверка с таблицей: сразу после запуска, затем каждые interval секунд.
+
+    Очередь читается до таблицы: строка, отправленная между двумя
+    чтениями, окажется хотя бы в одном из них. Сделки, записанные после
+    начала сверки, не удаляются.
+
+    Args:
+        interval: Период сверки, секунды
+        load: Загружает все сделки из таблицы
+        pending: ID сделок, ещё не отправленных в таблицу
+    """
+    store = get_trade_store()
+
+    while True:
+        try:
+            started = time.time()
+            keep = await pending()
+            trades = await load()
+            report = await asyncio.to_thread(store.reconcile, trades, keep, started)
+            if not report.rejected:
+                logger.info(
+                    f"Сверка с таблицей: сделок {len(trades)}, добавлено {report.added}, "
+                    f"изменено {report.updated}, удалено {report.removed}"
+                )
+        except Exception as e:
+            logger.error(f"Ошибка сверки с таблицей: {e}")
+        await asyncio.sleep(interval)
+
+
+def close_trade_store() -> None:
+    """Закрывает общее хранилище сделок."""
+    global _store
+
+    if _store is not None:
+        _store.close()
+        _store = None
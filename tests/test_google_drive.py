@@ -0,0 +1,203 @@
+"""
+Тесты загрузчика на локальной заглушке протокола загрузки Drive:
+multipart, resumable с продолжением после сбоя, дедупликация.
+"""
+
+import asyncio
+import os
+import re
+
+import pytest
+from aiohttp import web
+
+from services import google_api
+from services.google_api import GoogleAPIError, StaticTokenProvider, close_google_session
+from services.google_drive import CHUNK_GRANULARITY, DriveUploader
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+)")
+
+
+class FakeDrive:
+    """files.create (multipart и resumable) в памяти."""
+
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.sessions: dict[str, bytearray] = {}
+        self.requests: list[str] = []   # uploadType / "chunk" / "status"
+        self.break_chunk = 0            # Оборвать эту часть: принять половину и ответить 503
+        self.expire_chunk = 0           # На эту часть ответить 404 (сессия истекла)
+        self.fail_status = 0            # Любой запрос — этим статусом
+        self._chunks = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        assert request.headers["Authorization"] == "Bearer test-token"
+        if self.fail_status:
+            return web.json_response({"error": "fail"}, status=self.fail_status)
+
+        if request.method == "POST":
+            upload_type = request.query["uploadType"]
+            self.requests.append(upload_type)
+            if upload_type == "multipart":
+                body = await request.read()
+                return self._created(body)
+
+            session_id = f"s{len(self.sessions) + 1}"
+            self.sessions[session_id] = bytearray()
+            location = f"{request.scheme}://{request.host}/upload/session/{session_id}"
+            return web.json_response({}, headers={"Location": location})
+
+        received = self.sessions[request.match_info["tail"].rsplit("/", 1)[1]]
+        start, end, total = _CONTENT_RANGE_RE.match(request.headers["Content-Range"]).groups()
+        chunk = await request.read()
+
+        if start is None:
+            self.requests.append("status")
+        else:
+            self.requests.append("chunk")
+            self._chunks += 1
+            assert int(start) == len(received), "часть должна начинаться с первого непринятого байта"
+            assert int(end) - int(start) + 1 == len(chunk)
+
+            if self._chunks == self.expire_chunk:
+                return web.json_response({"error": "expired"}, status=404)
+            if self._chunks == self.break_chunk:
+                received.extend(chunk[:len(chunk) // 2])
+                return web.json_response({"error": "backend"}, status=503)
+            received.extend(chunk)
+
+        if len(received) == int(total):
+            return self._created(bytes(received))
+        headers = {"Range": f"bytes=0-{len(received) - 1}"} if received else {}
+        return web.Response(status=308, headers=headers)
+
+    def _created(self, body: bytes) -> web.Response:
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = body
+        return web.json_response({"id": file_id, "webViewLink": f"https://drive.test/{file_id}"})
+
+
+@pytest.fixture(autouse=True)
+def static_token(monkeypatch):
+    monkeypatch.setattr(google_api, "_token_provider", StaticTokenProvider("test-token"))
+
+
+def run(scenario, fake: FakeDrive):
+    """Запускает сценарий с заглушкой Drive; сценарий получает base_url."""
+    async def main():
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_route("*", "/{tail:.*}", fake.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        try:
+            return await scenario(f"http://{host}:{port}")
+        finally:
+            await close_google_session()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def make_uploader(tmp_path, base_url: str, **kwargs) -> DriveUploader:
+    kwargs.setdefault("chunk_size", CHUNK_GRANULARITY)
+    kwargs.setdefault("resumable_threshold", CHUNK_GRANULARITY)
+    return DriveUploader(tmp_path / "drive.sqlite3", "folder", base_url, backoff_base=0.01, **kwargs)
+
+
+def test_small_file_uses_multipart(tmp_path):
+    fake = FakeDrive()
+    data = b"\xff\xd8\xff" + os.urandom(1000)
+
+    async def scenario(base_url):
+        uploader = make_uploader(tmp_path, base_url)
+        file = await uploader.upload(data, "collage.jpg")
+        uploader.close()
+        return file
+
+    file = run(scenario, fake)
+
+    assert fake.requests == ["multipart"]
+    assert data in fake.files[file.file_id]
+    assert file.link == f"https://drive.test/{file.file_id}"
+
+
+def test_resumable_upload_resumes_from_server_range(tmp_path):
+    fake = FakeDrive()
+    fake.break_chunk = 2
+    data = os.urandom(3 * CHUNK_GRANULARITY + 1000)
+
+    async def scenario(base_url):
+        uploader = make_uploader(tmp_path, base_url)
+        file = await uploader.upload(data, "collage.jpg")
+        stats = uploader.stats
+        uploader.close()
+        return file, stats
+
+    file, stats = run(scenario, fake)
+
+    assert fake.files[file.file_id] == data
+    # Вторая часть дошла наполовину: продолжение с 1.5 части, а не с начала или с границы части
+    assert fake.requests == ["resumable", "chunk", "chunk", "status", "chunk", "chunk"]
+    assert stats.resumes == 1
+    assert stats.retries == 1
+    assert stats.bytes == len(data)
+
+
+def test_expired_session_starts_over(tmp_path):
+    fake = FakeDrive()
+    fake.expire_chunk = 2
+    data = os.urandom(2 * CHUNK_GRANULARITY + 1000)
+
+    async def scenario(base_url):
+        uploader = make_uploader(tmp_path, base_url)
+        file = await uploader.upload(data, "collage.jpg")
+        uploader.close()
+        return file
+
+    file = run(scenario, fake)
+
+    assert fake.files[file.file_id] == data
+    assert fake.requests.count("resumable") == 2
+
+
+def test_same_content_is_uploaded_once(tmp_path):
+    fake = FakeDrive()
+    data = os.urandom(2000)
+
+    async def scenario(base_url):
+        uploader = make_uploader(tmp_path, base_url)
+        first, second = await asyncio.gather(uploader.upload(data, "a.jpg"), uploader.upload(data, "b.jpg"))
+        uploader.close()
+
+        # Индекс переживает перезапуск
+        uploader = make_uploader(tmp_path, base_url)
+        third = await uploader.upload(data, "c.jpg")
+        uploader.close()
+        return first, second, third
+
+    first, second, third = run(scenario, fake)
+
+    assert len(fake.files) == 1
+    assert first.file_id == second.file_id == third.file_id
+    assert third.deduplicated
+
+
+def test_rejected_upload_is_not_retried(tmp_path):
+    fake = FakeDrive()
+    fake.fail_status = 403
+
+    async def scenario(base_url):
+        uploader = make_uploader(tmp_path, base_url)
+        with pytest.raises(GoogleAPIError) as error:
+            await uploader.upload(os.urandom(100), "a.jpg")
+        stats = uploader.stats
+        uploader.close()
+        return error.value, stats
+
+    error, stats = run(scenario, fake)
+
+    assert error.status == 403
+    assert stats.retries == 0
+    assert stats.failures == 1
@@ -0,0 +1,211 @@
+"""
+Тесты журнала на локальном фейковом Sheets API: пачки, запись ровно
+один раз после потерянного ответа и перезапуска, отложенные строки.
+"""
+
+import asyncio
+import re
+
+import pytest
+from aiohttp import web
+
+from services import google_api
+from services.google_api import GoogleAPIError, StaticTokenProvider, close_google_session
+from services.google_sheets import JOURNAL_COLUMNS, JournalEntry, SheetsJournal
+
+SHEET = "Журнал"
+
+
+class FakeSheets:
+    """values.append и values.get одного листа в памяти."""
+
+    def __init__(self):
+        self.rows: list[list[str]] = [list(JOURNAL_COLUMNS)]
+        self.appends = 0            # Запросов values.append, дошедших до таблицы
+        self.reads: list[str] = []  # Диапазоны запросов values.get
+        self.lose_responses = 0     # Столько ответов на append потерять (строки записаны)
+        self.fail_status = 0        # Ответить этим статусом, ничего не записывая
+        self.reject = "BAD"         # Строки с этим примечанием таблица отвергает (400)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        assert request.headers["Authorization"] == "Bearer test-token"
+        a1_range = request.path.split("/values/", 1)[1]
+
+        if request.method == "POST" and a1_range.endswith(":append"):
+            if self.fail_status:
+                return web.json_response({"error": "unavailable"}, status=self.fail_status)
+            values = (await request.json())["values"]
+            if any(row[6] == self.reject for row in values):
+                return web.json_response({"error": {"message": "Invalid value"}}, status=400)
+
+            first = len(self.rows) + 1
+            self.rows.extend(values)
+            self.appends += 1
+            if self.lose_responses:
+                self.lose_responses -= 1
+                return web.json_response({"error": "backend error"}, status=500)
+            updated = f"'{SHEET}'!A{first}:I{len(self.rows)}"
+            return web.json_response({"updates": {"updatedRange": updated}})
+
+        self.reads.append(a1_range.split("!", 1)[1])
+        first_row = int(re.match(r"I(\d+):I", a1_range.split("!", 1)[1]).group(1))
+        return web.json_response({"values": [[row[8] for row in self.rows[first_row - 1:]]]})
+
+    def trade_ids(self) -> list[str]:
+        return [row[8] for row in self.rows[1:]]
+
+
+@pytest.fixture(autouse=True)
+def static_token(monkeypatch):
+    monkeypatch.setattr(google_api, "_token_provider", StaticTokenProvider("test-token"))
+
+
+def run(scenario, fake: FakeSheets):
+    """Запускает сценарий с фейковым сервером; сценарий получает base_url."""
+    async def main():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", fake.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        try:
+            return await scenario(f"http://{host}:{port}")
+        finally:
+            await close_google_session()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def make_journal(tmp_path, base_url: str, **kwargs) -> SheetsJournal:
+    return SheetsJournal(tmp_path / "journal.sqlite3", "sheet-id", SHEET, base_url, **kwargs)
+
+
+def entry(trade_id: str, note: str = "") -> JournalEntry:
+    return JournalEntry(trade_id, "20.12.2024", "BTC/USDT", "ЛП", note)
+
+
+def test_pending_rows_go_in_one_append(tmp_path):
+    fake = FakeSheets()
+
+    async def scenario(base_url):
+        journal = make_journal(tmp_path, base_url)
+        assert await journal.enqueue(entry("t1"))
+        assert await journal.enqueue(entry("t2"))
+        assert not await journal.enqueue(entry("t1"))
+
+        assert await journal.flush() == 2
+        assert await journal.flush() == 0
+        assert journal.pending_count() == 0
+        journal.close()
+
+    run(scenario, fake)
+
+    assert fake.appends == 1
+    assert fake.trade_ids() == ["t1", "t2"]
+
+
+def test_lost_response_is_not_written_twice_after_restart(tmp_path):
+    fake = FakeSheets()
+    fake.lose_responses = 1
+
+    async def scenario(base_url):
+        journal = make_journal(tmp_path, base_url)
+        await journal.enqueue(entry("t1"))
+        await journal.enqueue(entry("t2"))
+        with pytest.raises(GoogleAPIError):
+            await journal.flush()
+        journal.close()
+
+        # Перезапуск: исход попытки неизвестен, ID сверяются с таблицей
+        journal = make_journal(tmp_path, base_url)
+        assert journal.pending_count() == 2
+        assert await journal.flush() == 2
+        assert journal.pending_count() == 0
+        assert journal.stats.duplicates == 2
+        journal.close()
+
+    run(scenario, fake)
+
+    assert fake.appends == 1
+    assert fake.trade_ids() == ["t1", "t2"]
+
+
+def test_id_check_reads_only_the_column_tail(tmp_path):
+    fake = FakeSheets()
+    fake.rows += [[""] * 8 + [f"old-{i}"] for i in range(50)]
+
+    async def scenario(base_url):
+        journal = make_journal(tmp_path, base_url, batch_size=2, id_check_rows=5)
+        await journal.enqueue(entry("t1"))
+        await journal.flush()
+        assert journal._last_row() == 52
+
+        fake.lose_responses = 1
+        await journal.enqueue(entry("t2"))
+        with pytest.raises(GoogleAPIError):
+            await journal.flush()
+        assert await journal.flush() == 1
+        journal.close()
+
+    run(scenario, fake)
+
+    assert fake.reads == ["I48:I"]
+    assert fake.trade_ids()[-2:] == ["t1", "t2"]
+
+
+def test_rejected_row_is_dead_lettered(tmp_path):
+    fake = FakeSheets()
+
+    async def scenario(base_url):
+        journal = make_journal(tmp_path, base_url)
+        for trade_id in ("t1", "t2", "bad", "t3"):
+            await journal.enqueue(entry(trade_id, "BAD" if trade_id == "bad" else ""))
+
+        assert await journal.flush() == 4
+        assert journal.pending_count() == 0
+        assert journal.dead_count() == 1
+        assert journal.pending_ids() == {"bad"}
+        assert journal.stats.dead == 1
+        journal.close()
+
+    run(scenario, fake)
+
+    assert fake.trade_ids() == ["t1", "t2", "t3"]
+
+
+def test_server_error_keeps_the_batch_queued(tmp_path):
+    fake = FakeSheets()
+    fake.fail_status = 503
+
+    async def scenario(base_url):
+        journal = make_journal(tmp_path, base_url)
+        await journal.enqueue(entry("t1"))
+        await journal.enqueue(entry("t2"))
+
+        with pytest.raises(GoogleAPIError) as error:
+            await journal.flush()
+        assert error.value.retryable
+        assert journal.pending_count() == 2
+        assert journal.dead_count() == 0
+        journal.close()
+
+    run(scenario, fake)
+
+    assert fake.appends == 0
+
+
+def test_formula_like_note_is_sent_as_text(tmp_path):
+    fake = FakeSheets()
+
+    async def scenario(base_url):
+        journal = make_journal(tmp_path, base_url)
+        await journal.enqueue(entry("t1", "=SUM(A1)"))
+        await journal.flush()
+        journal.close()
+
+    run(scenario, fake)
+
+    assert fake.rows[1][6] == "'=SUM(A1)"
@@ -0,0 +1,38 @@
+"""
+Тесты ключа кэша LLM: ответы на относительные даты не должны
+переживать смену дня.
+"""
+
+from datetime import date
+
+import pytest
+
+from services.llm_cache import cache_key
+
+MONDAY = date(2024, 12, 16)
+TUESDAY = date(2024, 12, 17)
+
+
+def key(text: str, today: date) -> str:
+    return cache_key(text, "model", "prompt", today)
+
+
+@pytest.mark.parametrize("text", [
+    "BTC ЛП вчера",
+    "BTC ЛП в пятницу",
+    "ETH пробой на прошлой неделе",
+    "SOL ретест в понедельник",
+    "TON ЛП 3 дня назад",
+    "BTC ЛП пт",
+])
+def test_relative_date_key_changes_with_day(text):
+    assert key(text, MONDAY) != key(text, TUESDAY)
+
+
+@pytest.mark.parametrize("text", ["BTC ЛП 5 декабря", "ETH пробой 05.12.2024", "SOL ретест, стоп за хаем"])
+def test_literal_date_key_is_stable(text):
+    assert key(text, MONDAY) == key(text, TUESDAY)
+
+
+def test_key_ignores_case_and_spacing():
+    assert key("BTC  ЛП вчера.", MONDAY) == key("btc лп вчера", MONDAY)
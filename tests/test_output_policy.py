@@ -0,0 +1,30 @@
+"""
+Тесты политики вывода: коллаж должен укладываться в ограничения
+Telegram для фото, документом — только то, что фото быть не может.
+"""
+
+from PIL import Image
+
+from services.output_policy import TELEGRAM_PHOTO_MAX_SIDES, OutputPolicy, encode_image
+
+
+def test_tall_collage_is_downscaled_to_photo():
+    result = encode_image(Image.new("RGB", (1280, 9500), (120, 30, 200)), OutputPolicy())
+
+    assert not result.as_document
+    assert result.width + result.height <= TELEGRAM_PHOTO_MAX_SIDES
+
+
+def test_extreme_ratio_goes_as_document():
+    result = encode_image(Image.new("RGB", (300, 9000), (120, 30, 200)), OutputPolicy())
+
+    assert result.as_document
+    assert (result.width, result.height) == (300, 9000)
+
+
+def test_over_budget_photo_falls_back_to_document():
+    image = Image.effect_noise((1200, 900), 100).convert("RGB")
+    result = encode_image(image, OutputPolicy(max_bytes=3_000))
+
+    assert result.as_document
+    assert len(result.data) > 3_000
@@ -0,0 +1,86 @@
+"""
+Тесты локального извлечения: ложные срабатывания правил должны
+уходить в LLM (уверенность ниже порога), а не сохраняться как есть.
+"""
+
+from datetime import date
+
+import pytest
+
+from services.rule_extractor import extract_asset, extract_date, extract_rules, split_trade_segments
+
+TODAY = date(2024, 12, 20)
+THRESHOLD = 0.85    # RULE_EXTRACTOR_MIN_CONFIDENCE по умолчанию
+
+
+@pytest.mark.parametrize("text", [
+    "ЛП вчера, цена тронула уровень",
+    "Пробой сегодня, тронулись от поддержки",
+])
+def test_tron_alias_does_not_match_verbs(text):
+    assert extract_asset(text) == (None, 0.0)
+
+
+@pytest.mark.parametrize("text", ["трон ЛП сегодня", "по трону ЛП сегодня", "TRX ЛП сегодня"])
+def test_tron_alias_exact_forms(text):
+    assert extract_asset(text) == ("TRX/USDT", 1.0)
+
+
+def test_bare_numeric_date_is_not_a_price():
+    result = extract_rules("TON ЛП вход 5.12", TODAY)
+
+    assert result.date == "не указана"
+    assert result.confidence < THRESHOLD
+
+
+@pytest.mark.parametrize("text", ["BTC ЛП от 5.12", "BTC ЛП дата: 05.12", "BTC ЛП пятница 05.12", "BTC ЛП 05.12.2024"])
+def test_numeric_date_with_keyword_or_year(text):
+    assert extract_date(text, TODAY) == (date(2024, 12, 5), 1.0)
+
+
+@pytest.mark.parametrize("text, ticker", [
+    ("op ЛП сегодня", "OP/USDT"),
+    ("near уровня ЛП сегодня", "NEAR/USDT"),
+    ("link ЛП сегодня", "LINK/USDT"),
+    ("dot ЛП сегодня", "DOT/USDT"),
+    ("etc ЛП сегодня", "ETC/USDT"),
+    ("uni ЛП сегодня", "UNI/USDT"),
+    ("atom ЛП сегодня", "ATOM/USDT"),
+])
+def test_ambiguous_latin_alias_goes_to_llm(text, ticker):
+    result = extract_rules(text, TODAY)
+
+    assert result.asset == ticker
+    assert result.confidence < THRESHOLD
+
+
+@pytest.mark.parametrize("text", ["OP ЛП сегодня", "$op ЛП сегодня", "op/usdt ЛП сегодня"])
+def test_ambiguous_latin_alias_explicit_forms(text):
+    result = extract_rules(text, TODAY)
+
+    assert result.asset == "OP/USDT"
+    assert result.confidence == 1.0
+
+
+def test_ambiguous_word_next_to_real_ticker():
+    assert extract_asset("BTC ЛП сегодня, near уровня") == ("BTC/USDT", 1.0)
+
+
+def test_split_same_ticker_repeated_stays_one_trade():
+    segments = split_trade_segments("BTC ЛП вчера. Стоп за хаем BTC. ETH пробой сегодня.")
+
+    assert segments == ["BTC ЛП вчера. Стоп за хаем BTC.", "ETH пробой сегодня."]
+
+
+def test_split_on_explicit_markers_and_new_tickers():
+    text = "1. BTC ЛП вчера\n2. BTC ретест сегодня\nSOL пробой 3 октября"
+
+    assert split_trade_segments(text) == ["BTC ЛП вчера", "BTC ретест сегодня", "SOL пробой 3 октября"]
+
+
+@pytest.mark.parametrize("text", ["BTC ЛП 31.02.2024", "BTC ЛП от 31.02", "BTC ЛП 31 февраля", "BTC ЛП 30.13.2024"])
+def test_invalid_explicit_date_goes_to_llm(text):
+    result = extract_rules(text, TODAY)
+
+    assert result.date == "не указана"
+    assert result.confidence < THRESHOLD
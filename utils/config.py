@@ -4,11 +4,16 @@
 """
 
 import os
+from pathlib import Path
+
 from dotenv import load_dotenv
 
 # Загружаем переменные из .env
 load_dotenv()
 
+# Корень проекта (для путей к данным по умолчанию)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
 
 def parse_user_ids(value: str) -> set[int]:
     """Парсит список ID пользователей из строки."""
@@ -23,6 +28,40 @@ def parse_user_ids(value: str) -> set[int]:
     return ids
 
 
+def parse_int(value: str | None, default: int) -> int:
+    """Парсит целое число из строки (с значением по умолчанию)."""
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value.strip())
+    except ValueError:
+        return default
+
+
+def parse_float(value: str | None, default: float) -> float:
+    """Парсит дробное число из строки (с значением по умолчанию)."""
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value.strip())
+    except ValueError:
+        return default
+
+
+def parse_bool(value: str | None, default: bool) -> bool:
+    """Парсит логическое значение из строки (1/true/yes/on)."""
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def parse_list(value: str | None) -> list[str]:
+    """Парсит список строк, разделённых запятой."""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
 class Config:
     """Основная конфигурация бота."""
     
@@ -35,6 +74,36 @@ class Config:
     # OpenRouter
     OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY", "")
     LLM_MODEL: str = os.getenv("LLM_MODEL", "google/gemini-2.5-flash")
+    OPENROUTER_BASE_URL: str = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    LLM_TIMEOUT: float = parse_float(os.getenv("LLM_TIMEOUT"), 30.0)
+    LLM_MAX_CONNECTIONS: int = parse_int(os.getenv("LLM_MAX_CONNECTIONS"), 10)
+    LLM_KEEPALIVE_TIMEOUT: float = parse_float(os.getenv("LLM_KEEPALIVE_TIMEOUT"), 60.0)
+    LLM_STREAMING: bool = parse_bool(os.getenv("LLM_STREAMING"), True)
+    LLM_STRUCTURED_OUTPUT: bool = parse_bool(os.getenv("LLM_STRUCTURED_OUTPUT"), True)
+    
+    # Сжатие описания перед запросом: паразиты, повторы, лимит токенов (оценка)
+    LLM_PROMPT_COMPACTION: bool = parse_bool(os.getenv("LLM_PROMPT_COMPACTION"), True)
+    LLM_MAX_INPUT_TOKENS: int = parse_int(os.getenv("LLM_MAX_INPUT_TOKENS"), 400)
+    
+    # Политика запросов к LLM: резервные модели, повторы, хеджирование, предохранитель
+    LLM_FALLBACK_MODELS: list[str] = parse_list(os.getenv("LLM_FALLBACK_MODELS"))
+    LLM_MAX_RETRIES: int = parse_int(os.getenv("LLM_MAX_RETRIES"), 2)
+    LLM_BACKOFF_BASE: float = parse_float(os.getenv("LLM_BACKOFF_BASE"), 0.5)
+    LLM_BACKOFF_MAX: float = parse_float(os.getenv("LLM_BACKOFF_MAX"), 8.0)
+    LLM_ATTEMPT_TIMEOUT: float = parse_float(os.getenv("LLM_ATTEMPT_TIMEOUT"), 15.0)
+    LLM_DEADLINE: float = parse_float(os.getenv("LLM_DEADLINE"), 45.0)
+    LLM_HEDGE_ENABLED: bool = parse_bool(os.getenv("LLM_HEDGE_ENABLED"), True)
+    LLM_HEDGE_MIN_DELAY: float = parse_float(os.getenv("LLM_HEDGE_MIN_DELAY"), 1.0)
+    LLM_HEDGE_DEFAULT_DELAY: float = parse_float(os.getenv("LLM_HEDGE_DEFAULT_DELAY"), 4.0)
+    LLM_BREAKER_THRESHOLD: int = parse_int(os.getenv("LLM_BREAKER_THRESHOLD"), 5)
+    LLM_BREAKER_RESET: float = parse_float(os.getenv("LLM_BREAKER_RESET"), 60.0)
+    
+    # Локальное извлечение по правилам: при уверенности не ниже порога LLM не вызывается
+    RULE_EXTRACTOR_ENABLED: bool = parse_bool(os.getenv("RULE_EXTRACTOR_ENABLED"), True)
+    RULE_EXTRACTOR_MIN_CONFIDENCE: float = parse_float(os.getenv("RULE_EXTRACTOR_MIN_CONFIDENCE"), 0.85)
+    
+    # Пакетный ввод (/bulk): максимум сделок в одном сообщении
+    BULK_MAX_TRADES: int = parse_int(os.getenv("BULK_MAX_TRADES"), 20)
     
     # Google
     GOOGLE_SHEET_ID: str = os.getenv("GOOGLE_SHEET_ID", "")
@@ -42,6 +111,108 @@ class Config:
         "GOOGLE_SERVICE_ACCOUNT_FILE", 
         "service-account.json"
     )
+    GOOGLE_SHEET_NAME: str = os.getenv("GOOGLE_SHEET_NAME", "Журнал")
+    # Готовый токен вместо сервисного аккаунта (локальный фейковый сервер, gcloud)
+    GOOGLE_ACCESS_TOKEN: str = os.getenv("GOOGLE_ACCESS_TOKEN", "")
+    GOOGLE_SHEETS_BASE_URL: str = os.getenv("GOOGLE_SHEETS_BASE_URL", "https://sheets.googleapis.com")
+    GOOGLE_DRIVE_FOLDER_ID: str = os.getenv("GOOGLE_DRIVE_FOLDER_ID", "")
+    GOOGLE_DRIVE_BASE_URL: str = os.getenv("GOOGLE_DRIVE_BASE_URL", "https://www.googleapis.com")
+    GOOGLE_API_TIMEOUT: float = parse_float(os.getenv("GOOGLE_API_TIMEOUT"), 30.0)
+    GOOGLE_MAX_CONNECTIONS: int = parse_int(os.getenv("GOOGLE_MAX_CONNECTIONS"), 8)
+    
+    # Журнал в таблице: пачки values.append из очереди SQLite
+    SHEETS_BATCH_SIZE: int = parse_int(os.getenv("SHEETS_BATCH_SIZE"), 100)
+    SHEETS_FLUSH_DELAY: float = parse_float(os.getenv("SHEETS_FLUSH_DELAY"), 2.0)
+    SHEETS_POLL_INTERVAL: float = parse_float(os.getenv("SHEETS_POLL_INTERVAL"), 30.0)
+    SHEETS_BACKOFF_BASE: float = parse_float(os.getenv("SHEETS_BACKOFF_BASE"), 2.0)
+    SHEETS_BACKOFF_MAX: float = parse_float(os.getenv("SHEETS_BACKOFF_MAX"), 300.0)
+    # Сколько последних строк колонки ID читать при проверке дублей после сбоя
+    SHEETS_ID_CHECK_ROWS: int = parse_int(os.getenv("SHEETS_ID_CHECK_ROWS"), 1000)
+    
+    # Загрузка коллажей в Drive: пул, части resumable-загрузки, порог (КБ)
+    DRIVE_UPLOAD_WORKERS: int = parse_int(os.getenv("DRIVE_UPLOAD_WORKERS"), 3)
+    DRIVE_CHUNK_KB: int = parse_int(os.getenv("DRIVE_CHUNK_KB"), 1024)
+    DRIVE_RESUMABLE_THRESHOLD_KB: int = parse_int(os.getenv("DRIVE_RESUMABLE_THRESHOLD_KB"), 5120)
+    DRIVE_MAX_RETRIES: int = parse_int(os.getenv("DRIVE_MAX_RETRIES"), 5)
+    
+    # Локальные данные (blob-ы, базы SQLite)
+    DATA_DIR: Path = Path(os.getenv("DATA_DIR", str(PROJECT_ROOT / "data")))
+    
+    # Хранилище скриншотов
+    BLOB_STORE_DIR: Path = DATA_DIR / "blobs"
+    BLOB_CACHE_MB: int = parse_int(os.getenv("BLOB_CACHE_MB"), 64)
+    BLOB_TTL_HOURS: float = parse_float(os.getenv("BLOB_TTL_HOURS"), 24.0)
+    BLOB_GC_INTERVAL: float = parse_float(os.getenv("BLOB_GC_INTERVAL"), 1800.0)
+    
+    # Кэш ответов LLM (память + SQLite)
+    LLM_CACHE_ENABLED: bool = parse_bool(os.getenv("LLM_CACHE_ENABLED"), True)
+    LLM_CACHE_PATH: Path = DATA_DIR / "llm_cache.sqlite3"
+    LLM_CACHE_MEMORY_ITEMS: int = parse_int(os.getenv("LLM_CACHE_MEMORY_ITEMS"), 1024)
+    LLM_CACHE_MAX_ENTRIES: int = parse_int(os.getenv("LLM_CACHE_MAX_ENTRIES"), 50000)
+    LLM_CACHE_TTL_HOURS: float = parse_float(os.getenv("LLM_CACHE_TTL_HOURS"), 720.0)
+    
+    # Очередь записи в Google-таблицу
+    JOURNAL_OUTBOX_PATH: Path = DATA_DIR / "journal.sqlite3"
+    
+    # Индекс загруженных в Drive файлов (SHA-256 → ID файла)
+    DRIVE_INDEX_PATH: Path = DATA_DIR / "drive.sqlite3"
+    
+    # Локальное хранилище сделок для /stats и период сверки с таблицей (0 — без сверки)
+    TRADE_STORE_PATH: Path = DATA_DIR / "trades.sqlite3"
+    TRADE_RECONCILE_HOURS: float = parse_float(os.getenv("TRADE_RECONCILE_HOURS"), 24.0)
+    STATS_TOP: int = parse_int(os.getenv("STATS_TOP"), 5)
+    
+    # Загрузка файлов из Telegram
+    DOWNLOAD_RETRIES: int = parse_int(os.getenv("DOWNLOAD_RETRIES"), 2)
+    DOWNLOAD_RETRY_DELAY: float = parse_float(os.getenv("DOWNLOAD_RETRY_DELAY"), 0.5)
+    PREFETCH_CONCURRENCY: int = parse_int(os.getenv("PREFETCH_CONCURRENCY"), 8)
+    # Брошенные черновики: срок хранения предзагрузок (с) и максимум файлов на пользователя
+    PREFETCH_TTL: float = parse_float(os.getenv("PREFETCH_TTL"), 1800.0)
+    PREFETCH_MAX_FILES: int = parse_int(os.getenv("PREFETCH_MAX_FILES"), 20)
+    
+    # Рендеринг коллажей (0 — по числу ядер)
+    RENDER_WORKERS: int = parse_int(os.getenv("RENDER_WORKERS"), 0)
+    FONT_DIRS: list[str] = parse_list(os.getenv("FONT_DIRS", ""))
+    HEADER_CACHE_SIZE: int = parse_int(os.getenv("HEADER_CACHE_SIZE"), 64)
+    
+    # Вывод коллажей (ширина 0 — без уменьшения, формат jpeg | webp)
+    COLLAGE_TARGET_WIDTH: int = parse_int(os.getenv("COLLAGE_TARGET_WIDTH"), 1280)
+    COLLAGE_MAX_KB: int = parse_int(os.getenv("COLLAGE_MAX_KB"), 5120)
+    COLLAGE_FORMAT: str = os.getenv("COLLAGE_FORMAT", "jpeg")
+    COLLAGE_LOSSLESS: bool = parse_bool(os.getenv("COLLAGE_LOSSLESS"), False)
+    COLLAGE_STREAMING: bool = parse_bool(os.getenv("COLLAGE_STREAMING"), True)
+    
+    # Распознавание речи — модель Whisper (compute_type пусто — авто)
+    WHISPER_MODEL_SIZE: str = os.getenv("WHISPER_MODEL_SIZE", "medium")
+    WHISPER_COMPUTE_TYPE: str = os.getenv("WHISPER_COMPUTE_TYPE", "")
+    WHISPER_CPU_THREADS: int = parse_int(os.getenv("WHISPER_CPU_THREADS"), 0)
+    WHISPER_NUM_WORKERS: int = parse_int(os.getenv("WHISPER_NUM_WORKERS"), 1)
+    WHISPER_BEAM_SIZE: int = parse_int(os.getenv("WHISPER_BEAM_SIZE"), 5)
+    WHISPER_USE_GPU: bool = parse_bool(os.getenv("WHISPER_USE_GPU"), False)
+    WHISPER_PRELOAD: bool = parse_bool(os.getenv("WHISPER_PRELOAD"), True)
+    
+    # Уровни моделей по длительности речи: "модель:beam[:макс_секунд],..."
+    # (пусто — одна модель WHISPER_MODEL_SIZE) и лимит памяти резидентных моделей
+    WHISPER_TIERS: str = os.getenv("WHISPER_TIERS", "")
+    WHISPER_MODELS_MEMORY_MB: int = parse_int(os.getenv("WHISPER_MODELS_MEMORY_MB"), 3072)
+    
+    # Распознавание речи — пул исполнителей
+    STT_EXECUTOR: str = os.getenv("STT_EXECUTOR", "thread")  # thread | process
+    STT_WORKERS: int = parse_int(os.getenv("STT_WORKERS"), 1)
+    STT_MAX_QUEUE: int = parse_int(os.getenv("STT_MAX_QUEUE"), 8)
+    STT_JOB_TIMEOUT: float = parse_float(os.getenv("STT_JOB_TIMEOUT"), 300.0)
+    STT_PARTIAL_EDIT_INTERVAL: float = parse_float(os.getenv("STT_PARTIAL_EDIT_INTERVAL"), 1.5)
+    
+    # Распознавание речи — батчинг запросов разных пользователей
+    STT_BATCHING: bool = parse_bool(os.getenv("STT_BATCHING"), False)
+    STT_BATCH_WINDOW_MS: int = parse_int(os.getenv("STT_BATCH_WINDOW_MS"), 300)
+    STT_BATCH_MAX: int = parse_int(os.getenv("STT_BATCH_MAX"), 8)
+    STT_BATCH_SIZE: int = parse_int(os.getenv("STT_BATCH_SIZE"), 8)
+    
+    # Распознавание речи — длинные записи делятся на фрагменты по паузам
+    STT_LONG_AUDIO_SECONDS: float = parse_float(os.getenv("STT_LONG_AUDIO_SECONDS"), 90.0)
+    STT_CHUNK_SECONDS: float = parse_float(os.getenv("STT_CHUNK_SECONDS"), 60.0)
+    STT_CHUNK_OVERLAP: float = parse_float(os.getenv("STT_CHUNK_OVERLAP"), 1.0)
     
     @classmethod
     def validate(cls) -> bool:
@@ -50,6 +221,8 @@ class Config:
             raise ValueError("BOT_TOKEN не задан! Проверьте .env файл.")
         if not cls.ALLOWED_USER_IDS:
             raise ValueError("ALLOWED_USER_IDS не задан! Укажите хотя бы свой Telegram ID.")
+        if cls.STT_CHUNK_SECONDS <= 0:
+            raise ValueError(f"STT_CHUNK_SECONDS должен быть больше 0 (сейчас {cls.STT_CHUNK_SECONDS}).")
         return True
 
 
@@ -0,0 +1,56 @@
+# utils/metrics.py
+"""
+Простые метрики в памяти: скользящее окно задержек с перцентилями.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Optional
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Перцентиль q (0..1) методом ближайшего ранга. None для пустого списка."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyWindow:
+    """
+    Последние N замеров задержки (секунды).
+
+    Потокобезопасно: запись возможна из пулов потоков.
+    """
+
+    def __init__(self, size: int = 200):
+        self._values: deque[float] = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        """Добавляет замер."""
+        with self._lock:
+            self._values.append(value)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._values)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Перцентиль q (0..1) по окну."""
+        with self._lock:
+            values = list(self._values)
+        return percentile(values, q)
+
+    def summary(self) -> dict[str, Optional[float]]:
+        """Количество, p50, p95 и максимум по окну."""
+        with self._lock:
+            values = list(self._values)
+        return {
+            "count": len(values),
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "max": max(values) if values else None,
+        }